@@ -0,0 +1,53 @@
+"""
+Тикеры, параметры стратегий и пути к данным, общие для main_multi.py и main_sharded.py
+"""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Каталог статистики, журналов, записей стрима и базы; по умолчанию каталог проекта
+DATA_DIR = os.environ.get('ROBOT_DATA_DIR', os.path.dirname(os.path.abspath(__file__)))
+# Общая база заявок, исполнений и балансов всех роботов, из нее читает main_stats.py
+STORE_PATH = os.path.join(DATA_DIR, 'trades.sqlite')
+# Сколько завершенных заявок робот держит в памяти, полная история остается в журнале и базе
+MAX_FINISHED_TRADES = 10000
+
+# Для минимизации влияния комиссии:
+# 1. take_profit должен быть существенно больше двойной комиссии (обычно 0.001-0.002 для дешёвых бумаг, 0.01-0.02 для дорогих)
+# 2. min_range чуть выше, чтобы не ловить "пилу"
+# 3. stop_loss чуть больше, чтобы не выбивало по шуму
+
+TICKER_PARAMS = {
+    'MTSS':  dict(rsi_len=21, min_range=0.001,  take_profit=0.01,  stop_loss=0.007,  trade_count=2),
+    'MOEX':  dict(rsi_len=21, min_range=0.0015, take_profit=0.015, stop_loss=0.009,  trade_count=2),
+    'VKCO':  dict(rsi_len=14, min_range=0.0015, take_profit=0.025, stop_loss=0.012,  trade_count=2),
+    'OZON':  dict(rsi_len=14, min_range=0.0015, take_profit=0.03,  stop_loss=0.015,  trade_count=2),
+    'SBER':  dict(rsi_len=21, min_range=0.0012, take_profit=0.012, stop_loss=0.007,  trade_count=5),
+    'GAZP':  dict(rsi_len=21, min_range=0.0012, take_profit=0.012, stop_loss=0.007,  trade_count=3),
+    'LKOH':  dict(rsi_len=14, min_range=0.0015, take_profit=0.018, stop_loss=0.009,  trade_count=1),
+    'GMKN':  dict(rsi_len=14, min_range=0.0018, take_profit=0.02,  stop_loss=0.01,   trade_count=1),
+    'NVTK':  dict(rsi_len=14, min_range=0.0015, take_profit=0.015, stop_loss=0.008,  trade_count=2),
+    'PLZL':  dict(rsi_len=14, min_range=0.0018, take_profit=0.018, stop_loss=0.009,  trade_count=1),
+    'ROSN':  dict(rsi_len=14, min_range=0.0015, take_profit=0.014, stop_loss=0.007,  trade_count=2),
+    'TATN':  dict(rsi_len=14, min_range=0.0015, take_profit=0.013, stop_loss=0.007,  trade_count=2),
+    'CHMF':  dict(rsi_len=14, min_range=0.0015, take_profit=0.015, stop_loss=0.008,  trade_count=2),
+}
+# Параметры тикеров, которых нет в TICKER_PARAMS
+DEFAULT_PARAMS = dict(rsi_len=14, min_range=0.001, take_profit=0.015, stop_loss=0.008, trade_count=2)
+
+TICKERS = [
+    ('MTSS', 'TQBR'),
+    ('MOEX', 'TQBR'),
+    ('VKCO', 'TQBR'),
+    ('OZON', 'TQBR'),
+    ('SBER', 'TQBR'),
+    ('GAZP', 'TQBR'),
+    ('LKOH', 'TQBR'),
+    ('GMKN', 'TQBR'),
+    ('NVTK', 'TQBR'),
+    ('PLZL', 'TQBR'),
+    ('ROSN', 'TQBR'),
+    ('TATN', 'TQBR'),
+    ('CHMF', 'TQBR'),
+]
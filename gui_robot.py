@@ -1,16 +1,21 @@
 # Графическая оболочка для запуска робота с мультиторговлей, ручным добавлением тикеров, параметрами и пояснениями
+import collections
+import datetime
 import sys
-import threading
+import time
+import webbrowser
 from PyQt5 import QtWidgets, QtCore
 from PyQt5.QtWidgets import (
-    QApplication, QMainWindow, QLabel, QLineEdit, QPushButton, QListWidget, QListWidgetItem,
-    QVBoxLayout, QHBoxLayout, QWidget, QSpinBox, QDoubleSpinBox, QTextEdit, QMessageBox, QGroupBox
+    QApplication, QMainWindow, QLabel, QLineEdit, QPushButton, QListView,
+    QVBoxLayout, QHBoxLayout, QWidget, QSpinBox, QDoubleSpinBox, QMessageBox, QGroupBox, QTableView
 )
 from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QColor
 
-from robotlib.robot import TradingRobotFactory
-from robotlib.strategy import RSIStrategy
-from robotlib.vizualization import Visualizer
+from robotlib.dashboard import DashboardServer
+from robotlib.events import CANDLE, LATENCY, LOG, PNL, STATE, TRADE, EventBus
+from robotlib.instruments import InstrumentRegistry, InstrumentSearchIndex
+from robotlib.supervisor import SupervisorClient, SupervisorConfig
 
 # --- Параметры по умолчанию из мультистратегии ---
 TICKER_PARAMS = {
@@ -30,63 +35,259 @@ TICKER_PARAMS = {
     'YDEX':  dict(rsi_len=14, min_range=0.0018, take_profit=0.02,  stop_loss=0.01,   trade_count=1),
 }
 
+MAX_LOG_LINES = 5000  # журнал в окне хранит только последние строки
+EVENTS_INTERVAL_MS = 250  # как часто окно забирает события роботов
+
+STATE_LABELS = {
+    'starting': "запуск",
+    'running': "работает",
+    'stopping': "остановка",
+    'stopped': "остановлен",
+    'failed': "сбой",
+    'restarting': "перезапуск",
+}
+
 # --- Получение тикеров с Мосбиржи через Tinkoff Invest API ---
-def get_moex_tickers(token):
-    from tinkoff.invest import Client
-    tickers = []
-    with Client(token) as client:
-        shares = client.instruments.shares().instruments
-        for share in shares:
-            # Фильтруем только акции основного рынка Мосбиржи по class_code
-            if getattr(share, "class_code", None) == "TQBR":
-                tickers.append((share.ticker, share.class_code))
-    return sorted(set(tickers))
-
-class MultiRobotThread(QtCore.QThread):
-    log_signal = QtCore.pyqtSignal(str)
-    finished_signal = QtCore.pyqtSignal(str)
-
-    def __init__(self, token, account_id, tickers_params):
+def get_moex_tickers(registry):
+    # Фильтруем только акции основного рынка Мосбиржи по class_code
+    return sorted({(share.ticker, share.class_code, share.name) for share in registry.get_by_class_code("TQBR")})
+
+class CatalogueLoader(QtCore.QThread):
+    # Каталог акций кэшируется на диске (InstrumentRegistry). Поток сначала отдает кэш, затем, если кэш устарел
+    # или обновление запрошено явно, загружает каталог из API. Главный поток окна сети не ждет
+    cached_signal = QtCore.pyqtSignal(list)
+    loaded_signal = QtCore.pyqtSignal(list)
+    error_signal = QtCore.pyqtSignal(str)
+
+    def __init__(self, token=None, force_refresh=False):
         super().__init__()
         self.token = token
-        self.account_id = account_id
-        self.tickers_params = tickers_params  # список кортежей: (ticker, class_code, rsi_len, min_range, take_profit, stop_loss, trade_count)
+        self.force_refresh = force_refresh
 
     def run(self):
-        threads = []
-        def run_one(ticker, class_code, rsi_len, min_range, take_profit, stop_loss, trade_count):
-            try:
-                self.log_signal.emit(f"Запуск торговли для {ticker}")
-                visualizer = Visualizer(ticker, 'RUB')
-                robot_factory = TradingRobotFactory(
-                    token=self.token,
-                    account_id=self.account_id,
-                    ticker=ticker,
-                    class_code=class_code,
-                    logger_level='INFO'
-                )
-                strategy = RSIStrategy(
-                    rsi_len=rsi_len,
-                    trade_count=trade_count,
-                    min_range=min_range,
-                    take_profit=take_profit,
-                    stop_loss=stop_loss,
-                    visualizer=visualizer
-                )
-                robot = robot_factory.create_robot(strategy, sandbox_mode=False)
-                stats = robot.trade()
-                stats.save_to_file(f'stats_{ticker}.pickle')
-                self.log_signal.emit(f"Торговля по {ticker} завершена. Файл статистики: stats_{ticker}.pickle")
-            except Exception as e:
-                self.log_signal.emit(f"Ошибка по {ticker}: {e}")
-
-        for params in self.tickers_params:
-            t = threading.Thread(target=run_one, args=params)
-            t.start()
-            threads.append(t)
-        for t in threads:
-            t.join()
-        self.finished_signal.emit("Торговля по выбранным тикерам завершена.")
+        try:
+            registry = InstrumentRegistry.default(self.token)
+            if registry.is_loaded():
+                self.cached_signal.emit(get_moex_tickers(registry))
+            if self.token and (self.force_refresh or registry.is_stale()):
+                registry.refresh()
+                self.loaded_signal.emit(get_moex_tickers(registry))
+        except Exception as e:
+            self.error_signal.emit(str(e))
+
+class TickerListModel(QtCore.QAbstractListModel):
+    # Тикеры для выбора: предустановленные из мультистратегии, каталог Мосбиржи и добавленные вручную.
+    # Отметки хранятся по (тикер, class_code), поэтому не сбрасываются поиском и обновлением каталога
+    checked_changed = QtCore.pyqtSignal()
+
+    PRESET_TOOLTIP = "Предустановленный тикер с оптимальными параметрами и стратегией."
+    CATALOGUE_TOOLTIP = "Тикер Мосбиржи. Параметры можно задать вручную."
+    CUSTOM_TOOLTIP = "Пользовательский тикер. Параметры задайте вручную."
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.catalogue = []  # (ticker, class_code, name)
+        self.custom = []  # (ticker, class_code), добавленные вручную
+        self.checked = set()
+        self.entries = []  # (ticker, class_code, name, tooltip)
+        self.search_index = InstrumentSearchIndex([])
+        self.rows = []  # номера видимых при текущем поиске строк entries
+        self.query = ""
+        self.set_catalogue([])
+
+    def set_catalogue(self, shares):
+        names = {(ticker, class_code): name for ticker, class_code, name in shares}
+        # Сначала тикеры из мультистратегии (с параметрами), затем остальные тикеры MOEX и добавленные вручную
+        entries = [(ticker, "TQBR", names.get((ticker, "TQBR"), ""), self.PRESET_TOOLTIP) for ticker in TICKER_PARAMS]
+        entries += [(ticker, class_code, name, self.CATALOGUE_TOOLTIP) for ticker, class_code, name in shares
+                    if ticker not in TICKER_PARAMS]
+        known = {(ticker, class_code) for ticker, class_code, _, _ in entries}
+        entries += [(ticker, class_code, "", self.CUSTOM_TOOLTIP) for ticker, class_code in self.custom
+                    if (ticker, class_code) not in known]
+        self.beginResetModel()
+        self.catalogue = shares
+        self.entries = entries
+        self.search_index = InstrumentSearchIndex([(ticker, name) for ticker, _, name, _ in entries])
+        self.rows = self.search_index.search(self.query)
+        self.endResetModel()
+
+    def set_filter(self, query):
+        self.beginResetModel()
+        self.query = query
+        self.rows = self.search_index.search(query)
+        self.endResetModel()
+
+    def add_custom(self, ticker, class_code="TQBR"):
+        key = (ticker, class_code)
+        if not any(entry[:2] == key for entry in self.entries):
+            self.custom.append(key)
+            self.set_catalogue(self.catalogue)
+        self.checked.add(key)
+        if self.rows:
+            self.dataChanged.emit(self.index(0), self.index(len(self.rows) - 1), [Qt.CheckStateRole])
+        self.checked_changed.emit()
+
+    def checked_keys(self):
+        return [entry[:2] for entry in self.entries if entry[:2] in self.checked]
+
+    def rowCount(self, parent=QtCore.QModelIndex()):  # pylint:disable=invalid-name
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        ticker, class_code, name, tooltip = self.entries[self.rows[index.row()]]
+        if role == Qt.DisplayRole:
+            return f"{ticker} ({class_code})  {name}" if name else f"{ticker} ({class_code})"
+        if role == Qt.ToolTipRole:
+            return tooltip
+        if role == Qt.CheckStateRole:
+            return Qt.Checked if (ticker, class_code) in self.checked else Qt.Unchecked
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):  # pylint:disable=invalid-name
+        if role != Qt.CheckStateRole or not index.isValid():
+            return False
+        key = self.entries[self.rows[index.row()]][:2]
+        if value == Qt.Checked:
+            self.checked.add(key)
+        else:
+            self.checked.discard(key)
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+        self.checked_changed.emit()
+        return True
+
+    def flags(self, index):
+        return Qt.ItemIsEnabled | Qt.ItemIsUserCheckable
+
+class LogListModel(QtCore.QAbstractListModel):
+    # Последние MAX_LOG_LINES строк журнала. Строки добавляются пачками, самые старые удаляются
+    LEVEL_COLORS = {'WARNING': QColor(170, 110, 0), 'ERROR': QColor(200, 0, 0), 'CRITICAL': QColor(200, 0, 0)}
+
+    def __init__(self, parent=None, max_lines=MAX_LOG_LINES):
+        super().__init__(parent)
+        self.lines = collections.deque(maxlen=max_lines)  # (time, level, robot_id, message)
+
+    def append_lines(self, lines):
+        if not lines:
+            return
+        maxlen = self.lines.maxlen
+        if len(lines) >= maxlen:
+            self.beginResetModel()
+            self.lines.clear()
+            self.lines.extend(lines[-maxlen:])
+            self.endResetModel()
+            return
+        overflow = len(self.lines) + len(lines) - maxlen
+        if overflow > 0:
+            self.beginRemoveRows(QtCore.QModelIndex(), 0, overflow - 1)
+            for _ in range(overflow):
+                self.lines.popleft()
+            self.endRemoveRows()
+        self.beginInsertRows(QtCore.QModelIndex(), len(self.lines), len(self.lines) + len(lines) - 1)
+        self.lines.extend(lines)
+        self.endInsertRows()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):  # pylint:disable=invalid-name
+        return 0 if parent.isValid() else len(self.lines)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        created, level, robot_id, message = self.lines[index.row()]
+        if role == Qt.DisplayRole:
+            prefix = f"{datetime.datetime.fromtimestamp(created).strftime('%H:%M:%S')} "
+            return f"{prefix}{robot_id}: {message}" if robot_id else prefix + message
+        if role == Qt.ForegroundRole:
+            return self.LEVEL_COLORS.get(level)
+        return None
+
+class StatusTableModel(QtCore.QAbstractTableModel):
+    # Состояние роботов по тикерам из событий шины: процесс, цена, позиция, деньги, результат, сделки, задержка
+    COLUMNS = ["Тикер", "Состояние", "Цена", "Позиция", "Деньги", "Результат", "Сделок", "Задержка p50/p99, мкс"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.robot_ids = []
+        self.rows = {}  # robot_id -> состояние
+
+    def apply(self, events):
+        changed = set()
+        for event in events:
+            if event.kind not in (CANDLE, PNL, LATENCY, STATE):
+                continue
+            state = self.rows.get(event.robot_id)
+            if state is None:
+                self.beginInsertRows(QtCore.QModelIndex(), len(self.robot_ids), len(self.robot_ids))
+                self.robot_ids.append(event.robot_id)
+                state = self.rows[event.robot_id] = {'state': {}, 'price': None, 'pnl': {}, 'latency': {}}
+                self.endInsertRows()
+            if event.kind == CANDLE:
+                state['price'] = event.data['close']
+            elif event.kind == PNL:
+                state['pnl'] = event.data
+            elif event.kind == STATE:
+                state['state'] = event.data
+            else:
+                state['latency'] = event.data.get('total', {})
+            changed.add(event.robot_id)
+        # одно обновление строки на пачку событий, сколько бы их ни пришло
+        for robot_id in changed:
+            row = self.robot_ids.index(robot_id)
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.COLUMNS) - 1), [Qt.DisplayRole])
+
+    def rowCount(self, parent=QtCore.QModelIndex()):  # pylint:disable=invalid-name
+        return 0 if parent.isValid() else len(self.robot_ids)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):  # pylint:disable=invalid-name
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):  # pylint:disable=invalid-name
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        robot_id = self.robot_ids[index.row()]
+        state = self.rows[robot_id]
+        pnl = state['pnl']
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return robot_id
+            if column == 1:
+                return STATE_LABELS.get(state['state'].get('state'), state['state'].get('state', ''))
+            if column == 2:
+                return self._number(state['price'], 2)
+            if column == 3:
+                return str(pnl.get('positions', ''))
+            if column == 4:
+                return self._number(pnl.get('money'), 2)
+            if column == 5:
+                return self._number(pnl.get('net_pnl'), 2)
+            if column == 6:
+                return str(pnl.get('fills', ''))
+            latency = state['latency']
+            return f"{self._number(latency.get('p50'), 0)} / {self._number(latency.get('p99'), 0)}" if latency else ""
+        if role == Qt.ToolTipRole and column == 1 and state['state']:
+            robot_state = state['state']
+            return f"PID {robot_state['pid']}, перезапусков {robot_state['restarts']}. {robot_state['reason']}".strip()
+        if role == Qt.ForegroundRole and column == 1 and state['state'].get('state') == 'failed':
+            return QColor(200, 0, 0)
+        if role == Qt.ForegroundRole and column == 5 and pnl.get('net_pnl'):
+            return QColor(0, 128, 0) if pnl['net_pnl'] > 0 else QColor(200, 0, 0)
+        if role == Qt.TextAlignmentRole and column > 1:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    @staticmethod
+    def _number(value, digits):
+        return "" if value is None else f"{value:.{digits}f}"
+
+    def robot_id(self, row):
+        return self.robot_ids[row]
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -113,11 +314,17 @@ class MainWindow(QMainWindow):
         self.account_btn.clicked.connect(self.get_accounts)
 
         self.ticker_label = QLabel("Тикеры для торговли:")
-        self.ticker_label.setToolTip("Выберите один или несколько тикеров для мультиторговли.")
-        self.ticker_list = QListWidget()
-        self.ticker_list.setSelectionMode(QListWidget.MultiSelection)
+        self.ticker_label.setToolTip("Отметьте один или несколько тикеров для мультиторговли.")
+        self.ticker_filter = QLineEdit()
+        self.ticker_filter.setPlaceholderText("Поиск по тикеру или названию")
+        self.ticker_filter.setClearButtonEnabled(True)
+        self.ticker_model = TickerListModel(self)
+        self.ticker_filter.textChanged.connect(self.ticker_model.set_filter)
+        self.ticker_list = QListView()
+        self.ticker_list.setModel(self.ticker_model)
+        self.ticker_list.setUniformItemSizes(True)  # высота строк не пересчитывается при каждом поиске
         self.ticker_list.setToolTip(
-            "Список тикеров Мосбиржи. Можно выбрать несколько для одновременной торговли.\n"
+            "Список тикеров Мосбиржи. Можно отметить несколько для одновременной торговли.\n"
             "Если тикеры не подгружаются, вы можете добавить свой тикер вручную:\n"
             "1. Кликните правой кнопкой мыши по списку и выберите 'Добавить тикер'.\n"
             "2. Введите тикер (например, SBER) и нажмите OK."
@@ -191,13 +398,29 @@ class MainWindow(QMainWindow):
         self.start_btn = QPushButton("Запустить мультиторговлю")
         self.start_btn.setToolTip("Запустить торговлю по выбранным тикерам и параметрам.")
         self.start_btn.clicked.connect(self.start_multi_robot)
-        self.stop_btn = QPushButton("Остановить")
-        self.stop_btn.setToolTip("Остановить торговлю (если поддерживается).")
+        self.stop_btn = QPushButton("Остановить всех")
+        self.stop_btn.setToolTip("Остановить всех роботов. Каждый сохранит статистику в stats_<тикер>.pickle.")
         self.stop_btn.setEnabled(False)
-
-        self.log = QTextEdit()
-        self.log.setReadOnly(True)
-        self.log.setToolTip("Здесь отображается ход работы робота и все сообщения.")
+        self.stop_btn.clicked.connect(self.stop_all_robots)
+        self.dashboard_btn = QPushButton("Открыть дашборд")
+        self.dashboard_btn.setToolTip("Графики, сделки, результат и задержки всех роботов в браузере.")
+        self.dashboard_btn.clicked.connect(self.open_dashboard)
+
+        self.status_model = StatusTableModel(self)
+        self.status_table = QTableView()
+        self.status_table.setModel(self.status_model)
+        self.status_table.verticalHeader().setVisible(False)
+        self.status_table.horizontalHeader().setStretchLastSection(True)
+        self.status_table.setToolTip("Состояние процесса робота, цена, позиция, деньги, результат за вычетом комиссий, число сделок и задержка по каждому тикеру. Правая кнопка мыши - остановить или перезапустить робота.")
+        self.status_table.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.status_table.customContextMenuRequested.connect(self.show_robot_context_menu)
+
+        self.log_model = LogListModel(self)
+        self.log = QListView()
+        self.log.setModel(self.log_model)
+        self.log.setUniformItemSizes(True)
+        self.log.setWordWrap(False)
+        self.log.setToolTip(f"Здесь отображается ход работы робота и все сообщения (последние {MAX_LOG_LINES} строк).")
 
         # --- Layout ---
         main_layout = QVBoxLayout()
@@ -208,21 +431,76 @@ class MainWindow(QMainWindow):
         main_layout.addWidget(self.account_input)
         main_layout.addWidget(self.account_btn)
         main_layout.addWidget(self.ticker_label)
+        main_layout.addWidget(self.ticker_filter)
         main_layout.addWidget(self.ticker_list)
         main_layout.addWidget(self.ticker_btn)
         main_layout.addWidget(params_group)
         main_layout.addWidget(self.start_btn)
         main_layout.addWidget(self.stop_btn)
+        main_layout.addWidget(self.dashboard_btn)
+        main_layout.addWidget(self.status_table)
         main_layout.addWidget(self.log)
 
         container = QWidget()
         container.setLayout(main_layout)
         self.setCentralWidget(container)
 
-        self.robot_thread = None
+        # Каждый робот работает в своем процессе под присмотром процесса-супервизора,
+        # окно только отправляет ему команды и читает события
+        self.supervisor = None
+        # Один дашборд на все тикеры вместо окна matplotlib на каждый
+        self.event_bus = EventBus()
+        self.dashboard = None
+        # События роботов забираются пачками по таймеру, а не сигналом на каждую строку
+        self.event_seq = 0
+        self.events_timer = QtCore.QTimer(self)
+        self.events_timer.timeout.connect(self.drain_events)
+        self.events_timer.start(EVENTS_INTERVAL_MS)
 
         # Автоматически подставлять параметры при выборе тикера
-        self.ticker_list.itemSelectionChanged.connect(self.set_params_for_selected_ticker)
+        self.ticker_model.checked_changed.connect(self.set_params_for_selected_ticker)
+
+        # Список заполняется из кэша каталога в фоне, окно открывается сразу
+        self.catalogue_loader = None
+        self.load_tickers()
+
+    def add_log(self, message, level="INFO"):
+        self.append_log_lines([(time.time(), level, "", message)])
+
+    def append_log_lines(self, lines):
+        scrollbar = self.log.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum()
+        self.log_model.append_lines(lines)
+        if at_bottom:
+            self.log.scrollToBottom()
+
+    def drain_events(self):
+        events, lost = self.event_bus.read(self.event_seq)
+        if not events:
+            return
+        self.event_seq = events[-1].seq
+        lines = []
+        if lost:
+            lines.append((time.time(), "WARNING", "", "Часть событий роботов пропущена: окно не успевало их забирать"))
+        for event in events:
+            if event.kind == LOG:
+                lines.append((event.data['time'], event.data['level'], event.robot_id, event.data['message']))
+            elif event.kind == TRADE:
+                data = event.data
+                lines.append((data['time'], "INFO", event.robot_id,
+                              f"{'Покупка' if data['direction'] == 'buy' else 'Продажа'} {data['lots']} лот(ов) по {data['price']}"))
+        self.append_log_lines(lines)
+        self.status_model.apply(events)
+
+    def open_dashboard(self):
+        if self.dashboard is None:
+            try:
+                self.dashboard = DashboardServer(self.event_bus).start()
+            except OSError as e:
+                QMessageBox.critical(self, "Ошибка", f"Не удалось запустить дашборд: {e}")
+                return
+            self.add_log(f"Дашборд запущен: {self.dashboard.url}")
+        webbrowser.open(self.dashboard.url)
 
     def show_token_help(self):
         QMessageBox.information(self, "Как получить токен",
@@ -254,33 +532,37 @@ class MainWindow(QMainWindow):
         if not token:
             QMessageBox.warning(self, "Ошибка", "Введите токен!")
             return
-        self.ticker_list.clear()
-        self.ticker_list.addItem("Загрузка...")
-        QtWidgets.QApplication.processEvents()
-        try:
-            tickers = get_moex_tickers(token)
-            self.ticker_list.clear()
-            # Сначала добавим тикеры из мультистратегии (с параметрами)
-            for ticker in TICKER_PARAMS:
-                item = QListWidgetItem(f"{ticker} (TQBR)")
-                item.setToolTip("Предустановленный тикер с оптимальными параметрами и стратегией.")
-                self.ticker_list.addItem(item)
-            # Затем добавим остальные тикеры MOEX (без дублей)
-            for ticker, class_code in tickers:
-                if ticker not in TICKER_PARAMS:
-                    item = QListWidgetItem(f"{ticker} ({class_code})")
-                    item.setToolTip("Тикер Мосбиржи. Параметры можно задать вручную.")
-                    self.ticker_list.addItem(item)
-        except Exception as e:
-            self.ticker_list.clear()
-            self.ticker_list.addItem("Ошибка загрузки")
-            QMessageBox.critical(
-                self,
-                "Ошибка",
-                f"Не удалось получить тикеры: {e}\n\n"
-                "Если тикеры не подгружаются, вы можете добавить свой тикер вручную через правый клик по списку.\n"
-                "Тикеры из мультистратегии всегда доступны для выбора!"
-            )
+        self.load_tickers(token, force_refresh=True)
+
+    def load_tickers(self, token=None, force_refresh=False):
+        if self.catalogue_loader is not None and self.catalogue_loader.isRunning():
+            return
+        self.ticker_btn.setEnabled(False)
+        if force_refresh:
+            self.ticker_btn.setText("Загрузка...")
+        self.catalogue_loader = CatalogueLoader(token, force_refresh)
+        self.catalogue_loader.cached_signal.connect(self.ticker_model.set_catalogue)
+        self.catalogue_loader.loaded_signal.connect(self.on_tickers_loaded)
+        self.catalogue_loader.error_signal.connect(self.on_tickers_error)
+        self.catalogue_loader.finished.connect(self.on_tickers_finished)
+        self.catalogue_loader.start()
+
+    def on_tickers_loaded(self, shares):
+        self.ticker_model.set_catalogue(shares)
+        self.add_log(f"Загружено тикеров Мосбиржи: {len(shares)}")
+
+    def on_tickers_error(self, error):
+        QMessageBox.critical(
+            self,
+            "Ошибка",
+            f"Не удалось получить тикеры: {error}\n\n"
+            "Если тикеры не подгружаются, вы можете добавить свой тикер вручную через правый клик по списку.\n"
+            "Тикеры из мультистратегии всегда доступны для выбора!"
+        )
+
+    def on_tickers_finished(self):
+        self.ticker_btn.setEnabled(True)
+        self.ticker_btn.setText("Обновить тикеры")
 
     def show_ticker_context_menu(self, pos):
         menu = QtWidgets.QMenu()
@@ -291,20 +573,14 @@ class MainWindow(QMainWindow):
                 self, "Добавить тикер", "Введите тикер (например, SBER):"
             )
             if ok and text.strip():
-                item = QListWidgetItem(f"{text.strip().upper()} (TQBR)")
-                item.setToolTip("Пользовательский тикер. Параметры задайте вручную.")
-                self.ticker_list.addItem(item)
+                self.ticker_model.add_custom(text.strip().upper())
 
 
     def set_params_for_selected_ticker(self):
         # Если выбран ровно один тикер из мультистратегии — подставить параметры
-        selected = self.ticker_list.selectedItems()
+        selected = self.ticker_model.checked_keys()
         if len(selected) == 1:
-            ticker_str = selected[0].text().strip()
-            if "(" in ticker_str and ")" in ticker_str:
-                ticker, _ = ticker_str.split(" (")
-            else:
-                ticker = ticker_str
+            ticker, _ = selected[0]
             params = TICKER_PARAMS.get(ticker)
             if params:
                 self.rsi_spin.setValue(params['rsi_len'])
@@ -312,7 +588,7 @@ class MainWindow(QMainWindow):
                 self.tp_spin.setValue(params['take_profit'])
                 self.sl_spin.setValue(params['stop_loss'])
                 self.trade_count_spin.setValue(params['trade_count'])
-                self.log.append(f"Параметры для {ticker} подставлены автоматически из мультистратегии.")
+                self.add_log(f"Параметры для {ticker} подставлены автоматически из мультистратегии.")
             else:
                 # Значения по умолчанию
                 self.rsi_spin.setValue(14)
@@ -320,30 +596,23 @@ class MainWindow(QMainWindow):
                 self.tp_spin.setValue(0.015)
                 self.sl_spin.setValue(0.008)
                 self.trade_count_spin.setValue(2)
-                self.log.append(f"Для {ticker} параметры выставлены по умолчанию. Измените их вручную при необходимости.")
+                self.add_log(f"Для {ticker} параметры выставлены по умолчанию. Измените их вручную при необходимости.")
         elif len(selected) > 1:
-            self.log.append("Выбрано несколько тикеров. Параметры применяются ко всем выбранным тикерам одинаково.")
+            self.add_log("Выбрано несколько тикеров. Параметры применяются ко всем выбранным тикерам одинаково.")
         else:
-            self.log.append("Выберите тикер для торговли.")
+            self.add_log("Выберите тикер для торговли.")
         # Если выбрано несколько тикеров — не менять параметры (пусть пользователь сам задаёт)
 
     def start_multi_robot(self):
         token = self.token_input.text().strip()
         account_id = self.account_input.text().strip()
-        selected = self.ticker_list.selectedItems()
+        selected = self.ticker_model.checked_keys()
         if not selected:
             QMessageBox.warning(self, "Ошибка", "Выберите хотя бы один тикер!")
-            self.log.append("Ошибка: не выбран ни один тикер для торговли.")
+            self.add_log("Ошибка: не выбран ни один тикер для торговли.")
             return
         tickers_params = []
-        for item in selected:
-            ticker_str = item.text().strip()
-            if "(" in ticker_str and ")" in ticker_str:
-                ticker, class_code = ticker_str.split(" (")
-                class_code = class_code.rstrip(")")
-            else:
-                ticker = ticker_str
-                class_code = "TQBR"
+        for ticker, class_code in selected:
             # Для каждого тикера — если он из мультистратегии, подставить параметры, иначе взять из UI
             params = TICKER_PARAMS.get(ticker)
             if params:
@@ -352,31 +621,75 @@ class MainWindow(QMainWindow):
                 take_profit = params['take_profit']
                 stop_loss = params['stop_loss']
                 trade_count = params['trade_count']
-                self.log.append(f"Для {ticker} применяются параметры мультистратегии.")
+                self.add_log(f"Для {ticker} применяются параметры мультистратегии.")
             else:
                 rsi_len = self.rsi_spin.value()
                 min_range = self.min_range_spin.value()
                 take_profit = self.tp_spin.value()
                 stop_loss = self.sl_spin.value()
                 trade_count = self.trade_count_spin.value()
-                self.log.append(f"Для {ticker} применяются параметры, заданные вручную.")
+                self.add_log(f"Для {ticker} применяются параметры, заданные вручную.")
             tickers_params.append((ticker, class_code, rsi_len, min_range, take_profit, stop_loss, trade_count))
 
         if not token or not account_id or not tickers_params:
             QMessageBox.warning(self, "Ошибка", "Заполните все поля!")
-            self.log.append("Ошибка: не все поля заполнены.")
+            self.add_log("Ошибка: не все поля заполнены.")
             return
 
-        self.log.append("Запуск мультиторговли по выбранным тикерам...")
-        self.start_btn.setEnabled(False)
+        if not self.ensure_supervisor(token, account_id):
+            return
+        self.add_log("Запуск мультиторговли по выбранным тикерам...")
         self.stop_btn.setEnabled(True)
-
-        self.robot_thread = MultiRobotThread(
-            token, account_id, tickers_params
-        )
-        self.robot_thread.log_signal.connect(self.log.append)
-        self.robot_thread.finished_signal.connect(self.on_robot_finished)
-        self.robot_thread.start()
+        for ticker, class_code, rsi_len, min_range, take_profit, stop_loss, trade_count in tickers_params:
+            self.supervisor.start_robot(ticker, class_code, dict(
+                rsi_len=rsi_len, min_range=min_range, take_profit=take_profit, stop_loss=stop_loss,
+                trade_count=trade_count), sandbox_mode=False)
+
+    def ensure_supervisor(self, token, account_id):
+        # Супервизор запускается один раз и обслуживает всех роботов с одним токеном и счетом
+        if self.supervisor is not None and self.supervisor.is_alive():
+            config = self.supervisor.config
+            if (config.token, config.account_id) != (token, account_id):
+                QMessageBox.warning(self, "Ошибка", "Роботы уже работают с другим токеном или счетом. Сначала остановите их.")
+                return False
+            return True
+        try:
+            self.supervisor = SupervisorClient(SupervisorConfig(token=token, account_id=account_id), self.event_bus).start()
+        except OSError as e:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось запустить процесс роботов: {e}")
+            self.supervisor = None
+            return False
+        self.add_log(f"Супервизор роботов запущен, PID {self.supervisor.process.pid}")
+        return True
+
+    def stop_all_robots(self):
+        if self.supervisor is not None and self.supervisor.is_alive():
+            self.add_log("Остановка всех роботов...")
+            self.supervisor.stop_robot()
+
+    def show_robot_context_menu(self, pos):
+        index = self.status_table.indexAt(pos)
+        if not index.isValid() or self.supervisor is None or not self.supervisor.is_alive():
+            return
+        ticker = self.status_model.robot_id(index.row())
+        menu = QtWidgets.QMenu()
+        stop_action = menu.addAction(f"Остановить {ticker}")
+        restart_action = menu.addAction(f"Перезапустить {ticker}")
+        action = menu.exec_(self.status_table.viewport().mapToGlobal(pos))
+        if action == stop_action:
+            self.supervisor.stop_robot(ticker)
+        elif action == restart_action:
+            self.supervisor.restart_robot(ticker)
+
+    def closeEvent(self, event):  # pylint:disable=invalid-name
+        # Роботы останавливаются и сохраняют статистику до выхода из приложения
+        if self.supervisor is not None:
+            self.add_log("Остановка роботов...")
+            self.supervisor.shutdown()
+            self.supervisor = None
+        if self.dashboard is not None:
+            self.dashboard.stop()
+        super().closeEvent(event)
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -0,0 +1,41 @@
+import datetime
+import os
+from dotenv import load_dotenv
+
+from robotlib.costs import TariffCostModel
+from robotlib.robot import TradingRobotFactory
+from robotlib.strategy import TradeStrategyParams, RSIStrategy
+from robotlib.vizualization import BacktestChart
+
+load_dotenv()
+token = os.environ.get('TINKOFF_TOKEN_TEST', os.environ.get('TINKOFF_TOKEN'))
+account_id = os.environ.get('TINKOFF_ACCOUNT_TEST', os.environ.get('TINKOFF_ACCOUNT'))
+cost_model = TariffCostModel.for_tariff('trader', half_spread=0.0002)
+
+TICKER = 'MOEX'
+TEST_DAYS = 180
+MODE = 'candles'  # 'line' - линия цены закрытия, прореженная LTTB
+
+
+def main():
+    robot_factory = TradingRobotFactory(token=token, account_id=account_id, ticker=TICKER, class_code='TQBR',
+                                        logger_level='ERROR')
+    strategy = RSIStrategy(rsi_len=14, trade_count=2, min_range=0.001, take_profit=0.01, stop_loss=0.005,
+                           cost_model=cost_model)
+    robot = robot_factory.create_robot(strategy, sandbox_mode=True)
+    stats = robot.backtest(
+        TradeStrategyParams(instrument_balance=0, currency_balance=15000, pending_orders=[]),
+        train_duration=datetime.timedelta(days=1), test_duration=datetime.timedelta(days=TEST_DAYS),
+        cost_model=cost_model
+    )
+    print(f'{TICKER}: {len(robot.backtest_candles)} свечей, {len(stats.trades)} сделок')
+
+    # График перестраивается из всех свечей при каждом масштабировании и сдвиге, рисуется не больше свечей,
+    # чем помещается по ширине окна
+    chart = BacktestChart(robot.backtest_candles, TICKER, robot.instrument_info.currency, mode=MODE)
+    chart.set_trades_from_statistics(stats)
+    chart.show()
+
+
+if __name__ == '__main__':
+    main()
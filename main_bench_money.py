@@ -0,0 +1,53 @@
+import argparse
+import random
+import timeit
+import tracemalloc
+
+from tinkoff.invest import Quotation
+
+from robotlib.money import Money, MoneyArray
+
+
+def measure(name, statement, number):
+    seconds = min(timeit.repeat(statement, number=number, repeat=3))
+    print(f'{name:<40} {seconds / number * 1e9:>10.0f} нс')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер скорости и памяти денежных типов Money и MoneyArray')
+    parser.add_argument('--count', type=int, default=100_000, help='число сумм для сложения и замера памяти')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    quotations = [Quotation(units=rng.randint(0, 5000), nano=rng.randrange(0, 10 ** 9, 10 ** 7))
+                  for _ in range(args.count)]
+    price = Money(quotations[0])
+    other = Money(quotations[1])
+
+    print('Одна операция:')
+    measure('Money(Quotation)', lambda: Money(quotations[0]), 100_000)
+    measure('Money(float)', lambda: Money(271.35), 100_000)
+    measure('Money + Money', lambda: price + other, 100_000)
+    measure('Money * int', lambda: price * 10, 100_000)
+    measure('Money.to_float()', price.to_float, 100_000)
+
+    print(f'\nСумма {args.count} значений:')
+    amounts = [Money(quotation) for quotation in quotations]
+    array = MoneyArray.from_quotations(quotations)
+    measure('sum(list[Money])', lambda: sum(amounts, Money()), 3)
+    measure('MoneyArray.from_quotations', lambda: MoneyArray.from_quotations(quotations), 3)
+    measure('MoneyArray.sum()', array.sum, 100)
+    assert sum(amounts, Money()) == array.sum()
+
+    tracemalloc.start()
+    snapshot = tracemalloc.take_snapshot()
+    amounts = [Money(quotation) for quotation in quotations]
+    used = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(snapshot, 'filename'))
+    tracemalloc.stop()
+    print(f'\nПамять на {args.count} объектов Money: {used / 1024:.0f} КБ ({used / args.count:.0f} байт на объект), '
+          f'MoneyArray: {array.nanos.nbytes / 1024:.0f} КБ')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Модули, которые импортируют роботы без графиков и отчетов, и бюджет времени их импорта
+HEADLESS_MODULES = [
+    'robotlib.robot',
+    'robotlib.fleet',
+    'robotlib.sharding',
+    'robotlib.supervisor',
+    'robotlib.stats',
+    'robotlib.strategy',
+]
+# Тяжелые зависимости, которые грузятся только при первом использовании: отчет, график, дашборд
+LAZY_DEPENDENCIES = ['pandas', 'matplotlib', 'pytz', 'plotly', 'PyQt5']
+# Для сравнения: сколько стоят сами зависимости
+REFERENCE_MODULES = ['numpy', 'pandas', 'matplotlib.pyplot']
+IMPORT_BUDGET_MS = 300
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss = rss / 1024 if sys.platform != 'darwin' else rss / 1024 / 1024
+except ImportError:
+    rss = None
+print(json.dumps({{'seconds': elapsed, 'rss_mb': rss,
+                   'lazy': [name for name in {lazy!r} if name in sys.modules]}}))
+'''
+
+
+def measure(module, repeat):
+    """
+    Импорт в чистом интерпретаторе: медиана времени, память процесса и загруженные тяжелые зависимости
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', CHILD.format(module=module, lazy=LAZY_DEPENDENCIES)],
+                                capture_output=True, text=True, check=False)
+        if output.returncode != 0:
+            return None, output.stderr.strip().splitlines()[-1]
+        runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    return {
+        'ms': statistics.median(run['seconds'] for run in runs) * 1000,
+        'rss_mb': runs[-1]['rss_mb'],
+        'lazy': runs[-1]['lazy'],
+    }, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер времени импорта модулей robotlib и загруженных зависимостей')
+    parser.add_argument('--repeat', type=int, default=5, help='сколько раз импортировать каждый модуль')
+    parser.add_argument('--budget-ms', type=float, default=IMPORT_BUDGET_MS,
+                        help='бюджет времени импорта модуля для роботов без графиков, мс')
+    parser.add_argument('--check', action='store_true',
+                        help='код возврата 1, если бюджет превышен или модуль загрузил тяжелую зависимость')
+    args = parser.parse_args()
+
+    baseline, _ = measure('sys', args.repeat)
+    print(f'Пустой интерпретатор: {baseline["rss_mb"] or 0:.0f} МБ\n')
+    print(f'{"Модуль":<24} {"Импорт, мс":>10} {"Память, МБ":>11}  Тяжелые зависимости')
+    failed = []
+    for module in HEADLESS_MODULES + REFERENCE_MODULES:
+        result, error = measure(module, args.repeat)
+        if result is None:
+            print(f'{module:<24} не импортируется: {error}')
+            continue
+        memory = f'{result["rss_mb"]:.0f}' if result['rss_mb'] is not None else '-'
+        note = ', '.join(result['lazy']) or '-'
+        if module in HEADLESS_MODULES:
+            if result['ms'] > args.budget_ms:
+                note += f'  превышен бюджет {args.budget_ms:.0f} мс'
+                failed.append(module)
+            elif result['lazy']:
+                failed.append(module)
+        print(f'{module:<24} {result["ms"]:>10.0f} {memory:>11}  {note}')
+
+    if failed:
+        print(f'\nНе укладываются в бюджет или грузят тяжелые зависимости при импорте: {", ".join(failed)}')
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
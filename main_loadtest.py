@@ -0,0 +1,44 @@
+import argparse
+import logging
+
+from robotlib.loadtest import FleetLoadTest
+from robotlib.strategy import RSIStrategy
+
+
+def make_strategy(ticker):
+    return RSIStrategy(rsi_len=14, trade_count=1, min_range=0.001, take_profit=0.015, stop_loss=0.008,
+                       trailing_stop=0.01)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест: сколько роботов успевает обрабатывать поток данных')
+    parser.add_argument('--robots', default='10,100,250,500,1000',
+                        help='число роботов через запятую, прогоны идут по возрастанию')
+    parser.add_argument('--updates-per-second', type=float, default=1.0, help='обновлений в секунду на робота')
+    parser.add_argument('--updates-per-bar', type=int, default=12, help='обновлений на одну минутную свечу')
+    parser.add_argument('--duration', type=float, default=10.0, help='длительность прогона, секунд')
+    parser.add_argument('--workers', type=int, default=1, help='число потоков-обработчиков')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    load_test = FleetLoadTest(make_strategy, updates_per_second=args.updates_per_second,
+                              updates_per_bar=args.updates_per_bar, duration=args.duration,
+                              workers=args.workers, seed=args.seed)
+    results = []
+    for count in sorted(int(count) for count in args.robots.split(',')):
+        results.append(load_test.run_once(count))
+        print(FleetLoadTest.format_results(results[-1:]).splitlines()[-1], flush=True)
+
+    print()
+    print(FleetLoadTest.format_results(results))
+    behind = [result for result in results if result.falls_behind]
+    if behind:
+        print(f'Очередь начинает расти с {behind[0].robots} роботов '
+              f'({behind[0].sent_rate:.0f} обновлений/с при пропускной способности {behind[0].sustained_rate:.0f}/с)')
+    else:
+        print('Во всех прогонах роботы успевали обрабатывать поток данных')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,15 @@
+import datetime
 import os
 import threading
 from dotenv import load_dotenv
 
-from robotlib.robot import TradingRobotFactory
+from robotlib.dashboard import DashboardServer
+from robotlib.events import EventBus
+from robotlib.fleet import TradingRobotFleetFactory
+from robotlib.ratelimit import RateLimiter
+from robotlib.store import TradeStore
 from robotlib.strategy import RSIStrategy
+from fleet_config import DATA_DIR, DEFAULT_PARAMS, MAX_FINISHED_TRADES, STORE_PATH, TICKERS, TICKER_PARAMS
 
 load_dotenv()
 token = os.environ.get('TINKOFF_TOKEN')
@@ -11,48 +17,16 @@ account_id = os.environ.get('TINKOFF_ACCOUNT')
 
 stop_event = threading.Event()
 
-# Для минимизации влияния комиссии:
-# 1. take_profit должен быть существенно больше двойной комиссии (обычно 0.001-0.002 для дешёвых бумаг, 0.01-0.02 для дорогих)
-# 2. min_range чуть выше, чтобы не ловить "пилу"
-# 3. stop_loss чуть больше, чтобы не выбивало по шуму
+# Графики, сделки и результат всех роботов в браузере
+DASHBOARD_PORT = 8050
 
-TICKER_PARAMS = {
-    'MTSS':  dict(rsi_len=21, min_range=0.001,  take_profit=0.01,  stop_loss=0.007,  trade_count=2),
-    'MOEX':  dict(rsi_len=21, min_range=0.0015, take_profit=0.015, stop_loss=0.009,  trade_count=2),
-    'VKCO':  dict(rsi_len=14, min_range=0.0015, take_profit=0.025, stop_loss=0.012,  trade_count=2),
-    'OZON':  dict(rsi_len=14, min_range=0.0015, take_profit=0.03,  stop_loss=0.015,  trade_count=2),
-    'SBER':  dict(rsi_len=21, min_range=0.0012, take_profit=0.012, stop_loss=0.007,  trade_count=5),
-    'GAZP':  dict(rsi_len=21, min_range=0.0012, take_profit=0.012, stop_loss=0.007,  trade_count=3),
-    'LKOH':  dict(rsi_len=14, min_range=0.0015, take_profit=0.018, stop_loss=0.009,  trade_count=1),
-    'GMKN':  dict(rsi_len=14, min_range=0.0018, take_profit=0.02,  stop_loss=0.01,   trade_count=1),
-    'NVTK':  dict(rsi_len=14, min_range=0.0015, take_profit=0.015, stop_loss=0.008,  trade_count=2),
-    'PLZL':  dict(rsi_len=14, min_range=0.0018, take_profit=0.018, stop_loss=0.009,  trade_count=1),
-    'ROSN':  dict(rsi_len=14, min_range=0.0015, take_profit=0.014, stop_loss=0.007,  trade_count=2),
-    'TATN':  dict(rsi_len=14, min_range=0.0015, take_profit=0.013, stop_loss=0.007,  trade_count=2),
-    'CHMF':  dict(rsi_len=14, min_range=0.0015, take_profit=0.015, stop_loss=0.008,  trade_count=2),
-}
-
-TICKERS = [
-    ('MTSS', 'TQBR'),
-    ('MOEX', 'TQBR'),
-    ('VKCO', 'TQBR'),
-    ('OZON', 'TQBR'),
-    ('SBER', 'TQBR'),
-    ('GAZP', 'TQBR'),
-    ('LKOH', 'TQBR'),
-    ('GMKN', 'TQBR'),
-    ('NVTK', 'TQBR'),
-    ('PLZL', 'TQBR'),
-    ('ROSN', 'TQBR'),
-    ('TATN', 'TQBR'),
-    ('CHMF', 'TQBR'),
-]
-
-def trade_for_ticker(ticker, class_code):
+def trade_for_ticker(ticker, robot_factory, ledger=None, store=None, event_bus=None):
     print(f"Запуск торговли для {ticker}")
-    params = TICKER_PARAMS.get(ticker, dict(rsi_len=14, min_range=0.001, take_profit=0.015, stop_loss=0.008, trade_count=2))
-    from robotlib.stats import TradeStatisticsAnalyzer, BalanceProcessor
-    stats_path = f'/Users/yaroslav/Петпроект/investRobot/stats_{ticker}.pickle'
+    params = TICKER_PARAMS.get(ticker, DEFAULT_PARAMS)
+    from robotlib.journal import TradeJournal
+    from robotlib.stats import TradeStatisticsAnalyzer
+    stats_path = os.path.join(DATA_DIR, f'stats_{ticker}.pickle')
+    journal = TradeJournal(os.path.join(DATA_DIR, 'journal', ticker))
 
     # --- Загружаем или создаём статистику ---
     try:
@@ -64,6 +38,14 @@ def trade_for_ticker(ticker, class_code):
         traceback.print_exc()
         stats = None
 
+    # --- Журнал новее файла статистики: в нем есть сделки, сделанные до падения робота ---
+    if journal.exists():
+        if stats is None:
+            stats = TradeStatisticsAnalyzer(positions=0, money=0.0, instrument_info=robot_factory.instrument_info,
+                                            logger=robot_factory.logger.getChild('stats'))
+        replayed = journal.restore(stats)
+        print(f"Статистика {ticker} восстановлена из журнала, применено записей: {replayed}")
+
     # --- Если статистика была утеряна, но на счету есть купленные лоты, добавляем их вручную ---
     if stats is None:
         print(f"‼️  ВАЖНО: Файл stats_{ticker}.pickle не найден или не читается.")
@@ -77,7 +59,6 @@ def trade_for_ticker(ticker, class_code):
         print(f"Если ошибка повторяется — пересоздайте файл через add_manual_trades.py")
         print(f"Робот не будет спрашивать цену входа, если файл корректный!")
 
-    robot_factory = TradingRobotFactory(token=token, account_id=account_id, ticker=ticker, class_code=class_code, logger_level='INFO')
     strategy = RSIStrategy(
         rsi_len=params['rsi_len'],
         trade_count=params['trade_count'],
@@ -90,18 +71,32 @@ def trade_for_ticker(ticker, class_code):
 
     # Восстанавливаем entry_price, если есть открытая позиция
     entry_price = None
-    if stats is not None:
-        short, full = stats.get_report(processors=[BalanceProcessor()])
-        if not full.empty and 'instrument_balance' in full.columns and full['instrument_balance'].iloc[-1] > 0:
-            last_row = full[full['instrument_balance'] > 0].iloc[-1]
-            entry_price = last_row['average_position_price']
+    if stats is not None and stats.aggregates.position > 0:
+        # Средняя цена считается по всем исполнениям, в том числе по вытесненным из памяти заявкам
+        entry_price = stats.aggregates.average_price / (stats.instrument_info.lot or 1)
     if entry_price is not None:
         strategy.entry_price = entry_price
 
     # --- Передаём существующую статистику в робота, если есть ---
     robot = robot_factory.create_robot(strategy, sandbox_mode=False)
+    robot.enable_latency_tracking(log_interval=300)
+    if event_bus is not None:
+        robot.enable_events(event_bus)
+    # Деньги и позиции общие для всех роботов счёта, каждому выделен свой бюджет
+    robot.account_ledger = ledger
+    # Все сообщения стрима пишутся в лог сессии, его можно воспроизвести через main_replay.py
+    recorder = robot.enable_recording(
+        os.path.join(DATA_DIR, 'recordings', f'{ticker}-{datetime.datetime.now():%Y%m%d-%H%M%S}.mdlog'))
     if stats is not None:
         robot.trade_statistics = stats
+    robot.trade_statistics.max_finished_trades = MAX_FINISHED_TRADES
+    # Кривая капитала сессии: позиция оценивается по закрытию каждой свечи
+    robot.trade_statistics.attach_equity()
+    # Каждое изменение заявки сразу пишется в журнал
+    robot.trade_statistics.attach_journal(journal)
+    if store is not None:
+        store.import_analyzer(ticker, robot.trade_statistics)
+        robot.trade_statistics.attach_store(store, ticker)
 
     try:
         # Передаем stop_event в стратегию/робота, чтобы они могли корректно завершить торговый цикл
@@ -120,12 +115,23 @@ def trade_for_ticker(ticker, class_code):
                 print(f"Нет статистики для сохранения по {ticker}!")
         except Exception as e:
             print(f"Ошибка при сохранении статистики: {e}")
+        journal.close(robot.trade_statistics)
+        recorder.close()
     print(f"Торговля по {ticker} завершена. Файл статистики: stats_{ticker}.pickle")
 
 def main():
+    # Инструменты, аккаунт и позиции загружаются один раз для всех тикеров
+    fleet = TradingRobotFleetFactory(token=token, account_id=account_id, tickers=TICKERS, logger_level='INFO')
+    ledger = fleet.create_ledger()
+    ledger.start()
+    store = TradeStore(STORE_PATH)
+    event_bus = EventBus()
+    dashboard = DashboardServer(event_bus, port=DASHBOARD_PORT).start()
+    print(f"Дашборд: {dashboard.url}")
     threads = []
-    for ticker, class_code in TICKERS:
-        t = threading.Thread(target=trade_for_ticker, args=(ticker, class_code))
+    for ticker in fleet.tickers:
+        t = threading.Thread(target=trade_for_ticker,
+                             args=(ticker, fleet.get_factory(ticker), ledger, store, event_bus))
         t.start()
         threads.append(t)
     try:
@@ -136,7 +142,11 @@ def main():
         stop_event.set()
         for t in threads:
             t.join()
+    ledger.stop()
+    store.close()
+    dashboard.stop()
     print("Торговля по всем тикерам завершена.")
+    print(f"Ограничитель запросов к API: {RateLimiter.for_token(token).format_stats()}")
 
 if __name__ == '__main__':
     main()
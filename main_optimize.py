@@ -2,6 +2,7 @@ import datetime
 import os
 from dotenv import load_dotenv
 
+from robotlib.costs import TariffCostModel
 from robotlib.robot import TradingRobotFactory
 from robotlib.strategy import TradeStrategyParams, RSIStrategy
 from robotlib.stats import BalanceProcessor, BalanceCalculator
@@ -9,6 +10,8 @@ from robotlib.stats import BalanceProcessor, BalanceCalculator
 load_dotenv()
 token = os.environ.get('TINKOFF_TOKEN_TEST', os.environ.get('TINKOFF_TOKEN'))
 account_id = os.environ.get('TINKOFF_ACCOUNT_TEST', os.environ.get('TINKOFF_ACCOUNT'))
+# Тариф «Трейдер» и проскальзывание на половину спреда: доход в подборе параметров считается за вычетом издержек
+cost_model = TariffCostModel.for_tariff('trader', half_spread=0.0002)
 
 def test_rsi_for_ticker(ticker, label):
     robot_factory = TradingRobotFactory(token=token, account_id=account_id, ticker=ticker, class_code='TQBR', logger_level='ERROR')
@@ -24,16 +27,23 @@ def test_rsi_for_ticker(ticker, label):
                         trade_count=2,
                         min_range=min_range,
                         take_profit=take_profit,
-                        stop_loss=stop_loss
+                        stop_loss=stop_loss,
+                        cost_model=cost_model
                     )
                     robot = robot_factory.create_robot(strategy, sandbox_mode=True)
                     stats = robot.backtest(
                         TradeStrategyParams(instrument_balance=0, currency_balance=15000, pending_orders=[]),
-                        train_duration=datetime.timedelta(days=1), test_duration=datetime.timedelta(days=5)
+                        train_duration=datetime.timedelta(days=1), test_duration=datetime.timedelta(days=5),
+                        cost_model=cost_model
                     )
-                    short, _ = stats.get_report(processors=[BalanceProcessor()], calculators=[BalanceCalculator()])
+                    short, _ = stats.get_report(processors=[BalanceProcessor()],
+                                                calculators=[BalanceCalculator(cost_model)])
                     income = short['income']
-                    print(f"{label}: RSI={rsi_len}, min_range={min_range}, TP={take_profit}, SL={stop_loss} => income={income:.2f}")
+                    # Метрики кривой капитала сравнимы между прогонами: у всех одинаковый интервал свечей
+                    metrics = stats.equity.metrics()
+                    print(f"{label}: RSI={rsi_len}, min_range={min_range}, TP={take_profit}, SL={stop_loss} => income={income:.2f} "
+                          f"sharpe={metrics.sharpe:.3f} sortino={metrics.sortino:.3f} max_dd={metrics.max_drawdown:.2f} "
+                          f"exposure={metrics.exposure:.0%} pf={metrics.profit_factor:.2f}")
                     if income > best_income:
                         best_income = income
                         best_params = (rsi_len, min_range, take_profit, stop_loss)
@@ -0,0 +1,52 @@
+import argparse
+import time
+
+from robotlib.recorder import MarketDataReplayer
+from robotlib.robot import TradingRobotFactory
+from robotlib.strategy import RSIStrategy
+from fleet_config import DEFAULT_PARAMS, TICKER_PARAMS
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Воспроизведение записанной сессии рыночных данных через робота')
+    parser.add_argument('path', help='файл записи (.mdlog)')
+    parser.add_argument('--speed', type=float, default=None,
+                        help='ускорение относительно реального времени, по умолчанию максимально быстро')
+    parser.add_argument('--money', type=float, default=100000.0, help='деньги на счете симулятора')
+    args = parser.parse_args()
+
+    replayer = MarketDataReplayer(args.path, speed=args.speed, money=args.money)
+    print(f"Загружено сообщений: {len(replayer.messages)}, инструментов: {len(replayer.instruments)}")
+    robots = []
+    for instrument in replayer.instruments.values():
+        params = TICKER_PARAMS.get(instrument.ticker, DEFAULT_PARAMS)
+        strategy = RSIStrategy(
+            rsi_len=params['rsi_len'],
+            trade_count=params['trade_count'],
+            min_range=params['min_range'],
+            take_profit=params['take_profit'],
+            stop_loss=params['stop_loss'],
+            trailing_stop=0.01,
+        )
+        factory = TradingRobotFactory(replayer.token, replayer.account_id, figi=instrument.figi,
+                                      client_factory=replayer.client)
+        robot = factory.create_robot(strategy, sandbox_mode=True)
+        robot.enable_latency_tracking()
+        robots.append(robot)
+
+    started = time.perf_counter()
+    for robot in robots:
+        robot.trade(stop_event=replayer.finished)
+        replayer.finished.clear()
+    elapsed = time.perf_counter() - started
+
+    for order in replayer.orders.values():
+        print(f"{order.created_at} {replayer.instruments[order.figi].ticker} {order.direction.name} "
+              f"{order.lots_executed}/{order.lots_requested} по {order.executed_price:.4f} ({order.status.name})")
+    print(f"Воспроизведено за {elapsed:.2f} с, {len(replayer.messages) / elapsed:.0f} сообщений/с")
+    for robot in robots:
+        print(f"{robot.robot_id} задержки, мкс (p50/p99/max): {robot.latency_tracker.format()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import os
+import threading
+from dotenv import load_dotenv
+
+from robotlib.fleet import TradingRobotFleetFactory
+from robotlib.ratelimit import RateLimiter
+from robotlib.sharding import ShardedFleetRunner
+from robotlib.stats import TradeStatisticsAnalyzer
+from robotlib.strategy import RSIStrategy
+from fleet_config import DATA_DIR, DEFAULT_PARAMS, STORE_PATH, TICKERS, TICKER_PARAMS
+
+load_dotenv()
+token = os.environ.get('TINKOFF_TOKEN')
+account_id = os.environ.get('TINKOFF_ACCOUNT')
+
+STATS_PATH = os.path.join(DATA_DIR, 'stats_{ticker}.pickle')
+JOURNAL_PATH = os.path.join(DATA_DIR, 'journal', '{ticker}')
+SHARDS = 4
+
+
+def make_strategy(ticker):
+    # Вызывается в процессе шарда, поэтому функция должна быть на уровне модуля
+    params = TICKER_PARAMS.get(ticker, DEFAULT_PARAMS)
+    strategy = RSIStrategy(
+        rsi_len=params['rsi_len'],
+        trade_count=params['trade_count'],
+        min_range=params['min_range'],
+        take_profit=params['take_profit'],
+        stop_loss=params['stop_loss'],
+        trailing_stop=0.01,
+    )
+
+    # Восстанавливаем entry_price, если есть открытая позиция
+    stats_path = STATS_PATH.format(ticker=ticker)
+    if not os.path.exists(stats_path) or os.path.getsize(stats_path) == 0:
+        return strategy
+    try:
+        stats = TradeStatisticsAnalyzer.load_from_file(stats_path)
+    except Exception as e:
+        # Пустой или поврежденный файл не должен останавливать весь шард, робот начнет без цены входа
+        print(f"❌ Не удалось загрузить stats_{ticker}.pickle: {e}")
+        return strategy
+    if stats.aggregates.position > 0:
+        # Средняя цена считается по всем исполнениям, в том числе по вытесненным из памяти заявкам
+        strategy.entry_price = stats.aggregates.average_price / (stats.instrument_info.lot or 1)
+    return strategy
+
+
+def main():
+    fleet = TradingRobotFleetFactory(token=token, account_id=account_id, tickers=TICKERS, logger_level='INFO')
+    stop_event = threading.Event()
+    runner = ShardedFleetRunner(fleet, make_strategy, shards=SHARDS, sandbox_mode=False,
+                                stats_path=STATS_PATH, journal_path=JOURNAL_PATH, store_path=STORE_PATH,
+                                stop_event=stop_event)
+    try:
+        runner.run()
+    except KeyboardInterrupt:
+        print("\nОстановка шардов по Ctrl+C. Ждём завершения и сохранения статистики...")
+        stop_event.set()
+    print("Торговля по всем тикерам завершена.")
+    print(f"Шарды: {runner.format_stats()}")
+    print(f"Ограничитель запросов к API: {RateLimiter.for_token(token).format_stats()}")
+
+
+if __name__ == '__main__':
+    main()
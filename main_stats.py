@@ -1,4 +1,29 @@
+import argparse
+import os
+
+from robotlib.portfolio import PortfolioSummary
 from robotlib.stats import BalanceProcessor, BalanceCalculator, TradeStatisticsAnalyzer
+from robotlib.store import TradeStore
+from fleet_config import DATA_DIR, STORE_PATH
+
+# Сводки по тикерам пересчитываются, только если файл статистики изменился
+CACHE_PATH = os.path.join(DATA_DIR, '.stats_summary_cache.json')
+
+TICKERS = [
+    ('MTSS', 'МТС'),
+    ('MOEX', 'Мосбиржа'),
+    ('VKCO', 'ВКонтакте'),
+    ('OZON', 'Озон'),
+    ('SBER', 'Сбербанк'),
+    ('GAZP', 'Газпром'),
+    ('LKOH', 'Лукойл'),
+    ('GMKN', 'Норникель'),
+    ('NVTK', 'Новатэк'),
+    ('PLZL', 'Полюс'),
+    ('ROSN', 'Роснефть'),
+    ('TATN', 'Татнефть'),
+    ('CHMF', 'Северсталь'),
+]
 
 
 def print_stats(stats_path, label):
@@ -12,6 +37,9 @@ def print_stats(stats_path, label):
     short, full = stats.get_report(processors=[BalanceProcessor()], calculators=[BalanceCalculator()])
 
     print(f"\n=== {label} ===")
+    if stats.evicted_orders:
+        print(f"В таблице только последние заявки: {len(stats.evicted_orders)} завершённых вытеснены из памяти. "
+              f"Итоги посчитаны по всем исполнениям.")
     print(full)
     print(short)
 
@@ -25,44 +53,58 @@ def print_stats(stats_path, label):
         print("\nℹ️  Доходность стратегии за период: 0 руб.")
     print(f"💸 Всего потрачено на комиссию: {commission:.2f} руб.")
 
+
+def print_store(labels):
+    # Заявки и результат по дням есть только в общей базе
+    store = TradeStore(STORE_PATH)
+    print("\nЗаявки в ожидании:")
+    for order in store.get_pending_orders():
+        print(f"- {labels.get(order.robot_id, order.robot_id)}: {order.direction.name} "
+              f"{order.lots_executed}/{order.lots_requested} лот(ов), {order.order_date}")
+    print("Результат по дням (закрытые лоты по средней цене позиции, комиссия, продажи минус покупки):")
+    for pnl in store.get_daily_pnl():
+        print(f"- {pnl.day} {labels.get(pnl.robot_id, pnl.robot_id)}: {pnl.realized_pnl:.2f} руб., "
+              f"комиссия {pnl.commission:.2f} руб., с комиссией {pnl.net_pnl:.2f} руб., "
+              f"денежный поток {pnl.cash_flow:.2f} руб., исполнений {pnl.fills}")
+
+
 def main():
-    tickers = [
-        ('MTSS', 'МТС'),
-        ('MOEX', 'Мосбиржа'),
-        ('VKCO', 'ВКонтакте'),
-        ('OZON', 'Озон'),
-        ('SBER', 'Сбербанк'),
-        ('GAZP', 'Газпром'),
-        ('LKOH', 'Лукойл'),
-        ('GMKN', 'Норникель'),
-        ('NVTK', 'Новатэк'),
-        ('PLZL', 'Полюс'),
-        ('ROSN', 'Роснефть'),
-        ('TATN', 'Татнефть'),
-        ('CHMF', 'Северсталь'),
-    ]
-    open_positions = []
-    for ticker, label in tickers:
-        stats_path = f'/Users/yaroslav/Петпроект/investRobot/stats_{ticker}.pickle'
-        try:
-            from robotlib.stats import TradeStatisticsAnalyzer, BalanceProcessor, BalanceCalculator
-            stats = TradeStatisticsAnalyzer.load_from_file(stats_path)
-            short, _ = stats.get_report(processors=[BalanceProcessor()], calculators=[BalanceCalculator()])
-            if short.get('final_instrument_balance', 0) > 0:
-                open_positions.append((label, short['final_instrument_balance']))
-        except Exception:
-            continue
-
-    print("Открытые позиции:")
+    parser = argparse.ArgumentParser(description='Сводка по статистике всех тикеров')
+    parser.add_argument('--full', action='store_true', help='вывести полную статистику по каждому тикеру')
+    parser.add_argument('--processes', action='store_true', help='загружать файлы в пуле процессов, а не потоков')
+    parser.add_argument('--no-cache', action='store_true', help='пересчитать сводки всех тикеров')
+    args = parser.parse_args()
+
+    labels = dict(TICKERS)
+    portfolio = PortfolioSummary(
+        paths={ticker: os.path.join(DATA_DIR, f'stats_{ticker}.pickle') for ticker, _ in TICKERS},
+        cache_path=None if args.no_cache else CACHE_PATH,
+        use_processes=args.processes,
+    )
+    summaries = portfolio.load()
+    print(PortfolioSummary.format_table(summaries, labels))
+
+    open_positions = [summary for summary in summaries if summary.has_open_position]
+    print("\nОткрытые позиции:")
     if open_positions:
-        for label, lots in open_positions:
-            print(f"- {label}: {lots} лот(ов)")
+        for summary in open_positions:
+            print(f"- {labels[summary.ticker]}: {summary.final_instrument_balance} лот(ов)")
     else:
         print("Нет открытых позиций.")
 
-    # Старый вывод полной статистики
-    for ticker, label in tickers:
-        print_stats(f'/Users/yaroslav/Петпроект/investRobot/stats_{ticker}.pickle', label)
+    broken = [summary for summary in summaries if summary.error and summary.error != 'file not found']
+    if broken:
+        print("\n‼️  Файлы статистики, которые не удалось прочитать:")
+        for summary in broken:
+            print(f"- {summary.path}: {summary.error}")
+
+    if os.path.exists(STORE_PATH):
+        print_store(labels)
+
+    if args.full:
+        for ticker, label in TICKERS:
+            print_stats(os.path.join(DATA_DIR, f'stats_{ticker}.pickle'), label)
+
 
 if __name__ == '__main__':
     main()
@@ -7,7 +7,7 @@ from dotenv import load_dotenv
 with warnings.catch_warnings():
     warnings.filterwarnings("ignore", category=UserWarning, module="google.protobuf.symbol_database")
 
-from robotlib.robot import TradingRobotFactory
+from robotlib.fleet import TradingRobotFleetFactory
 from robotlib.strategy import RSIStrategy
 
 # --- Список тикеров третьего эшелона, которые реально торгуются (исключены ROSB, LSNGP, BLNG, BSPBP, NMTP) ---
@@ -44,7 +44,7 @@ account_id = os.environ.get('TINKOFF_ACCOUNT')
 
 stop_event = threading.Event()
 
-def trade_for_ticker(ticker, class_code):
+def trade_for_ticker(ticker, robot_factory):
     print(f"Запуск торговли для {ticker}")
     from robotlib.stats import TradeStatisticsAnalyzer, BalanceProcessor
     stats_path = f'/Users/yaroslav/Петпроект/investRobot/stats_{ticker}.pickle'
@@ -61,7 +61,6 @@ def trade_for_ticker(ticker, class_code):
         print(f"❌ Не удалось загрузить stats_{ticker}.pickle: {e}")
         stats = None
 
-    robot_factory = TradingRobotFactory(token=token, account_id=account_id, ticker=ticker, class_code=class_code, logger_level='INFO')
     strategy = RSIStrategy(
         rsi_len=THIRD_TIER_PARAMS['rsi_len'],
         trade_count=THIRD_TIER_PARAMS['trade_count'],
@@ -107,9 +106,11 @@ def trade_for_ticker(ticker, class_code):
     print(f"Торговля по {ticker} завершена. Файл статистики: stats_{ticker}.pickle")
 
 def main():
+    # Инструменты, аккаунт и позиции загружаются один раз для всех тикеров
+    fleet = TradingRobotFleetFactory(token=token, account_id=account_id, tickers=TICKERS_THIRD_TIER, logger_level='INFO')
     threads = []
-    for ticker, class_code in TICKERS_THIRD_TIER:
-        t = threading.Thread(target=trade_for_ticker, args=(ticker, class_code))
+    for ticker in fleet.tickers:
+        t = threading.Thread(target=trade_for_ticker, args=(ticker, fleet.get_factory(ticker)))
         t.start()
         threads.append(t)
     try:
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import logging
+import threading
+import uuid
+
+from dataclasses import dataclass
+from typing import Callable
+
+from tinkoff.invest import Client, Instrument, MoneyValue, OrderDirection, PositionsResponse
+from tinkoff.invest.exceptions import InvestError
+
+from robotlib.ratelimit import RateLimiter, RequestPriority
+
+
+@dataclass
+class CashReservation:
+    reservation_id: str
+    robot_id: str
+    currency: str
+    amount: float
+
+
+class AccountLedger:
+    """
+    Single in-process view of one account shared by all robots trading on it. Cash and positions are kept in sync
+    by the broker positions stream (polling in sandbox, which has no streams), so get_money/get_positions need
+    no RPCs. Every robot gets its own cash budget; buy orders reserve cash from it under a lock, so robots
+    never spend the same money twice.
+    """
+    APP_NAME = 'karpp'
+
+    token: str
+    account_id: str
+    sandbox_mode: bool
+    logger: logging.Logger
+    poll_interval: float
+    money: dict[str, float]  # currency -> cash on account
+    securities: dict[str, int]  # figi -> balance in pieces
+    budgets: dict[str, float]  # robot_id -> cash available to the robot, reservations included
+    reservations: dict[str, CashReservation]
+    client_factory: Callable[..., Client]
+
+    def __init__(self, token: str, account_id: str, sandbox_mode: bool,  # pylint:disable=too-many-arguments
+                 positions: PositionsResponse = None, logger: logging.Logger = None, poll_interval: float = 5.0,
+                 client_factory: Callable[..., Client] = Client):
+        self.token = token
+        self.account_id = account_id
+        self.sandbox_mode = sandbox_mode
+        self.logger = logger or logging.getLogger('robot.account')
+        self.poll_interval = poll_interval
+        self.money = {}
+        self.securities = {}
+        self.budgets = {}
+        self.reservations = {}
+        self.client_factory = client_factory
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        if positions is not None:
+            self.apply_positions(positions)
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._sync, daemon=True, name='account-ledger')
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def allocate(self, robot_id: str, amount: float) -> None:
+        with self._lock:
+            self.budgets[robot_id] = amount
+
+    def allocate_equally(self, robot_ids: list[str], currency: str) -> None:
+        with self._lock:
+            share = self.money.get(currency, 0.0) / max(len(robot_ids), 1)
+            for robot_id in robot_ids:
+                self.budgets[robot_id] = share
+
+    def get_money(self, robot_id: str, currency: str) -> float:
+        """
+        Cash the robot can spend now: the rest of its budget, but never more than unreserved cash on account
+        """
+        with self._lock:
+            account_free = self.money.get(currency, 0.0) - self._reserved(currency=currency)
+            if robot_id not in self.budgets:
+                return max(account_free, 0.0)
+            robot_free = self.budgets[robot_id] - self._reserved(robot_id=robot_id)
+            return max(min(robot_free, account_free), 0.0)
+
+    def get_positions(self, instrument_info: Instrument) -> int:
+        """
+        Instrument balance in lots
+        """
+        return self.securities.get(instrument_info.figi, 0) // max(instrument_info.lot, 1)
+
+    def reserve(self, robot_id: str, currency: str, amount: float) -> CashReservation | None:
+        with self._lock:
+            account_free = self.money.get(currency, 0.0) - self._reserved(currency=currency)
+            robot_free = self.budgets.get(robot_id, account_free) - self._reserved(robot_id=robot_id)
+            if amount > min(account_free, robot_free):
+                return None
+            reservation = CashReservation(reservation_id=str(uuid.uuid4()), robot_id=robot_id,
+                                          currency=currency, amount=amount)
+            self.reservations[reservation.reservation_id] = reservation
+            return reservation
+
+    def release(self, reservation: CashReservation | None) -> None:
+        if reservation is None:
+            return
+        with self._lock:
+            self.reservations.pop(reservation.reservation_id, None)
+
+    def apply_fill(self, robot_id: str, direction: OrderDirection, amount: float,
+                   reservation: CashReservation = None) -> None:
+        """
+        Moves the executed amount in or out of the robot budget and drops its reservation.
+        Account cash itself is updated by the positions stream
+        """
+        sign = -1 if direction == OrderDirection.ORDER_DIRECTION_BUY else 1
+        with self._lock:
+            if reservation is not None:
+                self.reservations.pop(reservation.reservation_id, None)
+            if robot_id in self.budgets:
+                self.budgets[robot_id] += sign * amount
+
+    def apply_positions(self, positions: PositionsResponse) -> None:
+        with self._lock:
+            self.money = {money.currency: self._to_float(money) for money in positions.money}
+            self.securities = {security.figi: security.balance for security in positions.securities}
+
+    def refresh(self) -> None:
+        with self.client_factory(self.token, app_name=self.APP_NAME) as client:
+            RateLimiter.for_token(self.token).acquire('sandbox' if self.sandbox_mode else 'operations',
+                                                      RequestPriority.POLLING)
+            if self.sandbox_mode:
+                positions = client.sandbox.get_sandbox_positions(account_id=self.account_id)
+            else:
+                positions = client.operations.get_positions(account_id=self.account_id)
+        self.apply_positions(positions)
+
+    def _sync(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                if self.sandbox_mode:
+                    self.refresh()
+                    self._stop_event.wait(self.poll_interval)
+                else:
+                    self._consume_positions_stream()
+            except InvestError as error:
+                self.logger.warning(f'Positions sync failed: {error}')
+                self._stop_event.wait(self.poll_interval)
+
+    def _consume_positions_stream(self) -> None:
+        # full snapshot first, the stream then sends only changed positions
+        self.refresh()
+        with self.client_factory(self.token, app_name=self.APP_NAME) as client:
+            for response in client.operations_stream.positions_stream(accounts=[self.account_id]):
+                if self._stop_event.is_set():
+                    return
+                if response.position:
+                    self._apply_position_update(response.position)
+
+    def _apply_position_update(self, position) -> None:
+        with self._lock:
+            for money in position.money:
+                value = money.available_value
+                self.money[value.currency] = self._to_float(value)
+            for security in position.securities:
+                self.securities[security.figi] = security.balance
+        self.logger.debug(f'Positions updated: money={self.money}')
+
+    def _reserved(self, robot_id: str = None, currency: str = None) -> float:
+        return sum(reservation.amount for reservation in self.reservations.values()
+                   if (robot_id is None or reservation.robot_id == robot_id)
+                   and (currency is None or reservation.currency == currency))
+
+    @staticmethod
+    def _to_float(amount: MoneyValue) -> float:
+        return amount.units + amount.nano / (10 ** 9)
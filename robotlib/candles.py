@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+from array import array
+
+import numpy as np
+
+from tinkoff.invest import HistoricCandle
+
+from robotlib.money import MoneyArray
+
+
+class CandleFrame:
+    """
+    Candles as columns: `time` (datetime64[s], UTC), `open`, `high`, `low`, `close` (float64) and `volume` (int64).
+    A year of minute candles takes about 20 MB instead of hundreds of megabytes of HistoricCandle objects,
+    slices are views and aggregation is done by numpy in one pass.
+    """
+    __slots__ = ('time', 'open', 'high', 'low', 'close', 'volume')
+
+    time: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    def __init__(self, time: np.ndarray, open_: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                 volume: np.ndarray = None):
+        self.time = np.asarray(time, dtype='datetime64[s]')
+        self.open = np.asarray(open_, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.volume = np.zeros(len(self.time), dtype=np.int64) if volume is None else \
+            np.asarray(volume, dtype=np.int64)
+
+    @classmethod
+    def from_candles(cls, candles: list[HistoricCandle]) -> CandleFrame:
+        count = len(candles)
+        return cls(
+            time=np.fromiter((candle.time.timestamp() for candle in candles), np.int64, count),
+            open_=MoneyArray.from_quotations([candle.open for candle in candles]).to_float(),
+            high=MoneyArray.from_quotations([candle.high for candle in candles]).to_float(),
+            low=MoneyArray.from_quotations([candle.low for candle in candles]).to_float(),
+            close=MoneyArray.from_quotations([candle.close for candle in candles]).to_float(),
+            volume=np.fromiter((candle.volume for candle in candles), np.int64, count),
+        )
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def __getitem__(self, item: slice) -> CandleFrame:
+        if not isinstance(item, slice):
+            raise TypeError(f'CandleFrame supports only slices, got {type(item).__name__}')
+        return CandleFrame(self.time[item], self.open[item], self.high[item], self.low[item], self.close[item],
+                           self.volume[item])
+
+    def index_range(self, start: np.datetime64 = None, end: np.datetime64 = None) -> tuple[int, int]:
+        """
+        Index range of candles with start <= time < end, candles must be sorted by time
+        """
+        first = 0 if start is None else int(np.searchsorted(self.time, np.datetime64(start, 's'), side='left'))
+        last = len(self) if end is None else int(np.searchsorted(self.time, np.datetime64(end, 's'), side='left'))
+        return first, max(first, last)
+
+    @staticmethod
+    def bucket_starts(buckets: int, start: int, stop: int) -> np.ndarray:
+        """
+        First candle index of every bucket of aggregate(); every candle is a bucket if there are not more of them
+        """
+        if stop - start <= buckets:
+            return np.arange(start, stop)
+        return np.linspace(start, stop, buckets + 1).astype(np.int64)[:-1]
+
+    def aggregate(self, buckets: int, start: int = 0, stop: int = None) -> CandleFrame:
+        """
+        Candles [start, stop) merged into at most `buckets` candles of equal count: open of the first, close of
+        the last, the highest high and the lowest low, so every extreme of the original candles stays on the chart
+        """
+        stop = len(self) if stop is None else stop
+        if stop - start <= buckets:
+            return self[start:stop]
+        starts = self.bucket_starts(buckets, start, stop)
+        ends = np.append(starts[1:], stop)
+        offsets = starts - start
+        return CandleFrame(
+            time=self.time[starts],
+            open_=self.open[starts],
+            high=np.maximum.reduceat(self.high[start:stop], offsets),
+            low=np.minimum.reduceat(self.low[start:stop], offsets),
+            close=self.close[ends - 1],
+            volume=np.add.reduceat(self.volume[start:stop], offsets),
+        )
+
+
+class CandleFrameBuilder:
+    """
+    Collects candles one by one into compact arrays, for a backtest that goes over a candle iterator once
+    """
+
+    def __init__(self):
+        self._time = array('q')
+        self._open = array('d')
+        self._high = array('d')
+        self._low = array('d')
+        self._close = array('d')
+        self._volume = array('q')
+
+    def __len__(self) -> int:
+        return len(self._time)
+
+    def append(self, candle: HistoricCandle) -> None:
+        self._time.append(int(candle.time.timestamp()))
+        self._open.append(candle.open.units + candle.open.nano / 1e9)
+        self._high.append(candle.high.units + candle.high.nano / 1e9)
+        self._low.append(candle.low.units + candle.low.nano / 1e9)
+        self._close.append(candle.close.units + candle.close.nano / 1e9)
+        self._volume.append(candle.volume)
+
+    def build(self) -> CandleFrame:
+        return CandleFrame(
+            time=np.frombuffer(self._time, dtype=np.int64).copy(),
+            open_=np.frombuffer(self._open, dtype=np.float64).copy(),
+            high=np.frombuffer(self._high, dtype=np.float64).copy(),
+            low=np.frombuffer(self._low, dtype=np.float64).copy(),
+            close=np.frombuffer(self._close, dtype=np.float64).copy(),
+            volume=np.frombuffer(self._volume, dtype=np.int64).copy(),
+        )
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of `threshold` points of a line that keep its visual shape.
+    The first and the last points are always kept
+    """
+    count = len(x)
+    if threshold >= count or threshold < 3:
+        return np.arange(count)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, count - 1, threshold - 1).astype(np.int64)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = count - 1
+    selected = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        # третья вершина - среднее следующей корзины (для последней - последняя точка)
+        next_stop = edges[i + 2] if i + 2 < len(edges) else count
+        next_start = stop if i + 2 < len(edges) else count - 1
+        avg_x = x[next_start:next_stop].mean()
+        avg_y = y[next_start:next_stop].mean()
+        point_x, point_y = x[selected], y[selected]
+        areas = np.abs((point_x - avg_x) * (y[start:stop] - point_y) - (point_x - x[start:stop]) * (avg_y - point_y))
+        selected = start + int(areas.argmax())
+        indices[i + 1] = selected
+    return indices
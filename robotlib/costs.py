@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import math
+
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+
+class CostModel(ABC):
+    """
+    Trading costs of a fill: broker commission and slippage (half spread plus price impact growing with order size).
+    Every cost has a scalar method for live decisions and an array method for a whole backtest ledger at once.
+    Amounts are in currency, quantities are in lots, sign is 1 for a buy and -1 for a sell.
+    """
+
+    @abstractmethod
+    def commission(self, amount: float) -> float:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def commissions(self, amounts: np.ndarray) -> np.ndarray:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def slippage(self, quantity: int) -> float:
+        """
+        Price shift relative to the quoted price for an order of `quantity` lots
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def slippages(self, quantities: np.ndarray) -> np.ndarray:
+        raise NotImplementedError()
+
+    def fill_price(self, price: float, quantity: int, sign: int) -> float:
+        """
+        Expected fill price: buys fill above the quoted price, sells below
+        """
+        return price * (1 + sign * self.slippage(quantity))
+
+    def fill_prices(self, prices: np.ndarray, quantities: np.ndarray, signs: np.ndarray) -> np.ndarray:
+        return prices * (1 + signs * self.slippages(quantities))
+
+    def buy_cost(self, price: float, quantity: int, lot: int = 1) -> float:
+        """
+        Cash needed to buy `quantity` lots quoted at `price`: the amount at the fill price plus the commission
+        """
+        amount = quantity * lot * self.fill_price(price, quantity, 1)
+        return amount + self.commission(amount)
+
+    def affordable_lots(self, cash: float, price: float, lot: int = 1, limit: int = None) -> int:
+        """
+        Most lots, at most `limit`, whose buy_cost fits into `cash`
+        """
+        quantity = max(0, math.floor(cash / (price * lot)))
+        if limit is not None:
+            quantity = min(quantity, limit)
+        while quantity > 0 and self.buy_cost(price, quantity, lot) > cash:
+            quantity -= 1
+        return quantity
+
+    def round_trip_cost(self, amount: float, quantity: int = 1) -> float:
+        """
+        Costs of buying and then selling `quantity` lots worth `amount`, strategies use it as the minimal profit
+        """
+        return 2 * (self.commission(amount) + amount * self.slippage(quantity))
+
+    def ledger_costs(self, prices: np.ndarray, quantities: np.ndarray, signs: np.ndarray, lot: int = 1)\
+            -> tuple[np.ndarray, np.ndarray]:
+        """
+        Fill prices and commissions of every ledger row in one call
+        """
+        fill_prices = self.fill_prices(prices, quantities, signs)
+        return fill_prices, self.commissions(fill_prices * quantities * lot)
+
+
+class TariffCostModel(CostModel):
+    """
+    Commission as a share of the amount with a minimum per fill, as in broker tariffs, plus linear slippage:
+    `half_spread + impact * quantity` of the price
+    """
+    # commission rate per fill of Tinkoff tariffs
+    TARIFFS = {
+        'investor': 0.003,
+        'trader': 0.0005,
+        'premium': 0.0004,
+    }
+
+    rate: float
+    min_commission: float
+    half_spread: float
+    impact: float
+
+    def __init__(self, rate: float = 0.0005, min_commission: float = 0.01, half_spread: float = 0.0,
+                 impact: float = 0.0):
+        self.rate = rate
+        self.min_commission = min_commission
+        self.half_spread = half_spread
+        self.impact = impact
+
+    @classmethod
+    def for_tariff(cls, tariff: str, **kwargs) -> TariffCostModel:
+        if tariff not in cls.TARIFFS:
+            raise ValueError(f'Unknown tariff {tariff}, known are {", ".join(cls.TARIFFS)}')
+        return cls(rate=cls.TARIFFS[tariff], **kwargs)
+
+    def commission(self, amount: float) -> float:
+        return max(abs(amount) * self.rate, self.min_commission)
+
+    def commissions(self, amounts: np.ndarray) -> np.ndarray:
+        return np.maximum(np.abs(amounts) * self.rate, self.min_commission)
+
+    def slippage(self, quantity: int) -> float:
+        return self.half_spread + self.impact * abs(quantity)
+
+    def slippages(self, quantities: np.ndarray) -> np.ndarray:
+        return self.half_spread + self.impact * np.abs(quantities)
+
+    def __repr__(self) -> str:
+        return f'TariffCostModel(rate={self.rate}, min_commission={self.min_commission}, ' \
+               f'half_spread={self.half_spread}, impact={self.impact})'
+
+
+# Tinkoff "Trader" tariff, the costs all strategies and reports assumed before cost models
+DEFAULT_COST_MODEL = TariffCostModel()
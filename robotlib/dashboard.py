@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from robotlib.events import CANDLE, LOG, MAX_CANDLES, MAX_TRADES, TRADE, EventBus, FleetState, RobotEvent
+
+PAGE = """<!DOCTYPE html>
+<html lang="ru">
+<head>
+<meta charset="utf-8">
+<title>Торговые роботы</title>
+<script src="/plotly.js"></script>
+<style>
+body { font-family: sans-serif; margin: 16px; }
+table { border-collapse: collapse; font-size: 14px; }
+th, td { padding: 3px 10px; text-align: right; border-bottom: 1px solid #ddd; }
+th:first-child, td:first-child { text-align: left; }
+tr.selected { background: #eef; }
+tbody tr { cursor: pointer; }
+.up { color: green; } .down { color: red; }
+#status { color: #888; margin-bottom: 8px; }
+</style>
+</head>
+<body>
+<div id="status">Подключение...</div>
+<div id="chart" style="height: 420px;"></div>
+<table>
+<thead><tr><th>Тикер</th><th>Цена</th><th>Позиция</th><th>Деньги</th><th>Капитал</th><th>Результат</th>
+<th>Сделок</th><th>Задержка p50/p99, мкс</th></tr></thead>
+<tbody id="robots"></tbody>
+</table>
+<script>
+let robots = {};
+let selected = null;
+const changed = new Set();
+
+function robot(id) {
+    if (!robots[id]) robots[id] = {candles: [], trades: [], pnl: {}, latency: {}};
+    return robots[id];
+}
+
+function apply(kind, id, data) {
+    const state = robot(id);
+    if (kind === 'candle') {
+        const candle = [data.time, data.open, data.high, data.low, data.close];
+        const last = state.candles[state.candles.length - 1];
+        if (last && last[0] === candle[0]) state.candles[state.candles.length - 1] = candle;
+        else { state.candles.push(candle); if (state.candles.length > MAX_CANDLES) state.candles.shift(); }
+    } else if (kind === 'trade') {
+        state.trades.push([data.time, data.direction, data.lots, data.price]);
+        if (state.trades.length > MAX_TRADES) state.trades.shift();
+    } else if (kind === 'pnl') {
+        state.pnl = data;
+    } else if (kind === 'latency') {
+        state.latency = data;
+    }
+    changed.add(id);
+}
+
+function number(value, digits) {
+    return value === undefined || value === null ? '' : value.toFixed(digits);
+}
+
+function renderRow(id) {
+    const state = robots[id];
+    let row = document.getElementById('robot-' + id);
+    if (!row) {
+        row = document.createElement('tr');
+        row.id = 'robot-' + id;
+        row.onclick = () => { selected = id; changed.add(id); renderTable(); };
+        const rows = document.getElementById('robots');
+        const next = Array.from(rows.children).find(other => other.id > row.id);
+        rows.insertBefore(row, next || null);
+    }
+    const last = state.candles[state.candles.length - 1];
+    const total = state.latency.total || {};
+    const pnl = state.pnl.net_pnl;
+    row.className = id === selected ? 'selected' : '';
+    row.innerHTML = `<td>${id}</td><td>${last ? number(last[4], 2) : ''}</td><td>${state.pnl.positions ?? ''}</td>`
+        + `<td>${number(state.pnl.money, 2)}</td><td>${number(state.pnl.equity, 2)}</td>`
+        + `<td class="${pnl > 0 ? 'up' : pnl < 0 ? 'down' : ''}">${number(pnl, 2)}</td>`
+        + `<td>${state.pnl.fills ?? ''}</td><td>${number(total.p50, 0)} / ${number(total.p99, 0)}</td>`;
+}
+
+function renderTable() {
+    for (const row of document.getElementById('robots').children) {
+        row.className = row.id === 'robot-' + selected ? 'selected' : '';
+    }
+}
+
+function renderChart() {
+    const state = robots[selected];
+    if (!state) return;
+    const time = value => new Date(value * 1000);
+    const trace = {
+        type: 'candlestick', name: selected, x: state.candles.map(c => time(c[0])),
+        open: state.candles.map(c => c[1]), high: state.candles.map(c => c[2]),
+        low: state.candles.map(c => c[3]), close: state.candles.map(c => c[4]),
+    };
+    const marks = (direction, symbol, color, name) => {
+        const trades = state.trades.filter(t => t[1] === direction);
+        return {type: 'scatter', mode: 'markers', name: name, x: trades.map(t => time(t[0])),
+                y: trades.map(t => t[3]), marker: {symbol: symbol, color: color, size: 10}};
+    };
+    Plotly.react('chart', [trace, marks('buy', 'triangle-up', 'green', 'Покупки'),
+                           marks('sell', 'triangle-down', 'red', 'Продажи')],
+                 {title: selected, xaxis: {rangeslider: {visible: false}}, margin: {t: 40}, uirevision: selected});
+}
+
+// Перерисовка не чаще раза в секунду, сколько бы событий ни пришло
+setInterval(() => {
+    if (selected === null) selected = Object.keys(robots).sort()[0] ?? null;
+    const chartChanged = changed.has(selected);
+    for (const id of changed) renderRow(id);
+    changed.clear();
+    if (chartChanged) renderChart();
+}, 1000);
+
+const MAX_CANDLES = %(max_candles)d;
+const MAX_TRADES = %(max_trades)d;
+const source = new EventSource('/events');
+source.addEventListener('snapshot', event => {
+    robots = JSON.parse(event.data);
+    document.getElementById('robots').innerHTML = '';
+    Object.keys(robots).forEach(id => changed.add(id));
+});
+source.addEventListener('delta', event => {
+    for (const [kind, id, data] of JSON.parse(event.data)) apply(kind, id, data);
+});
+source.onopen = () => { document.getElementById('status').textContent = 'Подключено'; };
+source.onerror = () => { document.getElementById('status').textContent = 'Нет связи с роботами, переподключение...'; };
+</script>
+</body>
+</html>
+"""
+
+
+class DashboardServer:
+    """
+    Local HTTP dashboard of a robot fleet. Robots publish events to an EventBus; the server keeps the fleet state
+    from them and streams it to browsers over Server-Sent Events: a full snapshot on connect, then batches of new
+    events every `poll_interval`. Trading threads never wait for the server or for clients.
+    """
+
+    bus: EventBus
+    state: FleetState
+    host: str
+    port: int
+    poll_interval: float
+    heartbeat_interval: float
+    logger: logging.Logger
+
+    def __init__(self, bus: EventBus, host: str = '127.0.0.1', port: int = 8050, poll_interval: float = 0.5,
+                 heartbeat_interval: float = 15.0, logger: logging.Logger = None):
+        self.bus = bus
+        self.state = FleetState(bus)
+        self.host = host
+        self.port = port
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.logger = logger or logging.getLogger('robot.dashboard')
+        self._stop = threading.Event()
+        self._server = None
+        self._threads = []
+        self._plotly_js = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}/'
+
+    def start(self) -> DashboardServer:
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._threads = [
+            threading.Thread(target=self._server.serve_forever, daemon=True, name='dashboard-http'),
+            threading.Thread(target=self._update_loop, daemon=True, name='dashboard-state'),
+        ]
+        for thread in self._threads:
+            thread.start()
+        self.logger.info(f'Dashboard is running at {self.url}')
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+
+    def _update_loop(self) -> None:
+        # the state follows the bus even without clients, so it is not lost when events are dropped from the bus
+        while not self._stop.wait(self.poll_interval):
+            self.state.update()
+
+    def plotly_js(self) -> bytes:
+        if self._plotly_js is None:
+            from plotly.offline import get_plotlyjs
+            self._plotly_js = get_plotlyjs().encode()
+        return self._plotly_js
+
+    @staticmethod
+    def page() -> bytes:
+        return (PAGE % {'max_candles': MAX_CANDLES, 'max_trades': MAX_TRADES}).encode()
+
+    def stream(self, write) -> None:
+        """
+        Writes SSE messages with `write` until the client disconnects or the server stops
+        """
+        self.state.update()
+        seq, robots = self.state.snapshot()
+        write(self._message('snapshot', robots))
+        last_write = time.monotonic()
+        while not self._stop.wait(self.poll_interval):
+            events, lost = self.bus.read(seq)
+            if lost:
+                # the client fell behind the bus, it gets the whole state again
+                self.state.update()
+                seq, robots = self.state.snapshot()
+                write(self._message('snapshot', robots))
+                last_write = time.monotonic()
+            elif events:
+                seq = events[-1].seq
+                write(self._message('delta', [[event.kind, event.robot_id, event.data]
+                                              for event in self.compact(events)]))
+                last_write = time.monotonic()
+            elif time.monotonic() - last_write >= self.heartbeat_interval:
+                write(b': ping\n\n')
+                last_write = time.monotonic()
+
+    @staticmethod
+    def compact(events: list[RobotEvent]) -> list[RobotEvent]:
+        """
+        Drops events replaced by later ones in the same batch: older updates of the same bar, P&L and latency.
+        Every trade is kept, log records are not shown on the page and are dropped
+        """
+        latest = {}
+        for event in events:
+            if event.kind == LOG:
+                continue
+            if event.kind == TRADE:
+                key = event.seq
+            elif event.kind == CANDLE:
+                key = (event.kind, event.robot_id, event.data['time'])
+            else:
+                key = (event.kind, event.robot_id)
+            latest.pop(key, None)
+            latest[key] = event
+        return list(latest.values())
+
+    @staticmethod
+    def _message(event: str, data) -> bytes:
+        return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'.encode()
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        dashboard = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):  # pylint:disable=invalid-name
+                if self.path == '/':
+                    self._send(dashboard.page(), 'text/html; charset=utf-8')
+                elif self.path == '/plotly.js':
+                    self._send(dashboard.plotly_js(), 'application/javascript', cache=True)
+                elif self.path == '/state':
+                    dashboard.state.update()
+                    self._send(json.dumps(dashboard.state.snapshot()[1]).encode(), 'application/json')
+                elif self.path == '/events':
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/event-stream')
+                    self.send_header('Cache-Control', 'no-cache')
+                    self.end_headers()
+                    try:
+                        dashboard.stream(self._write)
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+                else:
+                    self.send_error(404)
+
+            def _send(self, body: bytes, content_type: str, cache: bool = False):
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Cache-Control', 'max-age=86400' if cache else 'no-cache')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _write(self, data: bytes):
+                self.wfile.write(data)
+                self.wfile.flush()
+
+            def log_message(self, format, *args):  # pylint:disable=redefined-builtin
+                dashboard.logger.debug(f'{self.address_string()} {format % args}')
+
+        return Handler
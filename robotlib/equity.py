@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import math
+
+from dataclasses import dataclass
+
+from robotlib.stats import TradeAggregates
+
+
+class RunningMoments:
+    """
+    Mean and variance by Welford's algorithm, plus the downside deviation (below zero) for Sortino
+    """
+
+    count: int
+    mean: float
+    m2: float
+    downside_sum: float
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.downside_sum = 0.0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < 0:
+            self.downside_sum += value * value
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    @property
+    def downside_std(self) -> float:
+        return math.sqrt(self.downside_sum / self.count) if self.count else 0.0
+
+
+@dataclass
+class EquityMetrics:
+    bars: int
+    equity: float
+    peak_equity: float
+    max_drawdown: float
+    max_drawdown_pct: float
+    sharpe: float
+    sortino: float
+    exposure: float  # share of bars with an open position
+    profit_factor: float
+    fills: int
+    net_pnl: float  # realized, net of commission
+
+
+class EquityTracker:
+    """
+    Marks cash plus the open position to every bar close and keeps risk metrics of the equity curve online, in O(1)
+    memory: Sharpe and Sortino of per-bar equity changes, max drawdown, exposure time and profit factor of closed
+    trades. Usable for backtests over millions of bars and live (see TradeStatisticsAnalyzer.attach_equity).
+    Sharpe and Sortino are per bar, or annualized when `periods_per_year` is given.
+    """
+
+    cash: float
+    positions: int
+    lot: int
+    periods_per_year: float | None
+    equity: float | None
+    peak_equity: float | None
+    max_drawdown: float
+    max_drawdown_pct: float
+    bars: int
+    exposed_bars: int
+    returns: RunningMoments
+    trades: TradeAggregates
+
+    def __init__(self, cash: float = 0.0, positions: int = 0, lot: int = 1, periods_per_year: float = None):
+        self.cash = cash
+        self.positions = positions
+        self.lot = lot
+        self.periods_per_year = periods_per_year
+        self.equity = None
+        self.peak_equity = None
+        self.max_drawdown = 0.0
+        self.max_drawdown_pct = 0.0
+        self.bars = 0
+        self.exposed_bars = 0
+        self.returns = RunningMoments()
+        self.trades = TradeAggregates()
+
+    def add_fill(self, sign: int, lots: int, amount: float, commission: float = 0.0) -> None:
+        """
+        Fill of `lots` lots for `amount` in total, sign is 1 for a buy and -1 for a sell
+        """
+        self.cash -= amount * sign + commission
+        self.positions += lots * sign
+        self.trades.add_fill(sign, lots, amount, commission)
+
+    def mark(self, price: float) -> float:
+        """
+        Values the position at `price` per instrument unit, returns the equity
+        """
+        equity = self.cash + self.positions * self.lot * price
+        if self.equity is not None:
+            self.returns.add(equity - self.equity)
+        self.equity = equity
+        self.bars += 1
+        if self.positions:
+            self.exposed_bars += 1
+        if self.peak_equity is None or equity > self.peak_equity:
+            self.peak_equity = equity
+        drawdown = self.peak_equity - equity
+        if drawdown > self.max_drawdown:
+            self.max_drawdown = drawdown
+        if self.peak_equity > 0 and drawdown / self.peak_equity > self.max_drawdown_pct:
+            self.max_drawdown_pct = drawdown / self.peak_equity
+        return equity
+
+    @property
+    def sharpe(self) -> float:
+        std = self.returns.std
+        return self.returns.mean / std * self._annualization() if std else 0.0
+
+    @property
+    def sortino(self) -> float:
+        downside = self.returns.downside_std
+        return self.returns.mean / downside * self._annualization() if downside else 0.0
+
+    def _annualization(self) -> float:
+        return math.sqrt(self.periods_per_year) if self.periods_per_year else 1.0
+
+    def metrics(self) -> EquityMetrics:
+        return EquityMetrics(
+            bars=self.bars,
+            equity=self.equity if self.equity is not None else self.cash,
+            peak_equity=self.peak_equity if self.peak_equity is not None else self.cash,
+            max_drawdown=self.max_drawdown,
+            max_drawdown_pct=self.max_drawdown_pct,
+            sharpe=self.sharpe,
+            sortino=self.sortino,
+            exposure=self.exposed_bars / self.bars if self.bars else 0.0,
+            profit_factor=self.trades.profit_factor,
+            fills=self.trades.fills,
+            net_pnl=self.trades.net_pnl,
+        )
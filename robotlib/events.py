@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import collections
+import itertools
+import logging
+import threading
+import time
+
+from typing import NamedTuple
+
+CANDLE = 'candle'
+TRADE = 'trade'
+PNL = 'pnl'
+LATENCY = 'latency'
+LOG = 'log'
+STATE = 'state'
+
+MAX_CANDLES = 300
+MAX_TRADES = 200
+
+
+class RobotEvent(NamedTuple):
+    seq: int
+    time: float
+    kind: str
+    robot_id: str
+    data: dict
+
+
+class EventBus:
+    """
+    In-memory log of compact robot events (candles, trades, P&L, latency) for dashboards. Robots publish without
+    waiting for readers: publish() only appends to a bounded deque. Readers keep the sequence number of the last
+    event they have seen and poll read() for newer ones; events older than `maxlen` are dropped, a reader that fell
+    that far behind is told so and should reload the full state.
+    """
+
+    maxlen: int
+
+    def __init__(self, maxlen: int = 20000):
+        self.maxlen = maxlen
+        self._events = collections.deque(maxlen=maxlen)
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self.last_seq = 0
+
+    def publish(self, kind: str, robot_id: str, data: dict) -> None:
+        with self._lock:
+            seq = next(self._counter)
+            self._events.append(RobotEvent(seq, time.time(), kind, robot_id, data))
+            self.last_seq = seq
+
+    def read(self, after: int, limit: int = None) -> tuple[list[RobotEvent], bool]:
+        """
+        Events with sequence number greater than `after`, oldest first, and whether some of them were already dropped
+        """
+        with self._lock:
+            if not self._events or after >= self.last_seq:
+                return [], False
+            first = self._events[0].seq
+            lost = after + 1 < first
+            start = max(after + 1 - first, 0)
+            stop = len(self._events) if limit is None else min(len(self._events), start + limit)
+            if start > len(self._events) // 2:
+                # new events are at the end, walk the deque from the right
+                events = list(itertools.islice(reversed(self._events), len(self._events) - stop,
+                                               len(self._events) - start))
+                events.reverse()
+            else:
+                events = list(itertools.islice(self._events, start, stop))
+        return events, lost
+
+
+class EventBusLogHandler(logging.Handler):
+    """
+    Publishes log records of a robot to an EventBus as LOG events, so a GUI can show them in batches
+    instead of receiving every line on its event loop
+    """
+
+    def __init__(self, bus: EventBus, robot_id: str, level: int | str = logging.NOTSET):
+        super().__init__(level)
+        self.bus = bus
+        self.robot_id = robot_id
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.bus.publish(LOG, self.robot_id, {
+                'time': record.created,
+                'level': record.levelname,
+                'message': self.format(record),
+            })
+        except Exception:  # pylint:disable=broad-except
+            self.handleError(record)
+
+
+class RobotState:
+    """
+    Latest state of one robot built from its events: recent candles, recent trades, P&L and latency
+    """
+
+    def __init__(self, robot_id: str, max_candles: int = MAX_CANDLES, max_trades: int = MAX_TRADES):
+        self.robot_id = robot_id
+        self.candles = collections.deque(maxlen=max_candles)  # [time, open, high, low, close]
+        self.trades = collections.deque(maxlen=max_trades)  # [time, direction, lots, price]
+        self.pnl = {}
+        self.latency = {}
+
+    def apply(self, event: RobotEvent) -> None:
+        data = event.data
+        if event.kind == CANDLE:
+            candle = [data['time'], data['open'], data['high'], data['low'], data['close']]
+            # updates of the current bar replace it
+            if self.candles and self.candles[-1][0] == candle[0]:
+                self.candles[-1] = candle
+            else:
+                self.candles.append(candle)
+        elif event.kind == TRADE:
+            self.trades.append([data['time'], data['direction'], data['lots'], data['price']])
+        elif event.kind == PNL:
+            self.pnl = data
+        elif event.kind == LATENCY:
+            self.latency = data
+
+    def to_dict(self) -> dict:
+        return {
+            'candles': list(self.candles),
+            'trades': list(self.trades),
+            'pnl': self.pnl,
+            'latency': self.latency,
+        }
+
+
+class FleetState:
+    """
+    States of all robots, kept up to date from an EventBus by update(). snapshot() returns the state together
+    with the sequence number it includes, so a reader can continue with bus.read(seq)
+    """
+
+    bus: EventBus
+    robots: dict[str, RobotState]
+    seq: int
+
+    def __init__(self, bus: EventBus):
+        self.bus = bus
+        self.robots = {}
+        self.seq = 0
+        self._lock = threading.Lock()
+
+    def update(self) -> int:
+        with self._lock:
+            # events dropped before update() got to them leave a gap in candles and trades only,
+            # P&L and latency are replaced by every event anyway
+            events, _ = self.bus.read(self.seq)
+            for event in events:
+                robot = self.robots.get(event.robot_id)
+                if robot is None:
+                    robot = self.robots[event.robot_id] = RobotState(event.robot_id)
+                robot.apply(event)
+            if events:
+                self.seq = events[-1].seq
+            return len(events)
+
+    def snapshot(self) -> tuple[int, dict[str, dict]]:
+        with self._lock:
+            return self.seq, {robot_id: robot.to_dict() for robot_id, robot in sorted(self.robots.items())}
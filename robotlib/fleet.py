@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import logging
+import sys
+
+from typing import Callable
+
+from tinkoff.invest import Client, Instrument, InstrumentIdType, PositionsResponse
+from tinkoff.invest.exceptions import InvestError
+from tinkoff.invest.services import Services
+
+from robotlib.account import AccountLedger
+from robotlib.instruments import InstrumentRegistry, to_instrument
+from robotlib.robot import TradingRobot, TradingRobotFactory
+from robotlib.strategy import TradeStrategyBase
+
+
+class TradingRobotFleetFactory:
+    """
+    Bootstraps robots for a whole list of tickers at once: instruments are resolved from the cached shares()
+    catalogue of InstrumentRegistry, the account is validated once and positions are fetched once,
+    then every robot gets its slice.
+    """
+    APP_NAME = 'karpp'
+
+    token: str
+    account_id: str
+    sandbox_mode: bool
+    instruments: dict[str, Instrument]  # ticker -> instrument
+    missing_tickers: list[tuple[str, str]]
+    positions: PositionsResponse
+    logger: logging.Logger
+    logger_level: int | str
+    registry: InstrumentRegistry
+    ledger: AccountLedger | None
+    client_factory: Callable[..., Client]
+
+    def __init__(self, token: str, account_id: str, tickers: list[tuple[str, str]],  # pylint:disable=too-many-arguments
+                 logger_level: int | str = 'INFO', registry: InstrumentRegistry = None,
+                 client_factory: Callable[..., Client] = Client):
+        self.token = token
+        self.client_factory = client_factory
+        self.registry = registry if registry is not None else InstrumentRegistry.default(token)
+        self.account_id = account_id
+        self.logger_level = logger_level
+        self.logger = self._setup_logger(logger_level)
+        self.missing_tickers = []
+        self.ledger = None
+
+        try:
+            with client_factory(token, app_name=self.APP_NAME) as client:
+                self.instruments = self._resolve_instruments(client, tickers)
+                self.sandbox_mode = TradingRobotFactory.validate_account_with_client(client, account_id, self.logger)
+                if self.sandbox_mode:
+                    self.positions = client.sandbox.get_sandbox_positions(account_id=account_id)
+                else:
+                    self.positions = client.operations.get_positions(account_id=account_id)
+        except InvestError as error:
+            self.logger.error(f'Failed to bootstrap fleet. Exception: {error}')
+            raise error
+
+        self.logger.info(f'Fleet bootstrapped: {len(self.instruments)} instruments, '
+                         f'{len(self.missing_tickers)} not found, sandbox_mode={self.sandbox_mode}')
+
+    @property
+    def tickers(self) -> list[str]:
+        return list(self.instruments)
+
+    def get_factory(self, ticker: str) -> TradingRobotFactory:
+        return TradingRobotFactory.from_bootstrap(
+            token=self.token,
+            account_id=self.account_id,
+            instrument_info=self.instruments[ticker],
+            sandbox_mode=self.sandbox_mode,
+            positions_snapshot=self.positions,
+            logger_level=self.logger_level,
+            client_factory=self.client_factory
+        )
+
+    def create_ledger(self, currency: str = 'rub') -> AccountLedger:
+        """
+        Creates the account ledger shared by all robots of the fleet, seeded with bootstrap positions.
+        Cash in `currency` is split equally between the tickers; call AccountLedger.allocate to change budgets
+        """
+        if self.ledger is None:
+            self.ledger = AccountLedger(token=self.token, account_id=self.account_id, sandbox_mode=self.sandbox_mode,
+                                        positions=self.positions, logger=self.logger.getChild('account'),
+                                        client_factory=self.client_factory)
+            self.ledger.allocate_equally(self.tickers, currency)
+        return self.ledger
+
+    def create_robots(self, strategies: dict[str, TradeStrategyBase],
+                      sandbox_mode: bool = True) -> dict[str, TradingRobot]:
+        robots = {}
+        for ticker, strategy in strategies.items():
+            if ticker not in self.instruments:
+                self.logger.warning(f'Skipping {ticker}: instrument was not resolved')
+                continue
+            robots[ticker] = self.get_factory(ticker).create_robot(strategy, sandbox_mode=sandbox_mode)
+            robots[ticker].account_ledger = self.ledger
+        return robots
+
+    def _resolve_instruments(self, client: Services, tickers: list[tuple[str, str]]) -> dict[str, Instrument]:
+        self.registry.ensure_fresh(client)
+        instruments = {}
+        for ticker, class_code in tickers:
+            share = self.registry.get_by_ticker(ticker, class_code)
+            if share is not None:
+                instruments[ticker] = to_instrument(share)
+                continue
+            # not a share (e.g. ETF or bond) — fall back to a single lookup
+            try:
+                instruments[ticker] = client.instruments.get_instrument_by(
+                    id_type=InstrumentIdType.INSTRUMENT_ID_TYPE_TICKER, class_code=class_code, id=ticker).instrument
+            except InvestError as error:
+                self.logger.error(f'Instrument {ticker} ({class_code}) not found. Exception: {error}')
+                self.missing_tickers.append((ticker, class_code))
+        return instruments
+
+    @staticmethod
+    def _setup_logger(logger_level: int | str) -> logging.Logger:
+        logger = logging.getLogger('robot.fleet')
+        logger.setLevel(logger_level)
+        if not logger.handlers:
+            formatter = logging.Formatter(fmt=('%(asctime)s %(levelname)s: %(message)s'))
+            handler = logging.StreamHandler(stream=sys.stderr)
+            handler.setFormatter(formatter)
+            logger.addHandler(handler)
+        return logger
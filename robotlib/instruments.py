@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import bisect
+import dataclasses
+import datetime
+import logging
+import os
+import pickle
+import threading
+
+from tinkoff.invest import Client, Instrument, Share
+from tinkoff.invest.exceptions import InvestError
+from tinkoff.invest.services import Services
+
+
+def to_instrument(share: Share) -> Instrument:
+    """
+    Instrument with the fields Share has in common with it: robots, stats and recordings are typed against
+    Instrument, the one get_instrument_by returns
+    """
+    names = {item.name for item in dataclasses.fields(Instrument)}
+    return Instrument(**{item.name: getattr(share, item.name) for item in dataclasses.fields(share)
+                         if item.name in names})
+
+
+class InstrumentRegistry:
+    """
+    Local cache of the shares() catalogue. Shares (with lot sizes, currencies and price increments) are persisted
+    to a pickle file and indexed by figi, ticker and class_code on load, so lookups need no API calls.
+    """
+    APP_NAME = 'karpp'
+    DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.investrobot', 'shares.pickle')
+    DEFAULT_TTL = datetime.timedelta(hours=24)
+    FILE_VERSION = 1
+
+    _default: InstrumentRegistry | None = None
+    _default_lock = threading.Lock()
+
+    path: str
+    ttl: datetime.timedelta
+    token: str | None
+    updated_at: datetime.datetime | None
+    logger: logging.Logger
+
+    def __init__(self, token: str = None, path: str = DEFAULT_PATH, ttl: datetime.timedelta = DEFAULT_TTL,
+                 logger: logging.Logger = None):
+        self.token = token
+        self.path = path
+        self.ttl = ttl
+        self.logger = logger or logging.getLogger('robot.instruments')
+        self.updated_at = None
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._build_indexes([])
+        self.load()
+
+    @classmethod
+    def default(cls, token: str = None) -> InstrumentRegistry:
+        """
+        Process-wide registry stored in DEFAULT_PATH
+        """
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls(token=token)
+            elif token and not cls._default.token:
+                cls._default.token = token
+            return cls._default
+
+    def __len__(self) -> int:
+        return len(self._by_figi)
+
+    def is_loaded(self) -> bool:
+        return self.updated_at is not None
+
+    def is_stale(self) -> bool:
+        if self.updated_at is None:
+            return True
+        return datetime.datetime.now(datetime.timezone.utc) - self.updated_at > self.ttl
+
+    def load(self) -> bool:
+        try:
+            with open(self.path, 'rb') as file:
+                data = pickle.load(file)
+        except FileNotFoundError:
+            return False
+        except Exception as error:  # pylint:disable=broad-except
+            self.logger.warning(f'Failed to read instrument cache {self.path}: {error}')
+            return False
+        if data.get('version') != self.FILE_VERSION:
+            self.logger.info(f'Instrument cache {self.path} has old format, ignoring it')
+            return False
+        with self._lock:
+            self._build_indexes(data['shares'])
+            self.updated_at = data['updated_at']
+        self.logger.debug(f'Loaded {len(data["shares"])} instruments from {self.path}')
+        return True
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'wb') as file:
+            pickle.dump({'version': self.FILE_VERSION, 'updated_at': self.updated_at, 'shares': self.get_all()},
+                        file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    def refresh(self, client: Services = None) -> None:
+        """
+        Downloads shares() catalogue and stores it to disk. Uses the given client or opens a new one with self.token
+        """
+        if client is None:
+            if not self.token:
+                raise ValueError('token is required to refresh instruments')
+            with Client(self.token, app_name=self.APP_NAME) as new_client:
+                shares = new_client.instruments.shares().instruments
+        else:
+            shares = client.instruments.shares().instruments
+        with self._lock:
+            self._build_indexes(shares)
+            self.updated_at = datetime.datetime.now(datetime.timezone.utc)
+        self.logger.info(f'Instrument cache refreshed: {len(shares)} shares')
+        try:
+            self.save()
+        except OSError as error:
+            self.logger.warning(f'Failed to save instrument cache {self.path}: {error}')
+
+    def refresh_in_background(self) -> threading.Thread:
+        with self._lock:
+            if self._refresh_thread is None or not self._refresh_thread.is_alive():
+                self._refresh_thread = threading.Thread(target=self._background_refresh, daemon=True,
+                                                        name='instrument-registry-refresh')
+                self._refresh_thread.start()
+            return self._refresh_thread
+
+    def ensure_fresh(self, client: Services = None, background: bool = True) -> None:
+        """
+        Loads the catalogue from API if there is no cached one. A stale cache is still served
+        while it is refreshed in background (or synchronously if background is False)
+        """
+        if not self.is_loaded() or (self.is_stale() and not background):
+            self.refresh(client)
+        elif self.is_stale():
+            self.refresh_in_background()
+
+    def get_by_figi(self, figi: str) -> Share | None:
+        return self._by_figi.get(figi)
+
+    def get_by_ticker(self, ticker: str, class_code: str) -> Share | None:
+        return self._by_key.get((ticker, class_code))
+
+    def find_by_ticker(self, ticker: str) -> list[Share]:
+        return self._by_ticker.get(ticker, [])
+
+    def get_by_class_code(self, class_code: str) -> list[Share]:
+        return self._by_class_code.get(class_code, [])
+
+    def get_all(self) -> list[Share]:
+        return list(self._by_figi.values())
+
+    def _background_refresh(self) -> None:
+        try:
+            self.refresh()
+        except (InvestError, ValueError) as error:
+            self.logger.warning(f'Background instrument refresh failed: {error}')
+
+    def _build_indexes(self, shares: list[Share]) -> None:
+        by_figi = {}
+        by_key = {}
+        by_ticker = {}
+        by_class_code = {}
+        for share in shares:
+            by_figi[share.figi] = share
+            by_key[(share.ticker, share.class_code)] = share
+            by_ticker.setdefault(share.ticker, []).append(share)
+            by_class_code.setdefault(share.class_code, []).append(share)
+        # readers never take the lock, so indexes are swapped as whole objects
+        self._by_figi = by_figi
+        self._by_key = by_key
+        self._by_ticker = by_ticker
+        self._by_class_code = by_class_code
+
+
+class InstrumentSearchIndex:
+    """
+    Search over a list of instruments as it is typed: ticker prefix matches first (bisect over sorted tickers),
+    then substring matches in ticker or name. A query that extends the previous one only filters its result.
+    """
+
+    def __init__(self, entries: list[tuple[str, str]]):
+        """
+        entries: (ticker, name) for every row, results are row numbers
+        """
+        self._texts = [f'{ticker} {name}'.lower() for ticker, name in entries]
+        self._tickers = sorted((ticker.lower(), row) for row, (ticker, _) in enumerate(entries))
+        self._keys = [ticker for ticker, _ in self._tickers]
+        self._last_query = ''
+        self._last_matches = list(range(len(entries)))
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def search(self, query: str) -> list[int]:
+        query = query.strip().lower()
+        if not query:
+            return list(range(len(self._texts)))
+        candidates = self._last_matches if self._last_query and query.startswith(self._last_query) \
+            else range(len(self._texts))
+        matches = [row for row in candidates if query in self._texts[row]]
+        self._last_query, self._last_matches = query, matches
+
+        first = bisect.bisect_left(self._keys, query)
+        last = bisect.bisect_left(self._keys, query + '\uffff', first)
+        prefix = [row for _, row in self._tickers[first:last]]
+        prefix_rows = set(prefix)
+        return prefix + [row for row in matches if row not in prefix_rows]
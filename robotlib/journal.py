@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import copy
+import datetime
+import logging
+import os
+import pickle
+import queue
+import struct
+import threading
+import time
+import zlib
+
+from typing import Iterator, TYPE_CHECKING
+
+from tinkoff.invest import MoneyValue, OrderDirection, OrderExecutionReportStatus, OrderStage, OrderState, \
+    OrderType, PostOrderResponse
+
+if TYPE_CHECKING:
+    from robotlib.stats import TradeStatisticsAnalyzer
+
+# (order_id, status, direction, lots_requested, lots_executed, figi, order_type, order_date, currency,
+#  total_order_amount, average_position_price, executed_commission, initial_order_price, executed_order_price,
+#  initial_commission, initial_security_price, service_commission, stages), amounts as (units, nano),
+#  stages as (price, quantity, trade_id, execution_time). Records written before the last six fields have 12 items
+OrderRecord = tuple
+
+ADD_TRADE = 1
+CANCEL_ORDER = 2
+
+
+def _amount(value: MoneyValue | None) -> tuple[int, int] | None:
+    return None if value is None else (value.units, value.nano)
+
+
+def order_to_record(order: OrderState | PostOrderResponse) -> OrderRecord:
+    # PostOrderResponse has no order date, currency, average position price, service commission and stages
+    currency = order.currency if hasattr(order, 'currency') else order.total_order_amount.currency
+    stages = tuple((_amount(stage.price), stage.quantity, stage.trade_id, getattr(stage, 'execution_time', None))
+                   for stage in getattr(order, 'stages', None) or ())
+    return (order.order_id, int(order.execution_report_status), int(order.direction), order.lots_requested,
+            order.lots_executed, order.figi, int(order.order_type), getattr(order, 'order_date', None),
+            currency, _amount(order.total_order_amount),
+            _amount(getattr(order, 'average_position_price', None)), _amount(order.executed_commission),
+            _amount(order.initial_order_price), _amount(order.executed_order_price),
+            _amount(order.initial_commission), _amount(order.initial_security_price),
+            _amount(getattr(order, 'service_commission', None)), stages)
+
+
+def order_from_record(record: OrderRecord) -> OrderState:
+    (order_id, status, direction, lots_requested, lots_executed, figi, order_type, order_date, currency,
+     total_order_amount, average_position_price, executed_commission) = record[:12]
+    (initial_order_price, executed_order_price, initial_commission, initial_security_price, service_commission,
+     stages) = record[12:] or (None, None, None, None, None, ())
+
+    def money(amount: tuple[int, int] | None) -> MoneyValue | None:
+        return None if amount is None else MoneyValue(currency=currency, units=amount[0], nano=amount[1])
+
+    def stage(price: tuple[int, int] | None, quantity: int, trade_id: str,
+              execution_time: datetime.datetime | None) -> OrderStage:
+        # older API versions have no stage execution time
+        if execution_time is None:
+            return OrderStage(price=money(price), quantity=quantity, trade_id=trade_id)
+        return OrderStage(price=money(price), quantity=quantity, trade_id=trade_id, execution_time=execution_time)
+
+    return OrderState(
+        order_id=order_id,
+        execution_report_status=OrderExecutionReportStatus(status),
+        direction=OrderDirection(direction),
+        lots_requested=lots_requested,
+        lots_executed=lots_executed,
+        figi=figi,
+        order_type=OrderType(order_type),
+        order_date=order_date,
+        currency=currency,
+        total_order_amount=money(total_order_amount),
+        average_position_price=money(average_position_price),
+        executed_commission=money(executed_commission),
+        initial_order_price=money(initial_order_price),
+        executed_order_price=money(executed_order_price),
+        initial_commission=money(initial_commission),
+        initial_security_price=money(initial_security_price),
+        service_commission=money(service_commission),
+        stages=[stage(*values) for values in stages],
+    )
+
+
+class TradeJournal:
+    """
+    Write-ahead journal of TradeStatisticsAnalyzer changes. Files: `{path}.journal` with one record per order state
+    change or cancellation, `{path}.snapshot` with the compacted state.
+    Records are appended by a background thread and fsynced in groups: at most every `fsync_interval` seconds,
+    so a crash loses at most the last group. After `compact_records` records the state is written to a new
+    snapshot (atomically, via rename) and the journal is truncated. restore() loads the snapshot and replays
+    the journal tail, records are numbered so the ones already in the snapshot are skipped.
+    """
+    MAGIC = b'KRPTJ\x01'
+    RECORD_HEADER = struct.Struct('<II')  # payload length, crc32 of payload
+
+    path: str
+    fsync_interval: float
+    compact_records: int
+    sequence: int
+    logger: logging.Logger
+
+    def __init__(self, path: str, fsync_interval: float = 0.05, compact_records: int = 1000,
+                 logger: logging.Logger = None):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.compact_records = compact_records
+        self.logger = logger or logging.getLogger('robot.journal')
+        self.sequence = 0
+        self._records_since_snapshot = 0
+        self._snapshot_sequence = 0
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._thread = None
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    @property
+    def journal_path(self) -> str:
+        return f'{self.path}.journal'
+
+    @property
+    def snapshot_path(self) -> str:
+        return f'{self.path}.snapshot'
+
+    def exists(self) -> bool:
+        return os.path.exists(self.snapshot_path) or os.path.exists(self.journal_path)
+
+    def restore(self, analyzer: TradeStatisticsAnalyzer) -> int:
+        """
+        Loads the snapshot and the journal tail into analyzer, returns the number of replayed records
+        """
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as file:
+                snapshot = pickle.load(file)
+            self._snapshot_sequence = snapshot['sequence']
+            analyzer.load_state(snapshot['positions'], snapshot['money'],
+                                {record[0]: order_from_record(record) for record in snapshot['trades']},
+                                snapshot.get('aggregates'), snapshot.get('evicted_orders'))
+        self.sequence = self._snapshot_sequence
+        replayed = 0
+        end = len(self.MAGIC)
+        for end, (sequence, kind, payload) in self._read_records(self.journal_path):
+            if sequence <= self._snapshot_sequence:
+                continue
+            if kind == ADD_TRADE:
+                analyzer.apply_trade(order_from_record(payload))
+            elif kind == CANCEL_ORDER:
+                analyzer.trades.pop(payload, None)
+                analyzer.pending.pop(payload, None)
+            self.sequence = sequence
+            replayed += 1
+        self._records_since_snapshot = replayed
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > end:
+            # new records are appended after the last good one, not after a torn or corrupted tail
+            self.logger.warning(f'Truncating {self.journal_path} from {os.path.getsize(self.journal_path)} '
+                                f'to {end} bytes')
+            os.truncate(self.journal_path, end)
+        self.logger.info(f'Restored {len(analyzer.trades)} trades from {self.path}, {replayed} journal records replayed')
+        return replayed
+
+    @classmethod
+    def read(cls, path: str) -> Iterator[tuple[int, int, object]]:
+        """
+        Yields (sequence, kind, payload) records, stops at a torn or corrupted record
+        """
+        for _, record in cls._read_records(path):
+            yield record
+
+    @classmethod
+    def _read_records(cls, path: str) -> Iterator[tuple[int, tuple[int, int, object]]]:
+        """
+        Yields (end offset, record) pairs, the offset of the last one is where the good part of the journal ends
+        """
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as file:
+            if file.read(len(cls.MAGIC)) != cls.MAGIC:
+                raise ValueError(f'{path} is not a trade journal')
+            while True:
+                header = file.read(cls.RECORD_HEADER.size)
+                if len(header) < cls.RECORD_HEADER.size:
+                    return
+                size, crc = cls.RECORD_HEADER.unpack(header)
+                payload = file.read(size)
+                if len(payload) < size or zlib.crc32(payload) != crc:
+                    return
+                yield file.tell(), pickle.loads(payload)
+
+    def add_trade(self, trade: OrderState) -> None:
+        self._append(ADD_TRADE, order_to_record(trade))
+
+    def cancel_order(self, order_id: str) -> None:
+        self._append(CANCEL_ORDER, order_id)
+
+    def maybe_compact(self, analyzer: TradeStatisticsAnalyzer) -> None:
+        if self._records_since_snapshot >= self.compact_records:
+            self.compact(analyzer)
+
+    def compact(self, analyzer: TradeStatisticsAnalyzer) -> None:
+        """
+        Queues a snapshot of the current analyzer state, it is written after the records queued before it
+        """
+        self._start()
+        self._records_since_snapshot = 0
+        self._queue.put(('snapshot', {
+            'sequence': self.sequence,
+            'positions': analyzer.positions,
+            'money': analyzer.money,
+            'aggregates': copy.copy(analyzer.aggregates),
+            'evicted_orders': list(analyzer.evicted_orders),
+            'trades': [order_to_record(trade) for trade in analyzer.trades.values()],
+        }))
+
+    def close(self, analyzer: TradeStatisticsAnalyzer = None) -> None:
+        if analyzer is not None:
+            self.compact(analyzer)
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+
+    def _append(self, kind: int, payload: object) -> None:
+        self._start()
+        self.sequence += 1
+        self._records_since_snapshot += 1
+        self._queue.put(('record', (self.sequence, kind, payload)))
+
+    def _start(self) -> None:
+        if self._thread is not None:
+            return
+        self._file = open(self.journal_path, 'ab')  # pylint:disable=consider-using-with
+        if self._file.tell() == 0:
+            self._file.write(self.MAGIC)
+        self._thread = threading.Thread(target=self._write_loop, daemon=True, name=f'trade-journal-{self.path}')
+        self._thread.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.fsync_interval
+            # the group is collected for up to fsync_interval, then written with one fsync
+            while item is not None and time.monotonic() < deadline:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                batch.append(item)
+            for item in batch:
+                if item is None:
+                    self._sync()
+                    return
+                kind, payload = item
+                if kind == 'record':
+                    data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+                    self._file.write(self.RECORD_HEADER.pack(len(data), zlib.crc32(data)))
+                    self._file.write(data)
+                else:
+                    self._sync()
+                    self._write_snapshot(payload)
+            self._sync()
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _write_snapshot(self, snapshot: dict) -> None:
+        tmp_path = f'{self.snapshot_path}.tmp'
+        with open(tmp_path, 'wb') as file:
+            pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        # records up to the snapshot sequence are in the snapshot now, a crash before truncation only
+        # leaves records that restore() skips
+        self._file.close()
+        self._file = open(self.journal_path, 'wb')  # pylint:disable=consider-using-with
+        self._file.write(self.MAGIC)
+        self.logger.debug(f'Compacted {self.path}: {len(snapshot["trades"])} trades, sequence {snapshot["sequence"]}')
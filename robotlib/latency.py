@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import logging
+import time
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of nanosecond values: exact below 2 ** SUB_BUCKET_BITS, then every power of two
+    is split into 2 ** SUB_BUCKET_BITS linear sub-buckets, which keeps relative error around 6%
+    with a fixed amount of memory and O(1) recording.
+    """
+    SUB_BUCKET_BITS = 4
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+    BUCKETS = SUB_BUCKETS * (64 - SUB_BUCKET_BITS + 1)
+
+    counts: list[int]
+    count: int
+    total: int
+    max: int
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value: int) -> None:
+        if value < 0:
+            value = 0
+        if value < self.SUB_BUCKETS:
+            index = value
+        else:
+            shift = value.bit_length() - self.SUB_BUCKET_BITS - 1
+            index = self.SUB_BUCKETS * (shift + 1) + (value >> shift) - self.SUB_BUCKETS
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent: float) -> int:
+        if self.count == 0:
+            return 0
+        rank = max(1, int(self.count * percent / 100 + 0.5))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(self._bucket_upper_bound(index), self.max)
+        return self.max
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def merge(self, other: LatencyHistogram) -> None:
+        for index, bucket_count in enumerate(other.counts):
+            self.counts[index] += bucket_count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def _bucket_upper_bound(self, index: int) -> int:
+        if index < self.SUB_BUCKETS:
+            return index
+        shift = index // self.SUB_BUCKETS - 1
+        top = index % self.SUB_BUCKETS + self.SUB_BUCKETS
+        return ((top + 1) << shift) - 1
+
+
+class LatencyTracker:
+    """
+    Per-robot latency of the live path, from receiving a market data message to posting an order.
+    Stages are measured with time.perf_counter_ns() and aggregated into LatencyHistogram.
+    Each tracker is written by its robot thread only, readers get a best-effort snapshot.
+    """
+    STAGES = ('queue', 'check_orders', 'decide', 'validate', 'post_order', 'total')
+
+    histograms: dict[str, LatencyHistogram]
+    logger: logging.Logger | None
+    log_interval: float
+
+    def __init__(self, logger: logging.Logger = None, log_interval: float = 60.0):
+        self.logger = logger
+        self.log_interval = log_interval
+        self.histograms = {stage: LatencyHistogram() for stage in self.STAGES}
+        self._last_log = time.monotonic()
+
+    def record(self, stage: str, started_ns: int, finished_ns: int) -> None:
+        self.histograms[stage].record(finished_ns - started_ns)
+
+    def maybe_log(self) -> None:
+        if self.logger is not None and time.monotonic() - self._last_log >= self.log_interval:
+            self._last_log = time.monotonic()
+            self.logger.info(f'Latency us (p50/p99/max): {self.format()}')
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        """
+        Returns count and p50/p99/max in microseconds for every stage that has data
+        """
+        return {
+            stage: {
+                'count': histogram.count,
+                'p50': histogram.percentile(50) / 1000,
+                'p99': histogram.percentile(99) / 1000,
+                'max': histogram.max / 1000,
+            }
+            for stage, histogram in self.histograms.items() if histogram.count
+        }
+
+    def format(self) -> str:
+        return ' '.join(f'{stage}={values["p50"]:.0f}/{values["p99"]:.0f}/{values["max"]:.0f}'
+                        for stage, values in self.snapshot().items())
+
+    def reset(self) -> None:
+        self.histograms = {stage: LatencyHistogram() for stage in self.STAGES}
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import datetime
+import logging
+import queue
+import threading
+import time
+import tracemalloc
+
+from dataclasses import dataclass
+from typing import Callable
+
+from tinkoff.invest import Candle, Instrument, MarketDataResponse
+
+from robotlib.latency import LatencyHistogram
+from robotlib.money import Money
+from robotlib.robot import TradingRobot, TradingRobotFactory
+from robotlib.simulator import ExchangeSimulator
+from robotlib.strategy import TradeStrategyBase
+
+
+@dataclass
+class LoadTestResult:
+    robots: int
+    offered_rate: float  # updates per second the test was asked to send
+    sent_rate: float  # updates per second actually sent, lower if the sender itself could not keep the pace
+    sustained_rate: float  # updates per second processed
+    p50_ms: float  # from sending an update to the end of the robot decision
+    p99_ms: float
+    max_ms: float
+    max_queue_depth: int
+    final_queue_depth: int
+    memory_per_robot_kb: float
+    orders: int
+
+    @property
+    def falls_behind(self) -> bool:
+        # more than a second of backlog left, or less than 95% of the sent load processed
+        return self.final_queue_depth > self.sent_rate or self.sustained_rate < 0.95 * self.sent_rate
+
+
+class FleetLoadTest:
+    """
+    Drives robots with synthetic candle updates through TradingRobot._on_market_data, the same path the market data
+    stream uses, with ExchangeSimulator as the order service. Every robot gets `updates_per_second` updates:
+    several updates of the same 1-minute bar with a moving close, then the next bar.
+    Updates are sent at a fixed rate into per-worker queues, a robot is always served by the same worker.
+    """
+
+    strategy_factory: Callable[[str], TradeStrategyBase]
+    updates_per_second: float
+    updates_per_bar: int
+    duration: float
+    workers: int
+    seed: int
+
+    def __init__(self, strategy_factory: Callable[[str], TradeStrategyBase],  # pylint:disable=too-many-arguments
+                 updates_per_second: float = 1.0, updates_per_bar: int = 12, duration: float = 10.0,
+                 workers: int = 1, seed: int = 0, logger: logging.Logger = None):
+        self.strategy_factory = strategy_factory
+        self.updates_per_second = updates_per_second
+        self.updates_per_bar = updates_per_bar
+        self.duration = duration
+        self.workers = workers
+        self.seed = seed
+        self.logger = logger or logging.getLogger('robot.loadtest')
+
+    def run(self, robots_counts: list[int]) -> list[LoadTestResult]:
+        results = []
+        for count in robots_counts:
+            result = self.run_once(count)
+            self.logger.info(f'{count} robots: {result}')
+            results.append(result)
+        return results
+
+    def run_once(self, robots_count: int) -> LoadTestResult:
+        bars = int(self.duration * self.updates_per_second / self.updates_per_bar) + 2
+        instruments = [Instrument(figi=f'LOAD{i:05d}', ticker=f'LOAD{i:05d}', class_code='LOAD', lot=1,
+                                  currency='rub') for i in range(robots_count)]
+        candles = {instrument.figi: ExchangeSimulator.synthetic_candles(60 + bars, seed=self.seed + i)
+                   for i, instrument in enumerate(instruments)}
+        simulator = ExchangeSimulator(instruments, candles, money=100000.0 * robots_count, history_size=60)
+
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        robots = [self._create_robot(simulator, instrument) for instrument in instruments]
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        updates = self._updates(simulator, instruments, bars)
+        return self._drive(simulator, robots, updates, memory_per_robot=(after - before) / robots_count)
+
+    def _create_robot(self, simulator: ExchangeSimulator, instrument: Instrument) -> TradingRobot:
+        factory = TradingRobotFactory.from_bootstrap(
+            token=simulator.token, account_id=simulator.account_id, instrument_info=instrument, sandbox_mode=True,
+            positions_snapshot=simulator.get_positions(), logger_level='WARNING', client_factory=simulator.client)
+        robot = factory.create_robot(self.strategy_factory(instrument.ticker), sandbox_mode=True)
+        robot.load_history()
+        return robot
+
+    def _updates(self, simulator: ExchangeSimulator, instruments: list[Instrument], bars: int):
+        """
+        Yields (robot index, update) in sending order: each bar is sent as updates_per_bar partial updates
+        of every robot, the last one is the complete bar
+        """
+        for _ in range(bars):
+            final = [simulator.release_next([instrument.figi]) for instrument in instruments]
+            for step in range(1, self.updates_per_bar + 1):
+                for index, candle in enumerate(final):
+                    yield index, MarketDataResponse(candle=self._partial(candle, step / self.updates_per_bar))
+
+    def _drive(self, simulator: ExchangeSimulator, robots: list[TradingRobot], updates,
+               memory_per_robot: float) -> LoadTestResult:
+        offered_rate = len(robots) * self.updates_per_second
+        queues = [queue.Queue() for _ in range(self.workers)]
+        histogram = LatencyHistogram()
+        histogram_lock = threading.Lock()
+        processed = [0] * self.workers
+
+        def work(worker: int) -> None:
+            local = LatencyHistogram()
+            with simulator.client() as client:
+                while True:
+                    item = queues[worker].get()
+                    if item is None:
+                        break
+                    sent_ns, index, market_data = item
+                    robots[index]._on_market_data(client, market_data)  # pylint:disable=protected-access
+                    local.record(time.perf_counter_ns() - sent_ns)
+                    processed[worker] += 1
+            with histogram_lock:
+                histogram.merge(local)
+
+        threads = [threading.Thread(target=work, args=(worker,), daemon=True, name=f'loadtest-worker-{worker}')
+                   for worker in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        max_depth = 0
+        sent = 0
+        started = time.perf_counter()
+        for index, market_data in updates:
+            delay = started + sent / offered_rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if time.perf_counter() - started >= self.duration:
+                break
+            queues[index % self.workers].put((time.perf_counter_ns(), index, market_data))
+            sent += 1
+            if sent % 100 == 0:
+                max_depth = max(max_depth, sent - sum(processed))
+        elapsed = time.perf_counter() - started
+        done = sum(processed)
+        final_depth = sent - done
+        for worker_queue in queues:
+            # the backlog is dropped, it is already counted in final_queue_depth
+            while True:
+                try:
+                    worker_queue.get_nowait()
+                except queue.Empty:
+                    break
+            worker_queue.put(None)
+        for thread in threads:
+            thread.join()
+
+        return LoadTestResult(
+            robots=len(robots),
+            offered_rate=offered_rate,
+            sent_rate=sent / elapsed,
+            sustained_rate=done / elapsed,
+            p50_ms=histogram.percentile(50) / 1e6,
+            p99_ms=histogram.percentile(99) / 1e6,
+            max_ms=histogram.max / 1e6,
+            max_queue_depth=max(max_depth, final_depth),
+            final_queue_depth=final_depth,
+            memory_per_robot_kb=memory_per_robot / 1024,
+            orders=len(simulator.orders),
+        )
+
+    @staticmethod
+    def _partial(candle: Candle, progress: float) -> Candle:
+        if progress >= 1:
+            return candle
+        open_price = Money(candle.open).to_float()
+        close = open_price + (Money(candle.close).to_float() - open_price) * progress
+        high = max(open_price, close)
+        low = min(open_price, close)
+        return Candle(figi=candle.figi, interval=candle.interval, open=candle.open,
+                      high=Money(high).to_quotation(), low=Money(low).to_quotation(),
+                      close=Money(close).to_quotation(), volume=int(candle.volume * progress),
+                      time=candle.time, last_trade_ts=candle.time + datetime.timedelta(seconds=60 * progress))
+
+    @staticmethod
+    def format_results(results: list[LoadTestResult]) -> str:
+        lines = [f'{"robots":>7} {"offered/s":>10} {"sent/s":>8} {"sustained/s":>12} {"p50 ms":>8} {"p99 ms":>8} '
+                 f'{"max ms":>8} {"max queue":>10} {"KB/robot":>9} {"orders":>7}']
+        for result in results:
+            lines.append(f'{result.robots:>7} {result.offered_rate:>10.0f} {result.sent_rate:>8.0f} '
+                         f'{result.sustained_rate:>12.0f} '
+                         f'{result.p50_ms:>8.2f} {result.p99_ms:>8.2f} {result.max_ms:>8.2f} '
+                         f'{result.max_queue_depth:>10} {result.memory_per_robot_kb:>9.1f} {result.orders:>7}'
+                         + ('  <- очередь растёт' if result.falls_behind else ''))
+        return '\n'.join(lines)
@@ -1,65 +1,205 @@
 from __future__ import annotations
 
-import math
+from typing import Iterable
+
+import numpy as np
 
-from dataclasses import dataclass
 from tinkoff.invest import MoneyValue, Quotation
 
 
-@dataclass(init=False, order=True)
 class Money:
-    units: int
-    nano: int
-    MOD: int = 10 ** 9
+    """
+    Exact amount stored as one integer count of nano-units (10^-9). units and nano follow the Quotation convention:
+    both have the sign of the amount
+    """
+    __slots__ = ('nanos',)
+    MOD = 10 ** 9
+
+    nanos: int
 
-    def __init__(self, value: int | float | Quotation | MoneyValue, nano: int = None):
-        if nano:
+    def __init__(self, value: int | float | Quotation | MoneyValue | Money = 0, nano: int = None):
+        if nano is not None:
             assert isinstance(value, int), 'if nano is present, value must be int'
             assert isinstance(nano, int), 'nano must be int'
-            self.units = value
-            self.nano = nano
+            self.nanos = value * self.MOD + nano
+        elif isinstance(value, (Quotation, MoneyValue)):
+            self.nanos = value.units * self.MOD + value.nano
+        elif isinstance(value, (int, np.integer)):
+            self.nanos = int(value) * self.MOD
+        elif isinstance(value, float):
+            self.nanos = round(value * self.MOD)
+        elif isinstance(value, Money):
+            self.nanos = value.nanos
         else:
-            match value:
-                case int() as value:
-                    self.units = value
-                    self.nano = 0
-                case float() as value:
-                    self.units = int(math.floor(value))
-                    self.nano = int((value - math.floor(value)) * self.MOD)
-                case Quotation() | MoneyValue() as value:
-                    self.units = value.units
-                    self.nano = value.nano
-                case _:
-                    raise ValueError(f'{type(value)} is not supported as initial value for Money')
+            raise ValueError(f'{type(value)} is not supported as initial value for Money')
+
+    @classmethod
+    def from_nanos(cls, nanos: int) -> Money:
+        money = object.__new__(cls)
+        money.nanos = nanos
+        return money
+
+    @property
+    def units(self) -> int:
+        return self.nanos // self.MOD if self.nanos >= 0 else -(-self.nanos // self.MOD)
+
+    @property
+    def nano(self) -> int:
+        return self.nanos - self.units * self.MOD
 
     def __float__(self):
-        return self.units + self.nano / self.MOD
+        return self.nanos / self.MOD
 
     def to_float(self):
-        return float(self)
+        return self.nanos / self.MOD
 
     def to_quotation(self):
-        return Quotation(self.units, self.nano)
+        units = self.units
+        return Quotation(units=units, nano=self.nanos - units * self.MOD)
 
     def to_money_value(self, currency: str):
-        return MoneyValue(currency, self.units, self.nano)
+        units = self.units
+        return MoneyValue(currency=currency, units=units, nano=self.nanos - units * self.MOD)
 
-    def __add__(self, other: Money) -> Money:
-        print(self.units + other.units + (self.nano + other.nano) // self.MOD)
-        print((self.nano + other.nano) % self.MOD)
-        return Money(
-            self.units + other.units + (self.nano + other.nano) // self.MOD,
-            (self.nano + other.nano) % self.MOD
-        )
+    def __add__(self, other: Money | int) -> Money:
+        if isinstance(other, Money):
+            return Money.from_nanos(self.nanos + other.nanos)
+        if isinstance(other, int):
+            return Money.from_nanos(self.nanos + other * self.MOD)
+        return NotImplemented
+
+    # sum() starts from int 0
+    __radd__ = __add__
 
     def __neg__(self) -> Money:
-        return Money(-self.units, -self.nano)
+        return Money.from_nanos(-self.nanos)
+
+    def __sub__(self, other: Money | int) -> Money:
+        if isinstance(other, Money):
+            return Money.from_nanos(self.nanos - other.nanos)
+        if isinstance(other, int):
+            return Money.from_nanos(self.nanos - other * self.MOD)
+        return NotImplemented
+
+    def __mul__(self, other: int | float) -> Money:
+        if isinstance(other, int):
+            return Money.from_nanos(self.nanos * other)
+        if isinstance(other, float):
+            return Money.from_nanos(round(self.nanos * other))
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Money) and self.nanos == other.nanos
 
-    def __sub__(self, other: Money) -> Money:
-        return self + -other
+    def __lt__(self, other: Money) -> bool:
+        return self.nanos < other.nanos
 
-    def __mul__(self, other: int) -> Money:
-        return Money(self.units * other + (self.nano * other) // self.MOD, (self.nano * other) % self.MOD)
+    def __le__(self, other: Money) -> bool:
+        return self.nanos <= other.nanos
+
+    def __gt__(self, other: Money) -> bool:
+        return self.nanos > other.nanos
+
+    def __ge__(self, other: Money) -> bool:
+        return self.nanos >= other.nanos
+
+    def __hash__(self) -> int:
+        return hash(self.nanos)
+
+    def __reduce__(self):
+        return Money.from_nanos, (self.nanos,)
+
+    def __setstate__(self, state) -> None:
+        # pickles of the former dataclass Money hold units and nano
+        if isinstance(state, tuple):
+            state = state[1] or state[0]
+        self.nanos = state['nanos'] if 'nanos' in state else state['units'] * self.MOD + state['nano']
 
     def __str__(self) -> str:
         return f'<Money units={self.units} nano={self.nano}>'
+
+    __repr__ = __str__
+
+
+class MoneyArray:
+    """
+    Vector of exact amounts as int64 nano-units, for bulk sums and scaling. Amounts are limited to about 9.2e9
+    in absolute value (int64 range of nanos)
+    """
+    __slots__ = ('nanos',)
+    MOD = Money.MOD
+
+    nanos: np.ndarray
+
+    def __init__(self, nanos: np.ndarray | Iterable[int] = ()):
+        self.nanos = np.asarray(nanos, dtype=np.int64)
+
+    @classmethod
+    def from_quotations(cls, values: list[Quotation | MoneyValue | Money]) -> MoneyArray:
+        count = len(values)
+        if count and isinstance(values[0], Money):
+            return cls(np.fromiter((value.nanos for value in values), np.int64, count))
+        units = np.fromiter((value.units for value in values), np.int64, count)
+        nano = np.fromiter((value.nano for value in values), np.int64, count)
+        return cls(units * cls.MOD + nano)
+
+    @classmethod
+    def from_floats(cls, values: np.ndarray | Iterable[float]) -> MoneyArray:
+        return cls(np.rint(np.asarray(values, dtype=np.float64) * cls.MOD).astype(np.int64))
+
+    @property
+    def units(self) -> np.ndarray:
+        # truncated toward zero, as in Quotation
+        return np.where(self.nanos < 0, -(-self.nanos // self.MOD), self.nanos // self.MOD)
+
+    @property
+    def nano(self) -> np.ndarray:
+        return self.nanos - self.units * self.MOD
+
+    def to_float(self) -> np.ndarray:
+        """
+        units + nano / 10^9, the same float as converting each Quotation separately
+        """
+        units = self.units
+        return units + (self.nanos - units * self.MOD) / self.MOD
+
+    def sum(self) -> Money:
+        return Money.from_nanos(int(self.nanos.sum()))
+
+    def cumsum(self) -> MoneyArray:
+        return MoneyArray(np.cumsum(self.nanos))
+
+    def __len__(self) -> int:
+        return len(self.nanos)
+
+    def __getitem__(self, index) -> Money | MoneyArray:
+        if isinstance(index, (int, np.integer)):
+            return Money.from_nanos(int(self.nanos[index]))
+        return MoneyArray(self.nanos[index])
+
+    def __iter__(self):
+        return (Money.from_nanos(nanos) for nanos in self.nanos.tolist())
+
+    def __add__(self, other: MoneyArray | Money) -> MoneyArray:
+        return MoneyArray(self.nanos + other.nanos)
+
+    def __sub__(self, other: MoneyArray | Money) -> MoneyArray:
+        return MoneyArray(self.nanos - other.nanos)
+
+    def __neg__(self) -> MoneyArray:
+        return MoneyArray(-self.nanos)
+
+    def __mul__(self, other: int | float | np.ndarray) -> MoneyArray:
+        other = np.asarray(other)
+        if other.dtype.kind in 'iub':
+            return MoneyArray(self.nanos * other)
+        return MoneyArray(np.rint(self.nanos * other).astype(np.int64))
+
+    __rmul__ = __mul__
+
+    def __str__(self) -> str:
+        return f'<MoneyArray {self.to_float()}>'
+
+    __repr__ = __str__
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, fields
+
+from robotlib.stats import BalanceCalculator, BalanceProcessor, TradeStatisticsAnalyzer
+
+
+@dataclass
+class TickerSummary:
+    ticker: str
+    path: str
+    mtime_ns: int = 0
+    size: int = 0
+    trades: int = 0
+    positions: int = 0
+    money: float = 0.0
+    final_instrument_balance: int = 0
+    income: float = 0.0
+    total_commission: float = 0.0
+    max_loss: float = 0.0
+    realized_pnl: float = 0.0
+    pending_orders: int = 0
+    error: str | None = None
+
+    @property
+    def has_open_position(self) -> bool:
+        return self.error is None and self.final_instrument_balance > 0
+
+
+def summarize_file(ticker: str, path: str) -> TickerSummary:
+    """
+    Loads one stats file and builds its summary. Errors are returned in the summary instead of being raised,
+    so a broken file is reported rather than skipped
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return TickerSummary(ticker=ticker, path=path, error='file not found')
+    summary = TickerSummary(ticker=ticker, path=path, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+    if stat.st_size == 0:
+        summary.error = 'empty file'
+        return summary
+    try:
+        stats = TradeStatisticsAnalyzer.load_from_file(path)
+        short, _ = stats.get_report(processors=[BalanceProcessor()], calculators=[BalanceCalculator()])
+    except Exception as error:  # pylint:disable=broad-except
+        summary.error = f'{type(error).__name__}: {error}'
+        return summary
+    summary.trades = len(stats.trades)
+    summary.positions = int(stats.positions)
+    summary.money = float(stats.money)
+    summary.final_instrument_balance = int(short.get('final_instrument_balance', 0))
+    summary.income = float(short.get('income', 0.0))
+    summary.total_commission = float(short.get('total_commission', 0.0))
+    summary.max_loss = float(short.get('max_loss', 0.0))
+    summary.realized_pnl = float(stats.aggregates.realized_pnl)
+    summary.pending_orders = len(stats.pending)
+    return summary
+
+
+class PortfolioSummary:
+    """
+    Summaries of per-ticker stats files. Files are summarized in a thread or process pool, results are cached
+    in a JSON file keyed by file mtime and size, so only changed files are loaded again.
+    """
+
+    paths: dict[str, str]
+    cache_path: str | None
+    workers: int | None
+    use_processes: bool
+    logger: logging.Logger
+
+    def __init__(self, paths: dict[str, str], cache_path: str = None, workers: int = None,
+                 use_processes: bool = False, logger: logging.Logger = None):
+        self.paths = paths
+        self.cache_path = cache_path
+        self.workers = workers
+        self.use_processes = use_processes
+        self.logger = logger or logging.getLogger('robot.portfolio')
+
+    def load(self) -> list[TickerSummary]:
+        cache = self._read_cache()
+        summaries = {}
+        changed = []
+        for ticker, path in self.paths.items():
+            cached = cache.get(ticker)
+            if cached is not None and cached.path == path and self._file_key(path) == (cached.mtime_ns, cached.size):
+                summaries[ticker] = cached
+            else:
+                changed.append(ticker)
+        self.logger.info(f'{len(summaries)} summaries cached, {len(changed)} to load')
+        if changed:
+            with self._executor(len(changed)) as executor:
+                for ticker, summary in zip(changed, executor.map(summarize_file, changed,
+                                                                 [self.paths[ticker] for ticker in changed])):
+                    summaries[ticker] = summary
+            self._write_cache(summaries)
+        return [summaries[ticker] for ticker in self.paths]
+
+    def _executor(self, tasks: int) -> Executor:
+        workers = min(self.workers or os.cpu_count() or 1, tasks)
+        return ProcessPoolExecutor(workers) if self.use_processes else ThreadPoolExecutor(workers)
+
+    @staticmethod
+    def _file_key(path: str) -> tuple[int, int]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return 0, 0
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read_cache(self) -> dict[str, TickerSummary]:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, encoding='utf-8') as file:
+                data = json.load(file)
+            names = {field.name for field in fields(TickerSummary)}
+            return {ticker: TickerSummary(**{key: value for key, value in item.items() if key in names})
+                    for ticker, item in data.items()}
+        except (OSError, ValueError, TypeError) as error:
+            self.logger.warning(f'Ignoring broken summary cache {self.cache_path}: {error}')
+            return {}
+
+    def _write_cache(self, summaries: dict[str, TickerSummary]) -> None:
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+        tmp_path = f'{self.cache_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({ticker: asdict(summary) for ticker, summary in summaries.items()}, file, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+
+    @staticmethod
+    def format_table(summaries: list[TickerSummary], labels: dict[str, str] = None) -> str:
+        labels = labels or {}
+        lines = [f'{"Тикер":<7} {"Название":<12} {"Сделок":>7} {"Лотов":>6} {"Доход":>11} {"Комиссия":>9} '
+                 f'{"Макс. просадка":>14} {"Заявок":>6}  Статус']
+        for summary in summaries:
+            status = summary.error or ('открыта позиция' if summary.has_open_position else '')
+            lines.append(f'{summary.ticker:<7} {labels.get(summary.ticker, ""):<12} {summary.trades:>7} '
+                         f'{summary.final_instrument_balance:>6} {summary.income:>11.2f} '
+                         f'{summary.total_commission:>9.2f} {summary.max_loss:>14.2f} {summary.pending_orders:>6}  '
+                         f'{status}')
+        valid = [summary for summary in summaries if summary.error is None]
+        lines.append(f'{"Итого":<20} {sum(summary.trades for summary in valid):>7} '
+                     f'{sum(summary.final_instrument_balance for summary in valid):>6} '
+                     f'{sum(summary.income for summary in valid):>11.2f} '
+                     f'{sum(summary.total_commission for summary in valid):>9.2f}')
+        return '\n'.join(lines)
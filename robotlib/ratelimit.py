@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+import time
+
+from dataclasses import dataclass
+from enum import IntEnum
+
+
+class RequestPriority(IntEnum):
+    ORDERS = 0  # posting and cancelling orders
+    POLLING = 1  # order state, trading status
+    HISTORY = 2  # historic candles and other bulk requests
+
+
+@dataclass
+class RateLimiterStats:
+    requests: int = 0
+    throttled: int = 0  # requests that had to wait for a token
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+
+    @property
+    def avg_wait(self) -> float:
+        return self.total_wait / self.requests if self.requests else 0.0
+
+
+class TokenBucket:
+    """
+    Token bucket with a priority queue of waiters: a request never fails, it waits until a token is available,
+    and waiting requests are served in priority order (then in arrival order).
+    Refill rate is chosen so that burst plus refill never exceeds limit in any window of `period` seconds.
+    """
+
+    def __init__(self, limit: int, period: float = 60.0, burst: int = None):
+        self.capacity = burst if burst is not None else max(1, limit // 10)
+        self.rate = max(limit - self.capacity, 1) / period
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.stats = RateLimiterStats()
+        self._waiters = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+
+    def acquire(self, priority: RequestPriority = RequestPriority.POLLING) -> float:
+        """
+        Blocks until a token is taken, returns time spent waiting in seconds
+        """
+        started = time.monotonic()
+        with self._condition:
+            waiter = (int(priority), next(self._counter))
+            heapq.heappush(self._waiters, waiter)
+            self.stats.queue_depth = len(self._waiters)
+            self.stats.max_queue_depth = max(self.stats.max_queue_depth, self.stats.queue_depth)
+            try:
+                while True:
+                    self._refill()
+                    if self._waiters[0] == waiter:
+                        if self.tokens >= 1:
+                            self.tokens -= 1
+                            break
+                        self._condition.wait((1 - self.tokens) / self.rate)
+                    else:
+                        self._condition.wait()
+            finally:
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+                self.stats.queue_depth = len(self._waiters)
+                self._condition.notify_all()
+
+            waited = time.monotonic() - started
+            self.stats.requests += 1
+            if waited > 0.001:
+                self.stats.throttled += 1
+            self.stats.total_wait += waited
+            self.stats.max_wait = max(self.stats.max_wait, waited)
+            return waited
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class RateLimiter:
+    """
+    Process-wide request limiter for one API token. Requests are grouped the same way the broker counts
+    its per-minute limits, so all robots sharing a token also share the quota.
+    """
+    # requests per minute for each API service
+    DEFAULT_LIMITS: dict[str, int] = {
+        'orders': 100,
+        'stop_orders': 50,
+        'sandbox': 200,
+        'operations': 200,
+        'market_data': 300,
+        'instruments': 200,
+        'users': 100,
+    }
+
+    _limiters: dict[str, RateLimiter] = {}
+    _limiters_lock = threading.Lock()
+
+    buckets: dict[str, TokenBucket]
+
+    def __init__(self, limits: dict[str, int] = None, period: float = 60.0):
+        self.buckets = {group: TokenBucket(limit, period) for group, limit in (limits or self.DEFAULT_LIMITS).items()}
+
+    @classmethod
+    def for_token(cls, token: str) -> RateLimiter:
+        with cls._limiters_lock:
+            if token not in cls._limiters:
+                cls._limiters[token] = cls()
+            return cls._limiters[token]
+
+    @classmethod
+    def set_for_token(cls, token: str, limiter: RateLimiter) -> None:
+        with cls._limiters_lock:
+            cls._limiters[token] = limiter
+
+    def acquire(self, group: str, priority: RequestPriority = RequestPriority.POLLING) -> float:
+        return self.buckets[group].acquire(priority)
+
+    def get_stats(self) -> dict[str, RateLimiterStats]:
+        return {group: bucket.stats for group, bucket in self.buckets.items() if bucket.stats.requests}
+
+    def format_stats(self) -> str:
+        return '; '.join(f'{group}: requests={stats.requests} throttled={stats.throttled} '
+                         f'avg_wait={stats.avg_wait:.3f}s max_wait={stats.max_wait:.3f}s '
+                         f'max_queue={stats.max_queue_depth}'
+                         for group, stats in self.get_stats().items())
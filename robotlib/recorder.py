@@ -0,0 +1,382 @@
+from __future__ import annotations
+
+import datetime
+import logging
+import os
+import pickle
+import queue
+import struct
+import threading
+import time
+
+from dataclasses import dataclass
+from typing import Iterator
+
+from tinkoff.invest import Candle, HistoricCandle, Instrument, LastPrice, MarketDataResponse, Order, OrderBook, \
+    Quotation, SecurityTradingStatus, SubscriptionInterval, Trade, TradeDirection, TradingStatus
+
+from robotlib.simulator import ExchangeSimulator, SimulatedMarketDataStream
+
+
+@dataclass
+class InstrumentRecord:
+    instrument: Instrument
+
+
+@dataclass
+class HistoryRecord:
+    figi: str
+    candles: list[HistoricCandle]
+
+
+# --- Record payloads ---
+# Market data records are the figi (uint8 length + utf-8) and fixed fields of the type, prices are Quotation units
+# and nano, times are ns since epoch (0 - no time). Order books and history add their rows after the fixed fields.
+# Rare records (the instrument, stream responses other than market data) are pickled.
+TEXT_LENGTH = struct.Struct('<B')
+
+REC_PICKLE = 0
+REC_CANDLE = 1
+REC_TRADING_STATUS = 2
+REC_TRADE = 3
+REC_LAST_PRICE = 4
+REC_ORDER_BOOK = 5
+REC_HISTORY = 6
+
+CANDLE = struct.Struct('<Bqiqiqiqiqqq')  # interval, open, high, low, close, volume, time, last trade time
+TRADING_STATUS = struct.Struct('<iqBB')  # status, time, limit order flag, market order flag
+TRADE = struct.Struct('<Bqiqq')  # direction, price, quantity, time
+LAST_PRICE = struct.Struct('<qiq')  # price, time
+ORDER_BOOK = struct.Struct('<iBqqiqiII')  # depth, is consistent, time, limit up, limit down, bids, asks
+ORDER = struct.Struct('<qiq')  # price, quantity
+HISTORY = struct.Struct('<I')  # candles
+HISTORIC_CANDLE = struct.Struct('<qiqiqiqiqqB')  # open, high, low, close, volume, time, is complete
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _ns(value: datetime.datetime | None) -> int:
+    if value is None:
+        return 0
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return (value - EPOCH) // datetime.timedelta(microseconds=1) * 1000
+
+
+def _time(ns: int) -> datetime.datetime | None:
+    return EPOCH + datetime.timedelta(microseconds=ns // 1000) if ns else None
+
+
+def _price(value: Quotation | None) -> tuple[int, int]:
+    return (value.units, value.nano) if value is not None else (0, 0)
+
+
+def encode_record(message: object) -> tuple[int, bytes]:
+    """
+    Record type and payload of a message
+    """
+    if isinstance(message, MarketDataResponse):
+        if message.candle:
+            candle = message.candle
+            return REC_CANDLE, _text(candle.figi) + CANDLE.pack(
+                int(candle.interval), *_price(candle.open), *_price(candle.high), *_price(candle.low),
+                *_price(candle.close), candle.volume, _ns(candle.time), _ns(getattr(candle, 'last_trade_ts', None)))
+        if message.trading_status:
+            status = message.trading_status
+            return REC_TRADING_STATUS, _text(status.figi) + TRADING_STATUS.pack(
+                int(status.trading_status), _ns(status.time), status.limit_order_available_flag,
+                status.market_order_available_flag)
+        if message.trade:
+            trade = message.trade
+            return REC_TRADE, _text(trade.figi) + TRADE.pack(
+                int(trade.direction), *_price(trade.price), trade.quantity, _ns(trade.time))
+        if message.last_price:
+            last_price = message.last_price
+            return REC_LAST_PRICE, _text(last_price.figi) + LAST_PRICE.pack(
+                *_price(last_price.price), _ns(last_price.time))
+        if message.orderbook:
+            book = message.orderbook
+            return REC_ORDER_BOOK, b''.join([
+                _text(book.figi),
+                ORDER_BOOK.pack(book.depth, book.is_consistent, _ns(book.time), *_price(book.limit_up),
+                                *_price(book.limit_down), len(book.bids), len(book.asks)),
+                *(ORDER.pack(*_price(order.price), order.quantity) for order in book.bids),
+                *(ORDER.pack(*_price(order.price), order.quantity) for order in book.asks),
+            ])
+    elif isinstance(message, HistoryRecord):
+        return REC_HISTORY, b''.join([
+            _text(message.figi),
+            HISTORY.pack(len(message.candles)),
+            *(HISTORIC_CANDLE.pack(*_price(candle.open), *_price(candle.high), *_price(candle.low),
+                                   *_price(candle.close), candle.volume, _ns(candle.time), candle.is_complete)
+              for candle in message.candles),
+        ])
+    return REC_PICKLE, pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def decode_record(kind: int, payload: bytes) -> object:
+    if kind == REC_PICKLE:
+        return pickle.loads(payload)
+    figi, offset = _read_text(payload, 0)
+    if kind == REC_CANDLE:
+        interval, open_units, open_nano, high_units, high_nano, low_units, low_nano, close_units, close_nano, \
+            volume, candle_time, last_trade_time = CANDLE.unpack_from(payload, offset)
+        return MarketDataResponse(candle=Candle(
+            figi=figi, interval=SubscriptionInterval(interval), open=Quotation(units=open_units, nano=open_nano),
+            high=Quotation(units=high_units, nano=high_nano), low=Quotation(units=low_units, nano=low_nano),
+            close=Quotation(units=close_units, nano=close_nano), volume=volume, time=_time(candle_time),
+            last_trade_ts=_time(last_trade_time)))
+    if kind == REC_TRADING_STATUS:
+        status, status_time, limit_orders, market_orders = TRADING_STATUS.unpack_from(payload, offset)
+        return MarketDataResponse(trading_status=TradingStatus(
+            figi=figi, trading_status=SecurityTradingStatus(status), time=_time(status_time),
+            limit_order_available_flag=bool(limit_orders), market_order_available_flag=bool(market_orders)))
+    if kind == REC_TRADE:
+        direction, units, nano, quantity, trade_time = TRADE.unpack_from(payload, offset)
+        return MarketDataResponse(trade=Trade(
+            figi=figi, direction=TradeDirection(direction), price=Quotation(units=units, nano=nano),
+            quantity=quantity, time=_time(trade_time)))
+    if kind == REC_LAST_PRICE:
+        units, nano, price_time = LAST_PRICE.unpack_from(payload, offset)
+        return MarketDataResponse(last_price=LastPrice(figi=figi, price=Quotation(units=units, nano=nano),
+                                                       time=_time(price_time)))
+    if kind == REC_ORDER_BOOK:
+        depth, consistent, book_time, up_units, up_nano, down_units, down_nano, bids, asks = \
+            ORDER_BOOK.unpack_from(payload, offset)
+        orders = [Order(price=Quotation(units=units, nano=nano), quantity=quantity)
+                  for units, nano, quantity in ORDER.iter_unpack(payload[offset + ORDER_BOOK.size:])]
+        return MarketDataResponse(orderbook=OrderBook(
+            figi=figi, depth=depth, is_consistent=bool(consistent), bids=orders[:bids], asks=orders[bids:bids + asks],
+            time=_time(book_time), limit_up=Quotation(units=up_units, nano=up_nano),
+            limit_down=Quotation(units=down_units, nano=down_nano)))
+    if kind == REC_HISTORY:
+        candles = [HistoricCandle(
+            open=Quotation(units=open_units, nano=open_nano), high=Quotation(units=high_units, nano=high_nano),
+            low=Quotation(units=low_units, nano=low_nano), close=Quotation(units=close_units, nano=close_nano),
+            volume=volume, time=_time(candle_time), is_complete=bool(complete))
+            for open_units, open_nano, high_units, high_nano, low_units, low_nano, close_units, close_nano, volume,
+            candle_time, complete in HISTORIC_CANDLE.iter_unpack(payload[offset + HISTORY.size:])]
+        return HistoryRecord(figi=figi, candles=candles)
+    raise ValueError(f'Unknown market data log record type {kind}')
+
+
+def _text(value: str) -> bytes:
+    encoded = value.encode()
+    return TEXT_LENGTH.pack(len(encoded)) + encoded
+
+
+def _read_text(payload: bytes, offset: int) -> tuple[str, int]:
+    (length,) = TEXT_LENGTH.unpack_from(payload, offset)
+    offset += TEXT_LENGTH.size
+    return payload[offset:offset + length].decode(), offset + length
+
+
+class MarketDataLog:
+    """
+    Binary session log: a magic header, then records of a `<QIB` header (receive time in ns since epoch,
+    payload length, record type) followed by the payload (see encode_record). A torn record at the end, e.g. after
+    a crash, is ignored. Logs of the first version with pickled records are still read.
+    """
+    MAGIC = b'KRPMD\x02'
+    RECORD_HEADER = struct.Struct('<QIB')
+    PICKLE_MAGIC = b'KRPMD\x01'
+    PICKLE_RECORD_HEADER = struct.Struct('<QI')
+
+    @classmethod
+    def read(cls, path: str) -> Iterator[tuple[int, object]]:
+        with open(path, 'rb') as file:
+            magic = file.read(len(cls.MAGIC))
+            if magic == cls.PICKLE_MAGIC:
+                yield from cls._read_pickled(file)
+                return
+            if magic != cls.MAGIC:
+                raise ValueError(f'{path} is not a market data log')
+            while True:
+                header = file.read(cls.RECORD_HEADER.size)
+                if len(header) < cls.RECORD_HEADER.size:
+                    return
+                received_ns, size, kind = cls.RECORD_HEADER.unpack(header)
+                payload = file.read(size)
+                if len(payload) < size:
+                    return
+                yield received_ns, decode_record(kind, payload)
+
+    @classmethod
+    def _read_pickled(cls, file) -> Iterator[tuple[int, object]]:
+        while True:
+            header = file.read(cls.PICKLE_RECORD_HEADER.size)
+            if len(header) < cls.PICKLE_RECORD_HEADER.size:
+                return
+            received_ns, size = cls.PICKLE_RECORD_HEADER.unpack(header)
+            payload = file.read(size)
+            if len(payload) < size:
+                return
+            yield received_ns, pickle.loads(payload)
+
+
+class MarketDataRecorder:
+    """
+    Appends market data messages to a MarketDataLog. record() only puts the message into a queue, so the stream
+    thread pays about a microsecond; encoding and writing happen in a background thread, flushed every
+    `flush_interval` seconds. One recorder can be shared by several robots. A message that fails to encode or
+    write is logged and dropped, the recording goes on.
+    """
+
+    path: str
+    flush_interval: float
+    records: int
+    bytes_written: int
+    errors: int
+    logger: logging.Logger
+
+    def __init__(self, path: str, flush_interval: float = 1.0, logger: logging.Logger = None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.records = 0
+        self.bytes_written = 0
+        self.errors = 0
+        self.logger = logger or logging.getLogger('robot.recorder')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'ab')  # pylint:disable=consider-using-with
+        if self._file.tell() == 0:
+            self._file.write(MarketDataLog.MAGIC)
+        else:
+            with open(path, 'rb') as file:
+                if file.read(len(MarketDataLog.MAGIC)) != MarketDataLog.MAGIC:
+                    self._file.close()
+                    raise ValueError(f'{path} is not a market data log of the current version, record to a new file')
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write_loop, daemon=True, name='market-data-recorder')
+        self._thread.start()
+
+    def record(self, message: object, received_ns: int = None) -> None:
+        self._queue.put((received_ns or time.time_ns(), message))
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if not self._file.closed:
+            self._file.close()
+        self.logger.info(f'Recorded {self.records} messages ({self.bytes_written} bytes) to {self.path}'
+                         + (f', {self.errors} dropped on errors' if self.errors else ''))
+
+    def _write_loop(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [item]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            closing = False
+            for item in batch:
+                if item is None:
+                    closing = True
+                    continue
+                self._write(*item)
+            try:
+                self._file.flush()
+            except OSError as error:
+                self._on_error(f'Failed to flush {self.path}: {error}')
+            if closing:
+                return
+
+    def _write(self, received_ns: int, message: object) -> None:
+        try:
+            kind, payload = encode_record(message)
+            record = MarketDataLog.RECORD_HEADER.pack(received_ns, len(payload), kind) + payload
+        except Exception as error:  # pylint:disable=broad-except
+            self._on_error(f'Failed to encode {type(message).__name__}: {error!r}')
+            return
+        position = self._file.tell()
+        try:
+            self._file.write(record)
+        except OSError as error:
+            self._on_error(f'Failed to write to {self.path}: {error}')
+            # cut a partly written record, otherwise the records after it could not be read
+            try:
+                self._file.truncate(position)
+            except OSError:
+                pass
+            return
+        self.records += 1
+        self.bytes_written += len(record)
+
+    def _on_error(self, message: str) -> None:
+        self.errors += 1
+        # one line per error while the first ones are rare, then every thousandth not to flood the log
+        if self.errors <= 10 or self.errors % 1000 == 0:
+            self.logger.error(f'{message} ({self.errors} errors so far)')
+
+
+class MarketDataReplayer(ExchangeSimulator):
+    """
+    ExchangeSimulator that feeds a recorded session back to robots: history is served by get_all_candles and
+    the market data stream yields recorded messages of subscribed instruments, either as fast as they are read
+    (speed=None) or with recorded pauses divided by speed. Orders are matched against recorded candles.
+    Trading status messages are only replayed in real time, because on a trading break the robot drops candles
+    until the break ends by the wall clock.
+    """
+
+    messages: list[tuple[int, MarketDataResponse]]
+
+    def __init__(self, path: str, speed: float = None, instruments: list[Instrument] = None, **kwargs):
+        history = {}
+        recorded_instruments = {}
+        self.messages = []
+        for received_ns, record in MarketDataLog.read(path):
+            if isinstance(record, MarketDataResponse):
+                self.messages.append((received_ns, record))
+            elif isinstance(record, HistoryRecord):
+                history.setdefault(record.figi, record.candles)
+            elif isinstance(record, InstrumentRecord):
+                recorded_instruments[record.instrument.figi] = record.instrument
+        instruments = instruments or list(recorded_instruments.values())
+        super().__init__(instruments, candles=history, speed=speed,
+                         history_size=max((len(candles) for candles in history.values()), default=0), **kwargs)
+
+    def create_market_data_stream(self) -> ReplayMarketDataStream:
+        return ReplayMarketDataStream(self)
+
+
+class ReplayMarketDataStream(SimulatedMarketDataStream):
+    def __iter__(self):
+        replayer: MarketDataReplayer = self.simulator
+        replayer.stream_started()
+        try:
+            previous_ns = None
+            figis = self._subscribed_figis()
+            for received_ns, market_data in replayer.messages:
+                if self._stop_event.is_set():
+                    return
+                figi = self._figi(market_data)
+                if figi is None or figi not in figis:
+                    continue
+                if market_data.trading_status and not replayer.speed:
+                    continue
+                if replayer.speed and previous_ns is not None:
+                    if self._stop_event.wait((received_ns - previous_ns) / 1e9 / replayer.speed):
+                        return
+                previous_ns = received_ns
+                if market_data.candle:
+                    replayer.apply_candle(figi, market_data.candle)
+                yield market_data
+        finally:
+            replayer.stream_finished()
+
+    def _subscribed_figis(self) -> set[str]:
+        return {instrument.figi for subscription in (self.candles, self.order_book, self.trades, self.info)
+                for instrument in subscription.instruments}
+
+    @staticmethod
+    def _figi(market_data: MarketDataResponse) -> str | None:
+        for payload in (market_data.candle, market_data.orderbook, market_data.trade, market_data.trading_status,
+                        market_data.last_price):
+            if payload:
+                return payload.figi
+        return None
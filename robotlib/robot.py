@@ -1,9 +1,15 @@
+from __future__ import annotations
+
 import datetime
 import logging
 import sys
+import time
 import uuid
 
 from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
 
 from tinkoff.invest import (
     AccessLevel,
@@ -13,6 +19,7 @@ from tinkoff.invest import (
     CandleInstrument,
     CandleInterval,
     Client,
+    HistoricCandle,
     InfoInstrument,
     Instrument,
     InstrumentIdType,
@@ -22,8 +29,10 @@ from tinkoff.invest import (
     OrderDirection,
     OrderExecutionReportStatus,
     OrderState,
+    PositionsResponse,
     PostOrderResponse,
     Quotation,
+    SubscriptionInterval,
     TradeInstrument,
 )
 from tinkoff.invest.exceptions import InvestError
@@ -31,7 +40,23 @@ from tinkoff.invest.services import MarketDataStreamManager, Services
 
 from robotlib.strategy import TradeStrategyBase, TradeStrategyParams, RobotTradeOrder
 from robotlib.stats import TradeStatisticsAnalyzer
+from robotlib.account import AccountLedger, CashReservation
+from robotlib.candles import CandleFrame, CandleFrameBuilder
+from robotlib.costs import CostModel, DEFAULT_COST_MODEL
+from robotlib.events import CANDLE, LATENCY, PNL, TRADE, EventBus, EventBusLogHandler
+from robotlib.instruments import InstrumentRegistry, to_instrument
+from robotlib.latency import LatencyTracker
+from robotlib.ratelimit import RateLimiter, RequestPriority
+from robotlib.recorder import HistoryRecord, InstrumentRecord, MarketDataRecorder
+from robotlib.stream import BarCoalescer, SupervisedMarketDataStream
 from robotlib.money import Money
+from robotlib.vizualization import MSK
+
+# history interval of the candles the stream delivers for a subscription interval
+CANDLE_INTERVALS = {
+    SubscriptionInterval.SUBSCRIPTION_INTERVAL_ONE_MINUTE: CandleInterval.CANDLE_INTERVAL_1_MIN,
+    SubscriptionInterval.SUBSCRIPTION_INTERVAL_FIVE_MINUTES: CandleInterval.CANDLE_INTERVAL_5_MIN,
+}
 
 
 @dataclass
@@ -39,6 +64,7 @@ class OrderExecutionInfo:
     direction: OrderDirection
     lots: int = 0
     amount: float = 0.0
+    reservation: CashReservation | None = None
 
 
 class TradingRobot:  # pylint:disable=too-many-instance-attributes
@@ -52,9 +78,21 @@ class TradingRobot:  # pylint:disable=too-many-instance-attributes
     logger: logging.Logger
     instrument_info: Instrument
     sandbox_mode: bool
-
-    def __init__(self, token: str, account_id: str, sandbox_mode: bool, trade_strategy: TradeStrategyBase,
-                 trade_statistics: TradeStatisticsAnalyzer, instrument_info: Instrument, logger: logging.Logger):
+    rate_limiter: RateLimiter
+    bar_coalescer: BarCoalescer
+    market_data_stream: SupervisedMarketDataStream | None
+    stream_heartbeat_timeout: float = 300.0  # seconds without market data before reconnecting
+    latency_tracker: LatencyTracker | None
+    account_ledger: AccountLedger | None
+    client_factory: Callable[..., Client]  # Client or a stand-in such as ExchangeSimulator.client
+    recorder: MarketDataRecorder | None
+    backtest_candles: CandleFrame | None
+    trading_resumes_at: float | None  # time.monotonic() before which candle updates are dropped
+    open_bar: tuple[datetime.datetime, float] | None  # time and last close of the bar not yet marked to market
+
+    def __init__(self, token: str, account_id: str, sandbox_mode: bool,  # pylint:disable=too-many-arguments
+                 trade_strategy: TradeStrategyBase, trade_statistics: TradeStatisticsAnalyzer,
+                 instrument_info: Instrument, logger: logging.Logger, client_factory: Callable[..., Client] = Client):
         self.token = token
         self.account_id = account_id
         self.trade_strategy = trade_strategy
@@ -63,87 +101,212 @@ class TradingRobot:  # pylint:disable=too-many-instance-attributes
         self.logger = logger
         self.instrument_info = instrument_info
         self.sandbox_mode = sandbox_mode
+        self.rate_limiter = RateLimiter.for_token(token)
+        self.bar_coalescer = BarCoalescer()
+        self.market_data_stream = None
+        self.latency_tracker = None
+        self.account_ledger = None
+        self.client_factory = client_factory
+        self.recorder = None
+        self.backtest_candles = None
+        self.trading_resumes_at = None
+        self.open_bar = None
+        self.event_bus = None
+        self.latency_event_interval = 5.0
+        self._last_latency_event = 0.0
+
+    @property
+    def robot_id(self) -> str:
+        return self.instrument_info.ticker
+
+    def get_money(self) -> float:
+        if self.account_ledger is not None:
+            return self.account_ledger.get_money(self.robot_id, self.instrument_info.currency)
+        return self.trade_statistics.get_money()
+
+    def get_positions(self) -> int:
+        if self.account_ledger is not None:
+            return self.account_ledger.get_positions(self.instrument_info)
+        return self.trade_statistics.get_positions()
+
+    @property
+    def orders_rate_group(self) -> str:
+        return 'sandbox' if self.sandbox_mode else 'orders'
 
     def trade(self, stop_event=None) -> TradeStatisticsAnalyzer:
         self.logger.info('Starting trading')
-
-        self.trade_strategy.load_candles(
-            list(self._load_historic_data(datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1))))
-
-        with Client(self.token, app_name=self.APP_NAME) as client:
-            trading_status = client.market_data.get_trading_status(figi=self.instrument_info.figi)
-            if not trading_status.market_order_available_flag:
-                self.logger.warning('Market trading is not available now.')
-
-            market_data_stream: MarketDataStreamManager = client.create_market_data_stream()
-            if self.trade_strategy.candle_subscription_interval:
-                market_data_stream.candles.subscribe([
-                    CandleInstrument(
-                        figi=self.instrument_info.figi,
-                        interval=self.trade_strategy.candle_subscription_interval)
-                ])
-            if self.trade_strategy.order_book_subscription_depth:
-                market_data_stream.order_book.subscribe([
-                    OrderBookInstrument(
-                        figi=self.instrument_info.figi,
-                        depth=self.trade_strategy.order_book_subscription_depth)
-                ])
-            if self.trade_strategy.trades_subscription:
-                market_data_stream.trades.subscribe([
-                    TradeInstrument(figi=self.instrument_info.figi)
-                ])
-            market_data_stream.info.subscribe([
-                InfoInstrument(figi=self.instrument_info.figi)
+        self.load_history()
+
+        self.market_data_stream = SupervisedMarketDataStream(
+            token=self.token,
+            subscribe=self._subscribe,
+            logger=self.logger,
+            stop_event=stop_event,
+            heartbeat_timeout=self.stream_heartbeat_timeout,
+            client_factory=self.client_factory,
+            recorder=self.recorder
+        )
+        self.market_data_stream.run(on_connect=self._on_stream_connect, on_message=self._on_market_data)
+        if self.open_bar is not None:
+            self.trade_statistics.mark_to_market(self.open_bar[1])
+            self.open_bar = None
+        return self.trade_statistics
+
+    def load_history(self) -> None:
+        """
+        Loads the last hour of candles into the strategy and seeds the bar coalescer with it
+        """
+        history = list(self._load_historic_data(
+            datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)))
+        if self.recorder is not None:
+            self.recorder.record(HistoryRecord(figi=self.instrument_info.figi, candles=history))
+        self.trade_strategy.load_candles(history)
+        self.bar_coalescer = BarCoalescer()
+        if history:
+            self.bar_coalescer.push(history[-1])
+
+    def _subscribe(self, market_data_stream: MarketDataStreamManager) -> None:
+        if self.trade_strategy.candle_subscription_interval:
+            market_data_stream.candles.subscribe([
+                CandleInstrument(
+                    figi=self.instrument_info.figi,
+                    interval=self.trade_strategy.candle_subscription_interval)
             ])
-            self.logger.debug(f'Subscribed to MarketDataStream, '
-                              f'interval: {self.trade_strategy.candle_subscription_interval}')
-            try:
-                for market_data in market_data_stream:
-                    # Проверяем флаг остановки
-                    if stop_event is not None and stop_event.is_set():
-                        self.logger.info('Получен сигнал остановки, завершаем торговлю.')
-                        break
-                    self.logger.debug(f'Received market_data {market_data}')
-                    if market_data.candle:
-                        self._on_update(client, market_data)
-                    if market_data.trading_status and not market_data.trading_status.market_order_available_flag:
-                        import time
-                        import pytz
-                        msk = pytz.timezone('Europe/Moscow')
-                        now = datetime.datetime.now(msk)
-                        # Определяем ближайшее время возобновления торгов
-                        # Основная сессия: 10:00-18:45, вечерняя: 19:05-23:50
-                        # Премаркет: 9:50-10:00, постмаркет: 18:40-18:50, аукционы: 19:00-19:05
-                        # Если сейчас до 10:00 — ждём до 10:00
-                        if now.time() < datetime.time(10, 0):
-                            next_open = now.replace(hour=10, minute=0, second=0, microsecond=0)
-                        # Если сейчас между 18:45 и 19:05 — ждём до 19:05
-                        elif datetime.time(18, 45) <= now.time() < datetime.time(19, 5):
-                            next_open = now.replace(hour=19, minute=5, second=0, microsecond=0)
-                        # Если сейчас после 23:50 — ждём до 10:00 следующего дня
-                        elif now.time() >= datetime.time(23, 50):
-                            next_open = (now + datetime.timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
-                        # Если сейчас между 10:00 и 18:45 или 19:05 и 23:50 — значит, временный перерыв, ждём 1 минуту
-                        else:
-                            next_open = now + datetime.timedelta(minutes=1)
-                        wait_seconds = max(1, int((next_open - now).total_seconds()))
-                        self.logger.info(f"Торговля недоступна. Ждём до {next_open.strftime('%H:%M:%S')} (МСК), {wait_seconds//60} мин.")
-                        time.sleep(wait_seconds)
-                        continue
-            except InvestError as error:
-                self.logger.info(f'Caught exception {error}, stopping trading')
-                market_data_stream.stop()
-            return self.trade_statistics
+        if self.trade_strategy.order_book_subscription_depth:
+            market_data_stream.order_book.subscribe([
+                OrderBookInstrument(
+                    figi=self.instrument_info.figi,
+                    depth=self.trade_strategy.order_book_subscription_depth)
+            ])
+        if self.trade_strategy.trades_subscription:
+            market_data_stream.trades.subscribe([
+                TradeInstrument(figi=self.instrument_info.figi)
+            ])
+        market_data_stream.info.subscribe([
+            InfoInstrument(figi=self.instrument_info.figi)
+        ])
+        self.logger.debug(f'Subscribed to MarketDataStream, '
+                          f'interval: {self.trade_strategy.candle_subscription_interval}')
+
+    def _on_stream_connect(self, client: Services, reconnected: bool) -> None:
+        if reconnected:
+            self._backfill_candles(client)
+            return
+        self.rate_limiter.acquire('market_data', RequestPriority.POLLING)
+        trading_status = client.market_data.get_trading_status(figi=self.instrument_info.figi)
+        if not trading_status.market_order_available_flag:
+            self.logger.warning('Market trading is not available now.')
+
+    def _backfill_candles(self, client: Services) -> None:
+        """
+        Replays candles missed while the stream was down before live updates resume
+        """
+        interval = self.trade_strategy.candle_subscription_interval
+        if self.bar_coalescer.last_time is None or not interval:
+            return
+        if interval not in CANDLE_INTERVALS:
+            self.logger.warning(f'Cannot backfill candles of interval {interval}')
+            return
+        self.rate_limiter.acquire('market_data', RequestPriority.HISTORY)
+        candles = client.get_all_candles(
+            from_=self.bar_coalescer.last_time,
+            to=datetime.datetime.now(datetime.timezone.utc),
+            interval=CANDLE_INTERVALS[interval],
+            figi=self.instrument_info.figi,
+        )
+        self.market_data_stream.last_receive_ns = 0
+        backfilled = 0
+        for historic_candle in candles:
+            if self._backfill_candle(client, self.to_stream_candle(self.instrument_info.figi, historic_candle,
+                                                                   interval)):
+                backfilled += 1
+        self.market_data_stream.stats.backfilled_candles += backfilled
+        self.logger.info(f'Backfilled {backfilled} candles after reconnect')
+
+    def _backfill_candle(self, client: Services, candle: Candle) -> bool:
+        """
+        Feeds a missed candle to the strategy and the equity curve without placing orders: the bar is stale,
+        an order decided on it would be executed at the current price. Returns whether the candle was new
+        """
+        if not self.bar_coalescer.push(candle):
+            return False
+        market_data = MarketDataResponse(candle=candle)
+        if self.recorder is not None:
+            self.recorder.record(market_data)
+        self._on_update(client, market_data, place_orders=False)
+        return True
 
-    def backtest(self, initial_params: TradeStrategyParams, test_duration: datetime.timedelta,
-                 train_duration: datetime.timedelta = None) -> TradeStatisticsAnalyzer:
+    @staticmethod
+    def to_stream_candle(figi: str, historic_candle: HistoricCandle,
+                         interval: SubscriptionInterval = SubscriptionInterval.SUBSCRIPTION_INTERVAL_ONE_MINUTE
+                         ) -> Candle:
+        return Candle(
+            figi=figi,
+            interval=interval,
+            open=historic_candle.open,
+            high=historic_candle.high,
+            low=historic_candle.low,
+            close=historic_candle.close,
+            volume=historic_candle.volume,
+            time=historic_candle.time,
+        )
+
+    def _on_market_data(self, client: Services, market_data: MarketDataResponse) -> None:
+        self.logger.debug(f'Received market_data {market_data}')
+        if market_data.candle and self.bar_coalescer.push(market_data.candle):
+            if self.trading_resumes_at is not None and time.monotonic() >= self.trading_resumes_at:
+                self.trading_resumes_at = None
+            if self.trading_resumes_at is None:
+                self._on_update(client, market_data)
+        if market_data.trading_status:
+            if market_data.trading_status.market_order_available_flag:
+                if self.trading_resumes_at is not None:
+                    self.logger.info('Торговля снова доступна.')
+                self.trading_resumes_at = None
+            else:
+                self._pause_trading()
+
+    def _pause_trading(self) -> None:
+        """
+        Drops candle updates until the expected end of the break instead of sleeping in the handler, so robots
+        sharing a thread (shards) keep working and a stop request is seen at once
+        """
+        now = datetime.datetime.now(MSK)
+        # Определяем ближайшее время возобновления торгов
+        # Основная сессия: 10:00-18:45, вечерняя: 19:05-23:50
+        # Премаркет: 9:50-10:00, постмаркет: 18:40-18:50, аукционы: 19:00-19:05
+        # Если сейчас до 10:00 — ждём до 10:00
+        if now.time() < datetime.time(10, 0):
+            next_open = now.replace(hour=10, minute=0, second=0, microsecond=0)
+        # Если сейчас между 18:45 и 19:05 — ждём до 19:05
+        elif datetime.time(18, 45) <= now.time() < datetime.time(19, 5):
+            next_open = now.replace(hour=19, minute=5, second=0, microsecond=0)
+        # Если сейчас после 23:50 — ждём до 10:00 следующего дня
+        elif now.time() >= datetime.time(23, 50):
+            next_open = (now + datetime.timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
+        # Если сейчас между 10:00 и 18:45 или 19:05 и 23:50 — значит, временный перерыв, ждём 1 минуту
+        else:
+            next_open = now + datetime.timedelta(minutes=1)
+        wait_seconds = max(1, int((next_open - now).total_seconds()))
+        if self.trading_resumes_at is None:
+            self.logger.info(f"Торговля недоступна. Ждём до {next_open.strftime('%H:%M:%S')} (МСК), {wait_seconds//60} мин.")
+        self.trading_resumes_at = time.monotonic() + wait_seconds
 
+    def backtest(self, initial_params: TradeStrategyParams, test_duration: datetime.timedelta,
+                 train_duration: datetime.timedelta = None, cost_model: CostModel = None) -> TradeStatisticsAnalyzer:
+        """
+        Runs the strategy over historic candles. Orders fill at the candle close shifted by the cost model slippage,
+        the commission is paid from the currency balance and recorded in the statistics. The test candles are kept
+        in `backtest_candles` for BacktestChart
+        """
+        cost_model = cost_model or DEFAULT_COST_MODEL
         trade_statistics = TradeStatisticsAnalyzer(
             positions=initial_params.instrument_balance,
             money=initial_params.currency_balance,
             instrument_info=self.instrument_info,
             logger=self.logger
         )
+        trade_statistics.attach_equity()
 
         now = datetime.datetime.now(datetime.timezone.utc)
         if train_duration:
@@ -152,28 +315,59 @@ class TradingRobot:  # pylint:disable=too-many-instance-attributes
         test = self._load_historic_data(now - test_duration)
 
         params = initial_params
+        lot = self.instrument_info.lot
+        candles = CandleFrameBuilder()
+        closes = []
+        orders = []  # (candle number, close, quantity, sign, candle time)
         for candle in test:
             price = self.convert_from_quotation(candle.close)
             robot_decision = self.trade_strategy.decide_by_candle(candle, params)
 
-            trade_order = robot_decision.robot_trade_order
+            trade_order = robot_decision.robot_trade_order if robot_decision is not None else None
             if trade_order:
                 assert trade_order.quantity > 0
                 if trade_order.direction == OrderDirection.ORDER_DIRECTION_SELL:
-                    assert trade_order.quantity >= params.instrument_balance, \
+                    assert trade_order.quantity <= params.instrument_balance, \
                         f'Cannot execute order {trade_order}. Params are {params}'  # TODO: better logging
+                    amount = trade_order.quantity * lot * cost_model.fill_price(price, trade_order.quantity, -1)
                     params.instrument_balance -= trade_order.quantity
-                    params.currency_balance += trade_order.quantity * price * self.instrument_info.lot
+                    params.currency_balance += amount - cost_model.commission(amount)
+                    sign = -1
                 else:
-                    assert trade_order.quantity * self.instrument_info.lot * price <= params.currency_balance, \
+                    cost = cost_model.buy_cost(price, trade_order.quantity, lot)
+                    assert cost <= params.currency_balance, \
                         f'Cannot execute order {trade_order}. Params are {params}'  # TODO: better logging
                     params.instrument_balance += trade_order.quantity
-                    params.currency_balance -= trade_order.quantity * price * self.instrument_info.lot
+                    params.currency_balance -= cost
+                    sign = 1
+                orders.append((len(closes), price, trade_order.quantity, sign, candle.time))
+            closes.append(price)
+            candles.append(candle)
+
+        self._record_backtest(trade_statistics, cost_model, closes, orders)
+        self.backtest_candles = candles.build()
+        return trade_statistics
 
+    def _record_backtest(self, trade_statistics: TradeStatisticsAnalyzer, cost_model: CostModel, closes: list[float],
+                         orders: list[tuple[int, float, int, int, datetime.datetime]]) -> None:
+        """
+        Costs all backtest orders in one ledger_costs call, the same prices and commissions the balance was charged
+        with order by order, and records them with the equity marks of every candle
+        """
+        if orders:
+            _, prices, quantities, signs, _ = zip(*orders)
+            fill_prices, commissions = cost_model.ledger_costs(np.array(prices), np.array(quantities),
+                                                               np.array(signs), self.instrument_info.lot)
+        order_index = 0
+        for number, close in enumerate(closes):
+            while order_index < len(orders) and orders[order_index][0] == number:
+                _, _, quantity, sign, order_date = orders[order_index]
                 trade_statistics.add_backtest_trade(
-                    quantity=trade_order.quantity, price=candle.close, direction=trade_order.direction)
-
-        return trade_statistics
+                    quantity=quantity, price=Money(float(fill_prices[order_index])).to_quotation(),
+                    direction=OrderDirection.ORDER_DIRECTION_BUY if sign > 0 else OrderDirection.ORDER_DIRECTION_SELL,
+                    commission=float(commissions[order_index]), order_date=order_date, lot=self.instrument_info.lot)
+                order_index += 1
+            trade_statistics.mark_to_market(close)
 
     @staticmethod
     def convert_from_quotation(amount: Quotation | MoneyValue) -> float | None:
@@ -181,34 +375,128 @@ class TradingRobot:  # pylint:disable=too-many-instance-attributes
             return None
         return amount.units + amount.nano / (10 ** 9)
 
-    def _on_update(self, client: Services, market_data: MarketDataResponse):
-        self._check_trade_orders(client)
-        params = TradeStrategyParams(instrument_balance=self.trade_statistics.get_positions(),
-                                     currency_balance=self.trade_statistics.get_money(),
+    def enable_recording(self, recorder: MarketDataRecorder | str) -> MarketDataRecorder:
+        """
+        Records the instrument, loaded history and every market data message of the next trade() session,
+        so it can be replayed with MarketDataReplayer. Accepts a recorder or a log file path
+        """
+        self.recorder = MarketDataRecorder(recorder) if isinstance(recorder, str) else recorder
+        self.recorder.record(InstrumentRecord(instrument=self.instrument_info))
+        return self.recorder
+
+    def enable_latency_tracking(self, log_interval: float = 60.0) -> LatencyTracker:
+        self.latency_tracker = LatencyTracker(logger=self.logger, log_interval=log_interval)
+        return self.latency_tracker
+
+    def enable_events(self, event_bus: EventBus, latency_interval: float = 5.0, logs: bool = False) -> EventBus:
+        """
+        Publishes candles, fills, P&L and (every `latency_interval` seconds) latency of the robot to event_bus,
+        e.g. for DashboardServer. With `logs` the robot log records are published too
+        """
+        self.event_bus = event_bus
+        self.latency_event_interval = latency_interval
+        if logs:
+            self.logger.addHandler(EventBusLogHandler(event_bus, self.robot_id))
+        return event_bus
+
+    def _mark_bar(self, candle: Candle) -> None:
+        """
+        Marks equity once per bar, at the last close of the bar when the next one starts, like the backtest marks
+        every candle. Updates of the current bar only replace its close
+        """
+        close = self.convert_from_quotation(candle.close)
+        if self.open_bar is not None and candle.time > self.open_bar[0]:
+            self.trade_statistics.mark_to_market(self.open_bar[1])
+        self.open_bar = (candle.time, close)
+
+    def _on_update(self, client: Services, market_data: MarketDataResponse, place_orders: bool = True):
+        tracker = self.latency_tracker
+        started = time.perf_counter_ns() if tracker else 0
+
+        if place_orders:
+            self._check_trade_orders(client)
+        self._mark_bar(market_data.candle)
+        if self.event_bus is not None:
+            self._publish_update(market_data.candle)
+        checked = time.perf_counter_ns() if tracker else 0
+        params = TradeStrategyParams(instrument_balance=self.get_positions(),
+                                     currency_balance=self.get_money(),
                                      pending_orders=self.trade_statistics.get_pending_orders())
 
         self.logger.debug(f'Received market_data {market_data}. Running strategy with params {params}')
         strategy_decision = self.trade_strategy.decide(market_data, params)
         self.logger.debug(f'Strategy decision: {strategy_decision}')
+        decided = time.perf_counter_ns() if tracker else 0
 
-        if len(strategy_decision.cancel_orders) > 0:
+        if not place_orders:
+            if strategy_decision.robot_trade_order or strategy_decision.cancel_orders:
+                self.logger.debug(f'Strategy decision on a backfilled candle is dropped: {strategy_decision}')
+        elif len(strategy_decision.cancel_orders) > 0:
             self._cancel_orders(client=client, orders=strategy_decision.cancel_orders)
 
-        trade_order = strategy_decision.robot_trade_order
-        if trade_order and self._validate_strategy_order(order=trade_order, candle=market_data.candle):
-            self._post_trade_order(client=client, trade_order=trade_order)
+        trade_order = strategy_decision.robot_trade_order if place_orders else None
+        if trade_order:
+            validating = time.perf_counter_ns() if tracker else 0
+            valid = self._validate_strategy_order(order=trade_order, candle=market_data.candle)
+            if tracker:
+                validated = time.perf_counter_ns()
+                tracker.record('validate', validating, validated)
+            if valid:
+                self._post_trade_order(client=client, trade_order=trade_order, price=Money(market_data.candle.close))
+                if tracker:
+                    tracker.record('post_order', validated, time.perf_counter_ns())
+
+        if tracker:
+            stream = self.market_data_stream
+            # backfilled candles have no receive time, their queue time is zero
+            received = stream.last_receive_ns if stream is not None and stream.last_receive_ns else started
+            tracker.record('queue', received, started)
+            tracker.record('check_orders', started, checked)
+            tracker.record('decide', checked, decided)
+            tracker.record('total', received, time.perf_counter_ns())
+            tracker.maybe_log()
+
+    def _publish_update(self, candle: Candle) -> None:
+        statistics = self.trade_statistics
+        self.event_bus.publish(CANDLE, self.robot_id, {
+            'time': candle.time.timestamp(),
+            'open': self.convert_from_quotation(candle.open),
+            'high': self.convert_from_quotation(candle.high),
+            'low': self.convert_from_quotation(candle.low),
+            'close': self.convert_from_quotation(candle.close),
+        })
+        equity = statistics.equity.equity if statistics.equity is not None else None
+        self.event_bus.publish(PNL, self.robot_id, {
+            'positions': self.get_positions(),
+            'money': self.get_money(),
+            'equity': equity,
+            'net_pnl': statistics.aggregates.net_pnl,
+            'fills': statistics.aggregates.fills,
+        })
+        if self.latency_tracker is not None and \
+                time.monotonic() - self._last_latency_event >= self.latency_event_interval:
+            self._last_latency_event = time.monotonic()
+            self.event_bus.publish(LATENCY, self.robot_id, self.latency_tracker.snapshot())
+
+    def _publish_fill(self, order_state: OrderState, lots: int) -> None:
+        self.event_bus.publish(TRADE, self.robot_id, {
+            'time': time.time(),
+            'direction': 'buy' if order_state.direction == OrderDirection.ORDER_DIRECTION_BUY else 'sell',
+            'lots': lots,
+            'price': self.convert_from_quotation(order_state.executed_order_price),
+        })
 
     def _validate_strategy_order(self, order: RobotTradeOrder, candle: Candle):
         if order.direction == OrderDirection.ORDER_DIRECTION_BUY:
             price = order.price or Money(candle.close)
             total_cost = price * self.instrument_info.lot * order.quantity
-            balance = self.trade_statistics.get_money()
-            if total_cost.to_float() > self.trade_statistics.get_money():
+            balance = self.get_money()
+            if total_cost.to_float() > balance:
                 self.logger.warning(f'Strategy decision cannot be executed. '
                                     f'Requested buy cost: {total_cost}, balance: {balance}')
                 return False
         else:
-            instrument_balance = self.trade_statistics.get_positions()
+            instrument_balance = self.get_positions()
             if order.quantity > instrument_balance:
                 self.logger.warning(f'Strategy decision cannot be executed. '
                                     f'Requested sell quantity: {order.quantity}, balance: {instrument_balance}')
@@ -217,7 +505,8 @@ class TradingRobot:  # pylint:disable=too-many-instance-attributes
 
     def _load_historic_data(self, from_time: datetime.datetime, to_time: datetime.datetime = None):
         try:
-            with Client(self.token, app_name=self.APP_NAME) as client:
+            with self.client_factory(self.token, app_name=self.APP_NAME) as client:
+                self.rate_limiter.acquire('market_data', RequestPriority.HISTORY)
                 yield from client.get_all_candles(
                     from_=from_time,
                     to=to_time,
@@ -230,13 +519,23 @@ class TradingRobot:  # pylint:disable=too-many-instance-attributes
     def _cancel_orders(self, client: Services, orders: list[OrderState]):
         for order in orders:
             try:
+                self.rate_limiter.acquire(self.orders_rate_group, RequestPriority.ORDERS)
                 client.orders.cancel_order(account_id=self.account_id, order_id=order.order_id)
                 self.trade_statistics.cancel_order(order_id=order.order_id)
             except InvestError as error:
                 self.logger.error(f'Failed to cancel order {order.order_id}. Error: {error}')
 
-    def _post_trade_order(self, client: Services, trade_order: RobotTradeOrder) -> PostOrderResponse | None:
+    def _post_trade_order(self, client: Services, trade_order: RobotTradeOrder,
+                          price: Money = None) -> PostOrderResponse | None:
+        reservation = None
+        if self.account_ledger is not None and trade_order.direction == OrderDirection.ORDER_DIRECTION_BUY:
+            cost = (trade_order.price or price) * self.instrument_info.lot * trade_order.quantity
+            reservation = self.account_ledger.reserve(self.robot_id, self.instrument_info.currency, cost.to_float())
+            if reservation is None:
+                self.logger.warning(f'Not enough cash in robot budget for order {trade_order}, cost: {cost}')
+                return None
         try:
+            self.rate_limiter.acquire(self.orders_rate_group, RequestPriority.ORDERS)
             if self.sandbox_mode:
                 order = client.sandbox.post_sandbox_order(
                     figi=self.instrument_info.figi,
@@ -259,9 +558,12 @@ class TradingRobot:  # pylint:disable=too-many-instance-attributes
                 )
         except InvestError as error:
             self.logger.error(f'Posting trade order failed :(. Order: {trade_order}; Exception: {error}')
+            if self.account_ledger is not None:
+                self.account_ledger.release(reservation)
             return
         self.logger.info(f'Placed trade order {order}')
-        self.orders_executed[order.order_id] = OrderExecutionInfo(direction=trade_order.direction)
+        self.orders_executed[order.order_id] = OrderExecutionInfo(direction=trade_order.direction,
+                                                                  reservation=reservation)
         self.trade_statistics.add_trade(order)
         return order
 
@@ -269,58 +571,120 @@ class TradingRobot:  # pylint:disable=too-many-instance-attributes
         self.logger.debug(f'Updating trade orders info. Current trade orders num: {len(self.orders_executed)}')
         orders_executed = list(self.orders_executed.items())
         for order_id, execution_info in orders_executed:
-            if self.sandbox_mode:
-                order_state = client.sandbox.get_sandbox_order_state(
-                    account_id=self.account_id, order_id=order_id
-                )
-            else:
-                order_state = client.orders.get_order_state(
-                    account_id=self.account_id, order_id=order_id
-                )
+            self.rate_limiter.acquire(self.orders_rate_group, RequestPriority.POLLING)
+            try:
+                if self.sandbox_mode:
+                    order_state = client.sandbox.get_sandbox_order_state(
+                        account_id=self.account_id, order_id=order_id
+                    )
+                else:
+                    order_state = client.orders.get_order_state(
+                        account_id=self.account_id, order_id=order_id
+                    )
+            except InvestError as error:
+                # order stays in orders_executed and is checked again on the next update
+                self.logger.error(f'Failed to get state of order {order_id}. Error: {error}')
+                continue
 
             self.trade_statistics.add_trade(trade=order_state)
+            if self.event_bus is not None and order_state.lots_executed > execution_info.lots:
+                self._publish_fill(order_state, order_state.lots_executed - execution_info.lots)
             match order_state.execution_report_status:
                 case OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_FILL:
                     self.logger.info(f'Trade order {order_id} has been FULLY FILLED')
                     self.orders_executed.pop(order_id)
+                    self._settle_order(execution_info, order_state)
                 case OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_REJECTED:
                     self.logger.warning(f'Trade order {order_id} has been REJECTED')
                     self.orders_executed.pop(order_id)
+                    self._settle_order(execution_info, order_state)
                 case OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_CANCELLED:
                     self.logger.warning(f'Trade order {order_id} has been CANCELLED')
                     self.orders_executed.pop(order_id)
+                    self._settle_order(execution_info, order_state)
                 case OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_PARTIALLYFILL:
                     self.logger.info(f'Trade order {order_id} has been PARTIALLY FILLED')
                     self.orders_executed[order_id] = OrderExecutionInfo(lots=order_state.lots_executed,
                                                                         amount=order_state.total_order_amount,
-                                                                        direction=order_state.direction)
+                                                                        direction=order_state.direction,
+                                                                        reservation=execution_info.reservation)
                 case _:
                     self.logger.debug(f'No updates on order {order_id}')
 
         self.logger.debug(f'Successfully updated trade orders. New trade orders num: {len(self.orders_executed)}')
 
+    def _settle_order(self, execution_info: OrderExecutionInfo, order_state: OrderState) -> None:
+        # moves executed amount of a finished order through the robot budget and frees its cash reservation
+        if self.account_ledger is None:
+            return
+        if order_state.lots_executed > 0:
+            self.account_ledger.apply_fill(self.robot_id, execution_info.direction,
+                                           self.convert_from_quotation(order_state.total_order_amount),
+                                           execution_info.reservation)
+        else:
+            self.account_ledger.release(execution_info.reservation)
+
 
 class TradingRobotFactory:
     APP_NAME = 'karpp'
+    CONSOLE_HANDLER_NAME = 'robot-console'
     instrument_info: Instrument
     token: str
     account_id: str
     logger: logging.Logger
     sandbox_mode: bool
 
+    positions_snapshot: PositionsResponse | None
+    client_factory: Callable[..., Client]
+
     def __init__(self, token: str, account_id: str, figi: str = None,  # pylint:disable=too-many-arguments
-                 ticker: str = None, class_code: str = None, logger_level: int | str = 'INFO'):
-        self.instrument_info = self._get_instrument_info(token, figi, ticker, class_code).instrument
+                 ticker: str = None, class_code: str = None, logger_level: int | str = 'INFO',
+                 client_factory: Callable[..., Client] = Client, console_log: bool = True):
+        self.client_factory = client_factory
+        self.instrument_info = self._get_instrument_info(token, figi, ticker, class_code, client_factory)
         self.token = token
         self.account_id = account_id
-        self.logger = self.setup_logger(logger_level)
-        self.sandbox_mode = self._validate_account(token, account_id, self.logger)
-
-    def setup_logger(self, logger_level: int | str):
+        self.logger = self.setup_logger(logger_level, console_log)
+        self.sandbox_mode = self._validate_account(token, account_id, self.logger, client_factory)
+        self.positions_snapshot = None
+
+    @classmethod
+    def from_bootstrap(cls, token: str, account_id: str, instrument_info: Instrument,  # pylint:disable=too-many-arguments
+                       sandbox_mode: bool, positions_snapshot: PositionsResponse | None,
+                       logger_level: int | str = 'INFO',
+                       client_factory: Callable[..., Client] = Client,
+                       console_log: bool = True) -> TradingRobotFactory:
+        """
+        Creates factory from data already loaded by TradingRobotFleetFactory, without any API calls
+        """
+        factory = cls.__new__(cls)
+        factory.instrument_info = instrument_info
+        factory.token = token
+        factory.account_id = account_id
+        factory.logger = factory.setup_logger(logger_level, console_log)
+        factory.sandbox_mode = sandbox_mode
+        factory.positions_snapshot = positions_snapshot
+        factory.client_factory = client_factory
+        return factory
+
+    def setup_logger(self, logger_level: int | str, console_log: bool = True):
+        """
+        Logger of the ticker. Without `console_log` records are not written to stderr, e.g. when they are published
+        to an EventBus with robot.enable_events(bus, logs=True) and shown by a GUI
+        """
         logger = logging.getLogger(f'robot.{self.instrument_info.ticker}')
         logger.setLevel(logger_level)
+        # the logger is shared by all factories of the ticker, it keeps at most one console handler
+        console = [handler for handler in logger.handlers if handler.get_name() == self.CONSOLE_HANDLER_NAME]
+        if not console_log:
+            for handler in console:
+                logger.removeHandler(handler)
+            return logger
+        if console:
+            return logger
         formatter = logging.Formatter(fmt=('%(asctime)s %(levelname)s: %(message)s'))  # todo: fixit
         handler = logging.StreamHandler(stream=sys.stderr)
+        handler.set_name(self.CONSOLE_HANDLER_NAME)
         handler.setFormatter(formatter)
         logger.addHandler(handler)
         return logger
@@ -336,68 +700,89 @@ class TradingRobotFactory:
         )
         return TradingRobot(token=self.token, account_id=self.account_id, sandbox_mode=sandbox_mode,
                             trade_strategy=trade_strategy, trade_statistics=stats, instrument_info=self.instrument_info,
-                            logger=self.logger.getChild(trade_strategy.strategy_id))
+                            logger=self.logger.getChild(trade_strategy.strategy_id), client_factory=self.client_factory)
 
     def _get_current_postitions(self) -> tuple[Money, int]:
         # amount of money and instrument balance
-        with Client(self.token, app_name=self.APP_NAME) as client:
+        if self.positions_snapshot is not None:
+            return self.extract_positions(self.positions_snapshot, self.instrument_info)
+        with self.client_factory(self.token, app_name=self.APP_NAME) as client:
+            RateLimiter.for_token(self.token).acquire('sandbox' if self.sandbox_mode else 'operations',
+                                                      RequestPriority.POLLING)
             if self.sandbox_mode:
                 positions = client.sandbox.get_sandbox_positions(account_id=self.account_id)
             else:
                 positions = client.operations.get_positions(account_id=self.account_id)
+            return self.extract_positions(positions, self.instrument_info)
 
-            instruments = [sec for sec in positions.securities if sec.figi == self.instrument_info.figi]
-            if len(instruments) > 0:
-                instrument = instruments[0].balance
-            else:
-                instrument = 0
+    @staticmethod
+    def extract_positions(positions: PositionsResponse, instrument_info: Instrument) -> tuple[Money, int]:
+        instruments = [sec for sec in positions.securities if sec.figi == instrument_info.figi]
+        if len(instruments) > 0:
+            instrument = instruments[0].balance
+        else:
+            instrument = 0
 
-            moneys = [m for m in positions.money if m.currency == self.instrument_info.currency]
-            if len(moneys) > 0:
-                money = Money(moneys[0].units, moneys[0].nano)
-            else:
-                money = Money(0, 0)
+        moneys = [m for m in positions.money if m.currency == instrument_info.currency]
+        if len(moneys) > 0:
+            money = Money(moneys[0].units, moneys[0].nano)
+        else:
+            money = Money(0, 0)
 
-            return money, instrument
+        return money, instrument
 
     @staticmethod
-    def _validate_account(token: str, account_id: str, logger: logging.Logger) -> bool:
+    def _validate_account(token: str, account_id: str, logger: logging.Logger,
+                          client_factory: Callable[..., Client] = Client) -> bool:
         try:
-            with Client(token, app_name=TradingRobotFactory.APP_NAME) as client:
-                # Сначала пробуем песочницу
-                accounts = [acc for acc in client.sandbox.get_sandbox_accounts().accounts if acc.id == account_id]
-                sandbox_mode = True
-                if len(accounts) == 0:
-                    # Если не нашли — пробуем боевой контур
-                    sandbox_mode = False
-                    accounts = [acc for acc in client.users.get_accounts().accounts if acc.id == account_id]
-                    if len(accounts) == 0:
-                        logger.error(f'Account {account_id} not found.')
-                        raise ValueError('Account not found')
-
-                account = accounts[0]
-                if account.type not in [AccountType.ACCOUNT_TYPE_TINKOFF, AccountType.ACCOUNT_TYPE_INVEST_BOX]:
-                    logger.error(f'Account type {account.type} is not supported')
-                    raise ValueError('Unsupported account type')
-                if account.status != AccountStatus.ACCOUNT_STATUS_OPEN:
-                    logger.error(f'Account status {account.status} is not supported')
-                    raise ValueError('Unsupported account status')
-                if account.access_level != AccessLevel.ACCOUNT_ACCESS_LEVEL_FULL_ACCESS:
-                    logger.error(f'No access to account. Current level is {account.access_level}')
-                    raise ValueError('Insufficient access level')
-
-                return sandbox_mode
-
+            with client_factory(token, app_name=TradingRobotFactory.APP_NAME) as client:
+                return TradingRobotFactory.validate_account_with_client(client, account_id, logger)
         except InvestError as error:
             logger.error(f'Failed to validate account. Exception: {error}')
             raise error
 
     @staticmethod
-    def _get_instrument_info(token: str, figi: str = None, ticker: str = None, class_code: str = None):
-        with Client(token, app_name=TradingRobotFactory.APP_NAME) as client:
+    def validate_account_with_client(client: Services, account_id: str, logger: logging.Logger) -> bool:
+        # Сначала пробуем песочницу
+        accounts = [acc for acc in client.sandbox.get_sandbox_accounts().accounts if acc.id == account_id]
+        sandbox_mode = True
+        if len(accounts) == 0:
+            # Если не нашли — пробуем боевой контур
+            sandbox_mode = False
+            accounts = [acc for acc in client.users.get_accounts().accounts if acc.id == account_id]
+            if len(accounts) == 0:
+                logger.error(f'Account {account_id} not found.')
+                raise ValueError('Account not found')
+
+        account = accounts[0]
+        if account.type not in [AccountType.ACCOUNT_TYPE_TINKOFF, AccountType.ACCOUNT_TYPE_INVEST_BOX]:
+            logger.error(f'Account type {account.type} is not supported')
+            raise ValueError('Unsupported account type')
+        if account.status != AccountStatus.ACCOUNT_STATUS_OPEN:
+            logger.error(f'Account status {account.status} is not supported')
+            raise ValueError('Unsupported account status')
+        if account.access_level != AccessLevel.ACCOUNT_ACCESS_LEVEL_FULL_ACCESS:
+            logger.error(f'No access to account. Current level is {account.access_level}')
+            raise ValueError('Insufficient access level')
+
+        return sandbox_mode
+
+    @staticmethod
+    def _get_instrument_info(token: str, figi: str = None, ticker: str = None,  # pylint:disable=too-many-arguments
+                             class_code: str = None, client_factory: Callable[..., Client] = Client) -> Instrument:
+        if figi is None and (ticker is None or class_code is None):
+            raise ValueError('figi or both ticker and class_code must be not None')
+
+        # fresh local catalogue answers without network; stale or missing one falls back to API
+        registry = InstrumentRegistry.default(token)
+        if client_factory is Client and not registry.is_stale():
+            share = registry.get_by_figi(figi) if figi is not None else registry.get_by_ticker(ticker, class_code)
+            if share is not None:
+                return to_instrument(share)
+
+        with client_factory(token, app_name=TradingRobotFactory.APP_NAME) as client:
             if figi is None:
-                if ticker is None or class_code is None:
-                    raise ValueError('figi or both ticker and class_code must be not None')
                 return client.instruments.get_instrument_by(id_type=InstrumentIdType.INSTRUMENT_ID_TYPE_TICKER,
-                                                            class_code=class_code, id=ticker)
-            return client.instruments.get_instrument_by(id_type=InstrumentIdType.INSTRUMENT_ID_TYPE_FIGI, id=figi)
+                                                            class_code=class_code, id=ticker).instrument
+            return client.instruments.get_instrument_by(id_type=InstrumentIdType.INSTRUMENT_ID_TYPE_FIGI,
+                                                        id=figi).instrument
@@ -0,0 +1,451 @@
+from __future__ import annotations
+
+import bisect
+import datetime
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable
+
+from tinkoff.invest import (
+    Candle,
+    CandleInstrument,
+    Client,
+    InfoInstrument,
+    Instrument,
+    MarketDataResponse,
+    PositionsResponse,
+    SubscriptionInterval,
+)
+from tinkoff.invest.services import MarketDataStreamManager, Services
+
+from robotlib.fleet import TradingRobotFleetFactory
+from robotlib.journal import TradeJournal
+from robotlib.ratelimit import RateLimiter, RequestPriority
+from robotlib.robot import CANDLE_INTERVALS, TradingRobot, TradingRobotFactory
+from robotlib.stats import TradeStatisticsAnalyzer
+from robotlib.store import TradeStore
+from robotlib.stream import BarCoalescer, SupervisedMarketDataStream
+from robotlib.strategy import TradeStrategyBase
+
+
+class ConsistentHashRing:
+    """
+    Maps keys to nodes so that adding or removing a node moves only about 1/N of the keys.
+    md5 is used instead of hash(), which is salted per process.
+    """
+
+    def __init__(self, nodes: list[int], replicas: int = 64):
+        self._ring = sorted((self._hash(f'{node}:{replica}'), node) for node in nodes for replica in range(replicas))
+        self._keys = [key for key, _ in self._ring]
+
+    def get(self, key: str) -> int:
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+@dataclass
+class ShardStats:
+    shard: int
+    tickers: list[str] = field(default_factory=list)
+    pid: int | None = None
+    events_sent: int = 0
+    events_processed: int = 0
+    queue_depth: int = 0  # events delivered to the worker and not processed yet, measured by the worker
+    max_queue_depth: int = 0
+    busy_time: float = 0.0  # seconds spent in robot handlers
+    cpu_time: float = 0.0  # CPU seconds of the worker process
+    calls: int = 0  # ledger and rate limiter calls served by the parent
+    alive: bool = True  # False if the worker died while the fleet was running
+
+
+@dataclass
+class BackfilledCandle:
+    """
+    A candle missed while the stream was down, the worker feeds it to the robot without placing orders
+    """
+    candle: Candle
+
+
+@dataclass
+class ShardConfig:
+    shard: int
+    token: str
+    account_id: str
+    sandbox_mode: bool
+    instruments: list[Instrument]
+    positions: PositionsResponse
+    strategy_factory: Callable[[str], TradeStrategyBase]  # must be picklable, e.g. a module-level function
+    stats_path: str | None = None  # e.g. 'stats_{ticker}.pickle', loaded on start and saved on exit
+    journal_path: str | None = None  # e.g. 'journal/{ticker}', restored on start and appended on every trade
+    store_path: str | None = None  # TradeStore database shared by all shards
+    max_finished_trades: int | None = 10000  # finished orders kept in memory by every robot, None - all
+    logger_level: int | str = 'INFO'
+    stats_interval: float = 5.0
+    client_factory: Callable[..., Client] = Client
+
+
+class _ShardChannel:
+    """
+    Worker side of the request/reply pipe to the parent process
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def call(self, target: str, method: str, *args):
+        self.conn.send(('call', target, method, args))
+        status, result = self.conn.recv()
+        if status == 'error':
+            raise result
+        return result
+
+    def send(self, kind: str, payload) -> None:
+        self.conn.send((kind, payload))
+
+
+class _ShardProxy:
+    """
+    Stands in for AccountLedger or RateLimiter of the parent process inside a worker
+    """
+
+    def __init__(self, channel: _ShardChannel, target: str):
+        self._channel = channel
+        self._target = target
+
+    def __getattr__(self, method: str):
+        return lambda *args: self._channel.call(self._target, method, *args)
+
+
+class ShardedFleetRunner:
+    """
+    Runs a fleet of robots in several worker processes, so robots do not contend on one GIL.
+    Tickers are spread across shards by a consistent hash. The parent process owns the only market data stream,
+    the account ledger and the rate limiter: it sends candles and trading status to the shard of the ticker
+    through a queue, and workers call the ledger and the rate limiter through a pipe. Every worker processes
+    its events in one thread and posts orders with its own client.
+    """
+
+    fleet: TradingRobotFleetFactory
+    strategy_factory: Callable[[str], TradeStrategyBase]
+    shards: int
+    sandbox_mode: bool
+    stats_path: str | None
+    journal_path: str | None
+    store_path: str | None
+    max_finished_trades: int | None
+    candle_interval: SubscriptionInterval
+    stop_event: threading.Event
+    logger: logging.Logger
+    stats: dict[int, ShardStats]
+    assignment: dict[str, int]  # ticker -> shard
+
+    def __init__(self, fleet: TradingRobotFleetFactory,  # pylint:disable=too-many-arguments
+                 strategy_factory: Callable[[str], TradeStrategyBase], shards: int = None, sandbox_mode: bool = True,
+                 stats_path: str = None, stop_event: threading.Event = None, stats_log_interval: float = 60.0,
+                 candle_interval: SubscriptionInterval = SubscriptionInterval.SUBSCRIPTION_INTERVAL_ONE_MINUTE,
+                 journal_path: str = None, store_path: str = None, max_finished_trades: int | None = 10000):
+        self.fleet = fleet
+        self.strategy_factory = strategy_factory
+        self.shards = max(1, min(shards or os.cpu_count() or 1, len(fleet.tickers)))
+        self.sandbox_mode = sandbox_mode
+        self.stats_path = stats_path
+        self.journal_path = journal_path
+        self.store_path = store_path
+        self.max_finished_trades = max_finished_trades
+        self.candle_interval = candle_interval
+        self.stop_event = stop_event or threading.Event()
+        self.stats_log_interval = stats_log_interval
+        self.logger = fleet.logger.getChild('shards')
+
+        ring = ConsistentHashRing(list(range(self.shards)))
+        self.assignment = {ticker: ring.get(ticker) for ticker in fleet.tickers}
+        self.stats = {shard: ShardStats(shard=shard) for shard in range(self.shards)}
+        for ticker, shard in self.assignment.items():
+            self.stats[shard].tickers.append(ticker)
+        self._shard_by_figi = {fleet.instruments[ticker].figi: shard for ticker, shard in self.assignment.items()}
+        self._coalescers = {figi: BarCoalescer() for figi in self._shard_by_figi}
+        self._queues = {}
+        self._processes = {}
+        self._servers = []
+        self._stats_lock = threading.Lock()
+        self._last_stats_log = time.monotonic()
+
+    def run(self) -> dict[int, ShardStats]:
+        ledger = self.fleet.create_ledger()
+        ledger.start()
+        self._start_shards()
+        self.logger.info(f'Started {self.shards} shards: ' + '; '.join(
+            f'{shard}: {",".join(stats.tickers)}' for shard, stats in self.stats.items()))
+        try:
+            stream = SupervisedMarketDataStream(token=self.fleet.token, subscribe=self._subscribe, logger=self.logger,
+                                                stop_event=self.stop_event, client_factory=self.fleet.client_factory)
+            stream.run(on_connect=self._on_stream_connect, on_message=self._on_market_data)
+        finally:
+            self.stop_event.set()
+            self._stop_shards()
+            ledger.stop()
+        self.logger.info(f'Shards finished. {self.format_stats()}')
+        return self.stats
+
+    def format_stats(self) -> str:
+        with self._stats_lock:
+            return '; '.join(
+                f'shard {shard} (pid {stats.pid}): tickers={len(stats.tickers)} events={stats.events_processed} '
+                f'queue={stats.queue_depth} max_queue={stats.max_queue_depth} busy={stats.busy_time:.1f}s '
+                f'cpu={stats.cpu_time:.1f}s calls={stats.calls}' + ('' if stats.alive else ' DEAD')
+                for shard, stats in self.stats.items())
+
+    def _start_shards(self) -> None:
+        for shard in range(self.shards):
+            config = ShardConfig(
+                shard=shard,
+                token=self.fleet.token,
+                account_id=self.fleet.account_id,
+                sandbox_mode=self.sandbox_mode,
+                instruments=[self.fleet.instruments[ticker] for ticker in self.stats[shard].tickers],
+                positions=self.fleet.positions,
+                strategy_factory=self.strategy_factory,
+                stats_path=self.stats_path,
+                journal_path=self.journal_path,
+                store_path=self.store_path,
+                max_finished_trades=self.max_finished_trades,
+                logger_level=self.fleet.logger_level,
+                client_factory=self.fleet.client_factory,
+            )
+            events = multiprocessing.Queue()
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=run_shard, args=(config, events, child_conn),
+                                              name=f'robot-shard-{shard}', daemon=True)
+            process.start()
+            child_conn.close()
+            self.stats[shard].pid = process.pid
+            self._queues[shard] = events
+            self._processes[shard] = process
+            server = threading.Thread(target=self._serve, args=(shard, parent_conn), daemon=True,
+                                      name=f'robot-shard-{shard}-server')
+            server.start()
+            self._servers.append(server)
+
+    def _stop_shards(self) -> None:
+        for events in self._queues.values():
+            events.put(None)
+        for server in self._servers:
+            server.join()
+        for process in self._processes.values():
+            process.join(timeout=30)
+            if process.is_alive():
+                self.logger.warning(f'Shard {process.name} did not stop in time, terminating')
+                process.terminate()
+
+    def _serve(self, shard: int, conn) -> None:
+        """
+        Serves ledger and rate limiter calls of one worker and collects its stats
+        """
+        targets = {'ledger': self.fleet.ledger, 'rate_limiter': RateLimiter.for_token(self.fleet.token)}
+        stats = self.stats[shard]
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                if not self.stop_event.is_set():
+                    self.logger.error(f'Shard {shard} exited unexpectedly')
+                    stats.alive = False
+                return
+            kind = message[0]
+            if kind == 'call':
+                _, target, method, args = message
+                try:
+                    conn.send(('ok', getattr(targets[target], method)(*args)))
+                except Exception as error:  # pylint:disable=broad-except
+                    conn.send(('error', error))
+                stats.calls += 1
+            elif kind == 'stats':
+                processed, busy_time, cpu_time, queue_depth, max_queue_depth = message[1]
+                with self._stats_lock:
+                    stats.events_processed = processed
+                    stats.busy_time = busy_time
+                    stats.cpu_time = cpu_time
+                    stats.queue_depth = queue_depth
+                    stats.max_queue_depth = max_queue_depth
+            elif kind == 'finished':
+                return
+
+    def _subscribe(self, market_data_stream: MarketDataStreamManager) -> None:
+        market_data_stream.candles.subscribe([
+            CandleInstrument(figi=figi, interval=self.candle_interval) for figi in self._shard_by_figi
+        ])
+        market_data_stream.info.subscribe([InfoInstrument(figi=figi) for figi in self._shard_by_figi])
+
+    def _on_stream_connect(self, client: Services, reconnected: bool) -> None:
+        if not reconnected:
+            return
+        # replays candles missed while the stream was down, the same way a single robot does
+        if self.candle_interval not in CANDLE_INTERVALS:
+            self.logger.warning(f'Cannot backfill candles of interval {self.candle_interval}')
+            return
+        rate_limiter = RateLimiter.for_token(self.fleet.token)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for figi, coalescer in self._coalescers.items():
+            if coalescer.last_time is None:
+                continue
+            # the same account limits as the robots' own requests, history waits behind orders
+            rate_limiter.acquire('market_data', RequestPriority.HISTORY)
+            for candle in client.get_all_candles(from_=coalescer.last_time, to=now, figi=figi,
+                                                 interval=CANDLE_INTERVALS[self.candle_interval]):
+                candle = TradingRobot.to_stream_candle(figi, candle, self.candle_interval)
+                self._on_market_data(client, MarketDataResponse(candle=candle), backfilled=True)
+
+    def _on_market_data(self, client: Services, market_data: MarketDataResponse, backfilled: bool = False) -> None:
+        if market_data.candle:
+            figi = market_data.candle.figi
+            if figi not in self._coalescers or not self._coalescers[figi].push(market_data.candle):
+                return
+        elif market_data.trading_status:
+            figi = market_data.trading_status.figi
+        else:
+            return
+        shard = self._shard_by_figi.get(figi)
+        if shard is None:
+            return
+        self._queues[shard].put(BackfilledCandle(market_data.candle) if backfilled else market_data)
+        stats = self.stats[shard]
+        with self._stats_lock:
+            stats.events_sent += 1
+        if time.monotonic() - self._last_stats_log >= self.stats_log_interval:
+            self._last_stats_log = time.monotonic()
+            self.logger.info(f'Shards: {self.format_stats()}')
+
+
+def run_shard(config: ShardConfig, events: multiprocessing.Queue, conn) -> None:
+    """
+    Worker process entry point: creates robots of the shard and feeds them events from the parent
+    """
+    # Ctrl+C is delivered to the whole process group, the parent stops workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logger = _setup_shard_logger(config)
+    channel = _ShardChannel(conn)
+    ledger = _ShardProxy(channel, 'ledger')
+    rate_limiter = _ShardProxy(channel, 'rate_limiter')
+
+    store = TradeStore(config.store_path) if config.store_path else None
+    robots: dict[str, TradingRobot] = {}
+    for instrument in config.instruments:
+        factory = TradingRobotFactory.from_bootstrap(
+            token=config.token, account_id=config.account_id, instrument_info=instrument,
+            sandbox_mode=config.sandbox_mode, positions_snapshot=config.positions, logger_level=config.logger_level,
+            client_factory=config.client_factory)
+        robot = factory.create_robot(config.strategy_factory(instrument.ticker), sandbox_mode=config.sandbox_mode)
+        robot.account_ledger = ledger
+        robot.rate_limiter = rate_limiter
+        if config.stats_path:
+            stats = _load_statistics(config.stats_path.format(ticker=instrument.ticker), logger)
+            if stats is not None:
+                robot.trade_statistics = stats
+        robot.trade_statistics.max_finished_trades = config.max_finished_trades
+        if config.journal_path:
+            journal = TradeJournal(config.journal_path.format(ticker=instrument.ticker))
+            if journal.exists():
+                journal.restore(robot.trade_statistics)
+            robot.trade_statistics.attach_journal(journal)
+        if store is not None:
+            store.import_analyzer(instrument.ticker, robot.trade_statistics)
+            robot.trade_statistics.attach_store(store, instrument.ticker)
+        robot.load_history()
+        robots[instrument.figi] = robot
+    logger.info(f'Shard {config.shard} ready: {len(robots)} robots')
+
+    processed = 0
+    busy_ns = 0
+    # events already delivered to the worker: before every event the queue is drained into it, so its length is
+    # the queue depth at that moment. The parent cannot tell it, it learns the processed count once per interval
+    backlog = deque()
+    max_depth = 0
+    next_stats = time.monotonic() + config.stats_interval
+    try:
+        with config.client_factory(config.token, app_name=TradingRobot.APP_NAME) as client:
+            while True:
+                if not backlog:
+                    try:
+                        backlog.append(events.get(timeout=max(0.0, next_stats - time.monotonic())))
+                    except queue.Empty:
+                        pass
+                while True:
+                    try:
+                        backlog.append(events.get_nowait())
+                    except queue.Empty:
+                        break
+                max_depth = max(max_depth, len(backlog))
+                market_data = backlog.popleft() if backlog else False
+                if market_data is None:
+                    break
+                if market_data is not False:
+                    figi = market_data.candle.figi if market_data.candle else market_data.trading_status.figi
+                    started = time.perf_counter_ns()
+                    try:
+                        # pylint:disable=protected-access
+                        if isinstance(market_data, BackfilledCandle):
+                            robots[figi]._backfill_candle(client, market_data.candle)
+                        else:
+                            robots[figi]._on_market_data(client, market_data)
+                    except Exception as error:  # pylint:disable=broad-except
+                        logger.exception(f'Robot {robots[figi].robot_id} failed to process update: {error}')
+                    busy_ns += time.perf_counter_ns() - started
+                    processed += 1
+                if time.monotonic() >= next_stats:
+                    channel.send('stats', (processed, busy_ns / 1e9, time.process_time(), len(backlog), max_depth))
+                    next_stats = time.monotonic() + config.stats_interval
+    finally:
+        if config.stats_path:
+            for robot in robots.values():
+                robot.trade_statistics.save_to_file(config.stats_path.format(ticker=robot.robot_id))
+        for robot in robots.values():
+            if robot.trade_statistics.journal is not None:
+                robot.trade_statistics.journal.close(robot.trade_statistics)
+        if store is not None:
+            store.close()
+        channel.send('stats', (processed, busy_ns / 1e9, time.process_time(), len(backlog), max_depth))
+        channel.send('finished', None)
+        conn.close()
+        logger.info(f'Shard {config.shard} stopped after {processed} events')
+
+
+def _load_statistics(path: str, logger: logging.Logger) -> TradeStatisticsAnalyzer | None:
+    """
+    Statistics saved by the previous run, None if there are none. An empty or broken file must not take down
+    the whole shard, the robot starts with fresh statistics instead
+    """
+    try:
+        if os.path.getsize(path) == 0:
+            logger.warning(f'Statistics file {path} is empty, starting with fresh statistics')
+            return None
+        return TradeStatisticsAnalyzer.load_from_file(path)
+    except FileNotFoundError:
+        return None
+    except Exception as error:  # pylint:disable=broad-except
+        logger.error(f'Failed to load statistics from {path}, starting with fresh statistics: {error}')
+        return None
+
+
+def _setup_shard_logger(config: ShardConfig) -> logging.Logger:
+    logger = logging.getLogger(f'robot.shard{config.shard}')
+    logger.setLevel(config.logger_level)
+    if not logger.handlers:
+        formatter = logging.Formatter(fmt=('%(asctime)s %(levelname)s: %(message)s'))
+        handler = logging.StreamHandler(stream=sys.stderr)
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+    return logger
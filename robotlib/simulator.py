@@ -0,0 +1,554 @@
+from __future__ import annotations
+
+import datetime
+import logging
+import random
+import threading
+import uuid
+
+from dataclasses import dataclass
+
+from tinkoff.invest import (
+    Account,
+    AccessLevel,
+    AccountStatus,
+    AccountType,
+    Candle,
+    CandleInstrument,
+    CancelOrderResponse,
+    GetAccountsResponse,
+    GetTradingStatusResponse,
+    HistoricCandle,
+    Instrument,
+    InstrumentIdType,
+    InstrumentResponse,
+    MarketDataResponse,
+    MoneyValue,
+    OrderDirection,
+    OrderExecutionReportStatus,
+    OrderState,
+    OrderType,
+    PositionData,
+    PositionsMoney,
+    PositionsResponse,
+    PositionsSecurities,
+    PositionsStreamResponse,
+    PostOrderResponse,
+    Quotation,
+    SecurityTradingStatus,
+    SharesResponse,
+    SubscriptionInterval,
+)
+from tinkoff.invest.exceptions import InvestError
+
+from robotlib.money import Money
+from robotlib.ratelimit import RateLimiter
+
+
+@dataclass
+class SimulatedOrder:
+    order_id: str
+    figi: str
+    direction: OrderDirection
+    order_type: OrderType
+    lots_requested: int
+    price: float | None  # limit price, None for market orders
+    created_at: datetime.datetime
+    status: OrderExecutionReportStatus = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_NEW
+    lots_executed: int = 0
+    executed_price: float = 0.0
+    commission: float = 0.0
+
+
+class ExchangeSimulator:
+    """
+    In-process stand-in for the broker API with the subset of services the robot uses: instruments,
+    accounts and positions, market data stream, orders and order state.
+
+    Candles of every instrument are split in two: the first `history_size` ones are history that get_all_candles
+    returns right away, the rest is replayed by market data streams. Each replayed candle moves the simulated clock,
+    sets the last price of its instrument and matches resting limit orders against its high/low.
+    Market orders fill at the last close. With speed=None candles are replayed as fast as the consumer reads them,
+    which keeps runs deterministic; otherwise speed is simulated seconds per real second.
+
+    Pass `simulator.client` wherever a client factory is accepted (TradingRobotFactory, TradingRobot,
+    TradingRobotFleetFactory, AccountLedger, SupervisedMarketDataStream) and `simulator.token` as the token:
+    requests with it are not throttled unless rate_limits are given.
+    """
+
+    token: str
+    instruments: dict[str, Instrument]  # figi -> instrument
+    candles: dict[str, list[HistoricCandle]]  # figi -> candles sorted by time
+    account_id: str
+    sandbox_mode: bool
+    currency: str
+    speed: float | None
+    commission: float
+    money: float
+    securities: dict[str, int]  # figi -> balance in pieces
+    orders: dict[str, SimulatedOrder]
+    last_prices: dict[str, float]
+    now: datetime.datetime
+    finished: threading.Event  # set when every stream has replayed all candles
+    logger: logging.Logger
+
+    def __init__(self, instruments: list[Instrument],  # pylint:disable=too-many-arguments
+                 candles: dict[str, list[HistoricCandle]], money: float = 100000.0, currency: str = 'rub',
+                 account_id: str = 'simulator', sandbox_mode: bool = True, speed: float = None,
+                 history_size: int = 60, commission: float = 0.0005, securities: dict[str, int] = None,
+                 rate_limits: dict[str, int] = None, logger: logging.Logger = None):
+        self.token = f'simulator-{uuid.uuid4()}'
+        RateLimiter.set_for_token(self.token, RateLimiter(
+            rate_limits or {group: 10 ** 9 for group in RateLimiter.DEFAULT_LIMITS}))
+        self.instruments = {instrument.figi: instrument for instrument in instruments}
+        self.candles = {figi: sorted(candles.get(figi, []), key=lambda candle: candle.time)
+                        for figi in self.instruments}
+        self.account_id = account_id
+        self.sandbox_mode = sandbox_mode
+        self.currency = currency
+        self.speed = speed
+        self.commission = commission
+        self.money = money
+        self.securities = dict(securities or {})
+        self.orders = {}
+        self.logger = logger or logging.getLogger('robot.simulator')
+        self.finished = threading.Event()
+
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        self._version = 0
+        self._active_streams = 0
+        self._released = {figi: min(history_size, len(bars)) for figi, bars in self.candles.items()}
+        self.last_prices = {figi: self._to_float(bars[index - 1].close)
+                            for figi, bars in self.candles.items() if (index := self._released[figi]) > 0}
+        history_ends = [bars[self._released[figi] - 1].time for figi, bars in self.candles.items()
+                        if self._released[figi] > 0]
+        first_live = [bars[0].time for bars in self.candles.values() if bars]
+        self.now = max(history_ends) if history_ends else min(first_live, default=datetime.datetime.now(
+            datetime.timezone.utc))
+
+    def client(self, token: str = None, app_name: str = None) -> SimulatedClient:  # pylint:disable=unused-argument
+        return SimulatedClient(self)
+
+    @staticmethod
+    def synthetic_candles(count: int, start: datetime.datetime = None,  # pylint:disable=too-many-arguments
+                          price: float = 100.0, volatility: float = 0.002, seed: int = 0,
+                          interval: datetime.timedelta = datetime.timedelta(minutes=1)) -> list[HistoricCandle]:
+        """
+        Random walk of 1-minute candles, reproducible for the same seed
+        """
+        rng = random.Random(seed)
+        start = start or datetime.datetime(2024, 1, 1, 7, 0, tzinfo=datetime.timezone.utc)
+        candles = []
+        for i in range(count):
+            close = max(0.01, price * (1 + rng.gauss(0, volatility)))
+            high = max(price, close) * (1 + abs(rng.gauss(0, volatility / 2)))
+            low = min(price, close) * (1 - abs(rng.gauss(0, volatility / 2)))
+            candles.append(HistoricCandle(
+                open=Money(price).to_quotation(), high=Money(high).to_quotation(), low=Money(low).to_quotation(),
+                close=Money(close).to_quotation(), volume=rng.randint(1, 1000), time=start + interval * i,
+                is_complete=True))
+            price = close
+        return candles
+
+    def get_positions(self) -> PositionsResponse:
+        with self._lock:
+            return PositionsResponse(
+                money=[MoneyValue(self.currency, *self._split(self.money))],
+                securities=[PositionsSecurities(figi=figi, balance=balance, blocked=0)
+                            for figi, balance in self.securities.items()],
+            )
+
+    def get_all_candles(self, figi: str, from_: datetime.datetime, to: datetime.datetime = None,
+                        interval=None) -> list[HistoricCandle]:  # pylint:disable=unused-argument
+        """
+        Already released candles in [from_, to). Times later than the simulated clock are read relative
+        to the wall clock, so `now - 1 hour` requested by the robot means one simulated hour back
+        """
+        with self._lock:
+            now = self.now
+            released = self.candles.get(figi, [])[:self._released.get(figi, 0)]
+        if from_ > now:
+            from_ = now - (datetime.datetime.now(datetime.timezone.utc) - from_)
+        to = min(to, now) if to is not None else now
+        return [candle for candle in released if from_ <= candle.time <= to]
+
+    def post_order(self, figi: str, quantity: int, direction: OrderDirection,  # pylint:disable=too-many-arguments
+                   account_id: str, order_type: OrderType, order_id: str = None,
+                   price: Quotation = None) -> PostOrderResponse:
+        self.check_account(account_id)
+        if figi not in self.instruments:
+            raise InvestError(f'Instrument {figi} not found')
+        if quantity <= 0:
+            raise InvestError(f'Invalid quantity {quantity}')
+        with self._lock:
+            order = SimulatedOrder(
+                order_id=order_id or str(uuid.uuid4()), figi=figi, direction=direction, order_type=order_type,
+                lots_requested=quantity, created_at=self.now,
+                price=self._to_float(price) if order_type == OrderType.ORDER_TYPE_LIMIT and price else None)
+            self.orders[order.order_id] = order
+            last_price = self.last_prices.get(figi)
+            if last_price is None:
+                order.status = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_REJECTED
+            elif order.price is None:
+                self._fill(order, last_price)
+            elif (direction == OrderDirection.ORDER_DIRECTION_BUY and order.price >= last_price) or \
+                    (direction == OrderDirection.ORDER_DIRECTION_SELL and order.price <= last_price):
+                self._fill(order, last_price)
+            state = self._order_state(order)
+        return PostOrderResponse(
+            order_id=state.order_id, execution_report_status=state.execution_report_status,
+            lots_requested=state.lots_requested, lots_executed=state.lots_executed,
+            initial_order_price=state.initial_order_price, executed_order_price=state.executed_order_price,
+            total_order_amount=state.total_order_amount, initial_commission=state.initial_commission,
+            executed_commission=state.executed_commission, figi=state.figi, direction=state.direction,
+            initial_security_price=state.initial_security_price, order_type=state.order_type)
+
+    def get_order_state(self, account_id: str, order_id: str) -> OrderState:
+        self.check_account(account_id)
+        with self._lock:
+            if order_id not in self.orders:
+                raise InvestError(f'Order {order_id} not found')
+            return self._order_state(self.orders[order_id])
+
+    def get_orders(self, account_id: str) -> list[OrderState]:
+        self.check_account(account_id)
+        with self._lock:
+            return [self._order_state(order) for order in self.orders.values()
+                    if order.status == OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_NEW]
+
+    def cancel_order(self, account_id: str, order_id: str) -> CancelOrderResponse:
+        self.check_account(account_id)
+        with self._lock:
+            order = self.orders.get(order_id)
+            if order is None or order.status != OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_NEW:
+                raise InvestError(f'Order {order_id} cannot be cancelled')
+            order.status = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_CANCELLED
+            return CancelOrderResponse(time=self.now)
+
+    def create_market_data_stream(self) -> SimulatedMarketDataStream:
+        return SimulatedMarketDataStream(self)
+
+    def stream_started(self) -> None:
+        with self._lock:
+            self._active_streams += 1
+
+    def stream_finished(self, exhausted: bool = True) -> None:
+        """
+        The session is over when the last replaying stream ends after replaying all its candles. A stream stopped
+        earlier, e.g. by the stall watchdog, is reconnected and replays the rest
+        """
+        with self._lock:
+            self._active_streams -= 1
+            if self._active_streams == 0 and exhausted:
+                self.finished.set()
+
+    def apply_candle(self, figi: str, candle: Candle | HistoricCandle) -> None:
+        """
+        Moves the clock and the last price of the instrument, matches resting limit orders against the candle
+        """
+        with self._lock:
+            self.now = max(self.now, candle.time)
+            self.last_prices[figi] = self._to_float(candle.close)
+            self._match_limit_orders(figi, candle)
+
+    def release_next(self, figis: list[str]) -> Candle | None:
+        """
+        Replays the earliest not yet released candle among figis. Returns None when they are exhausted
+        """
+        with self._lock:
+            pending = [(self.candles[figi][self._released[figi]].time, figi) for figi in figis
+                       if figi in self.candles and self._released[figi] < len(self.candles[figi])]
+            if not pending:
+                return None
+            _, figi = min(pending)
+            historic_candle = self.candles[figi][self._released[figi]]
+            self._released[figi] += 1
+            self.apply_candle(figi, historic_candle)
+            return Candle(figi=figi, interval=SubscriptionInterval.SUBSCRIPTION_INTERVAL_ONE_MINUTE,
+                          open=historic_candle.open, high=historic_candle.high, low=historic_candle.low,
+                          close=historic_candle.close, volume=historic_candle.volume, time=historic_candle.time,
+                          last_trade_ts=historic_candle.time)
+
+    def wait_for_change(self, version: int, timeout: float) -> int:
+        with self._changed:
+            if self._version == version:
+                self._changed.wait(timeout)
+            return self._version
+
+    def _match_limit_orders(self, figi: str, candle: Candle | HistoricCandle) -> None:
+        low, high = self._to_float(candle.low), self._to_float(candle.high)
+        for order in list(self.orders.values()):
+            if order.figi != figi or order.status != OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_NEW:
+                continue
+            if (order.direction == OrderDirection.ORDER_DIRECTION_BUY and low <= order.price) or \
+                    (order.direction == OrderDirection.ORDER_DIRECTION_SELL and high >= order.price):
+                self._fill(order, order.price)
+
+    def _fill(self, order: SimulatedOrder, price: float) -> None:
+        pieces = order.lots_requested * self.instruments[order.figi].lot
+        amount = price * pieces
+        commission = amount * self.commission
+        if order.direction == OrderDirection.ORDER_DIRECTION_BUY:
+            if amount + commission > self.money:
+                self.logger.debug(f'Order {order.order_id} rejected: not enough money')
+                order.status = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_REJECTED
+                return
+            self.money -= amount + commission
+            self.securities[order.figi] = self.securities.get(order.figi, 0) + pieces
+        else:
+            if self.securities.get(order.figi, 0) < pieces:
+                self.logger.debug(f'Order {order.order_id} rejected: not enough securities')
+                order.status = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_REJECTED
+                return
+            self.money += amount - commission
+            self.securities[order.figi] -= pieces
+        order.status = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_FILL
+        order.lots_executed = order.lots_requested
+        order.executed_price = price
+        order.commission = commission
+        self._version += 1
+        self._changed.notify_all()
+
+    def _order_state(self, order: SimulatedOrder) -> OrderState:
+        lot = self.instruments[order.figi].lot
+        initial_price = order.price if order.price is not None else self.last_prices.get(order.figi, 0.0)
+        return OrderState(
+            order_id=order.order_id,
+            execution_report_status=order.status,
+            lots_requested=order.lots_requested,
+            lots_executed=order.lots_executed,
+            initial_order_price=self._money_value(initial_price * order.lots_requested * lot),
+            executed_order_price=self._money_value(order.executed_price),
+            total_order_amount=self._money_value(order.executed_price * order.lots_executed * lot),
+            average_position_price=self._money_value(order.executed_price),
+            initial_commission=self._money_value(initial_price * order.lots_requested * lot * self.commission),
+            executed_commission=self._money_value(order.commission),
+            figi=order.figi,
+            direction=order.direction,
+            initial_security_price=self._money_value(initial_price),
+            stages=[],
+            service_commission=self._money_value(0.0),
+            currency=self.currency,
+            order_type=order.order_type,
+            order_date=order.created_at,
+        )
+
+    def check_account(self, account_id: str) -> None:
+        if account_id != self.account_id:
+            raise InvestError(f'Account {account_id} not found')
+
+    def _money_value(self, value: float) -> MoneyValue:
+        return MoneyValue(self.currency, *self._split(value))
+
+    @staticmethod
+    def _split(value: float) -> tuple[int, int]:
+        units = int(value)
+        return units, int(round((value - units) * 10 ** 9))
+
+    @staticmethod
+    def _to_float(amount: Quotation | MoneyValue) -> float:
+        return amount.units + amount.nano / (10 ** 9)
+
+
+class SimulatedMarketDataStream:
+    """
+    Replays candles of subscribed instruments. Every candle is released once, so there should be
+    one subscriber per instrument, as in live trading
+    """
+
+    class _Subscription:
+        def __init__(self):
+            self.instruments = []
+
+        def subscribe(self, instruments: list) -> None:
+            self.instruments.extend(instruments)
+
+        def unsubscribe(self, instruments: list) -> None:
+            figis = {instrument.figi for instrument in instruments}
+            self.instruments = [instrument for instrument in self.instruments if instrument.figi not in figis]
+
+    def __init__(self, simulator: ExchangeSimulator):
+        self.simulator = simulator
+        self.candles = self._Subscription()
+        self.order_book = self._Subscription()
+        self.trades = self._Subscription()
+        self.info = self._Subscription()
+        self._stop_event = threading.Event()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def __iter__(self):
+        figis = [instrument.figi for instrument in self.candles.instruments
+                 if isinstance(instrument, CandleInstrument)]
+        if not figis:
+            # nothing to replay, such a stream neither holds nor ends the session
+            return
+        self.simulator.stream_started()
+        exhausted = False
+        try:
+            previous_time = None
+            while not self._stop_event.is_set():
+                candle = self.simulator.release_next(figis)
+                if candle is None:
+                    exhausted = True
+                    return
+                if self.simulator.speed and previous_time is not None:
+                    if self._stop_event.wait((candle.time - previous_time).total_seconds() / self.simulator.speed):
+                        return
+                previous_time = candle.time
+                yield MarketDataResponse(candle=candle)
+        finally:
+            self.simulator.stream_finished(exhausted)
+
+
+class SimulatedClient:
+    """
+    Context manager returned by ExchangeSimulator.client, mirrors `with Client(token) as client`
+    """
+
+    def __init__(self, simulator: ExchangeSimulator):
+        self.simulator = simulator
+
+    def __enter__(self) -> SimulatedServices:
+        return SimulatedServices(self.simulator)
+
+    def __exit__(self, *args) -> None:
+        pass
+
+
+class SimulatedServices:  # pylint:disable=too-few-public-methods
+    def __init__(self, simulator: ExchangeSimulator):
+        self.simulator = simulator
+        self.instruments = _InstrumentsService(simulator)
+        self.market_data = _MarketDataService(simulator)
+        self.orders = _OrdersService(simulator)
+        self.operations = _OperationsService(simulator)
+        self.operations_stream = _OperationsStreamService(simulator)
+        self.users = _UsersService(simulator, sandbox=False)
+        self.sandbox = _SandboxService(simulator)
+
+    def create_market_data_stream(self) -> SimulatedMarketDataStream:
+        return self.simulator.create_market_data_stream()
+
+    def get_all_candles(self, figi: str, from_: datetime.datetime, to: datetime.datetime = None,
+                        interval=None) -> list[HistoricCandle]:
+        return self.simulator.get_all_candles(figi=figi, from_=from_, to=to, interval=interval)
+
+
+class _InstrumentsService:
+    def __init__(self, simulator: ExchangeSimulator):
+        self.simulator = simulator
+
+    def shares(self, **kwargs) -> SharesResponse:  # pylint:disable=unused-argument
+        return SharesResponse(instruments=list(self.simulator.instruments.values()))
+
+    def get_instrument_by(self, id_type: InstrumentIdType, id: str,  # pylint:disable=redefined-builtin
+                          class_code: str = '') -> InstrumentResponse:
+        for instrument in self.simulator.instruments.values():
+            if id_type == InstrumentIdType.INSTRUMENT_ID_TYPE_FIGI:
+                found = instrument.figi == id
+            elif id_type == InstrumentIdType.INSTRUMENT_ID_TYPE_TICKER:
+                found = instrument.ticker == id and (not class_code or instrument.class_code == class_code)
+            else:
+                found = False
+            if found:
+                return InstrumentResponse(instrument=instrument)
+        raise InvestError(f'Instrument {id} not found')
+
+
+class _MarketDataService:
+    def __init__(self, simulator: ExchangeSimulator):
+        self.simulator = simulator
+
+    def get_trading_status(self, figi: str) -> GetTradingStatusResponse:
+        return GetTradingStatusResponse(
+            figi=figi, trading_status=SecurityTradingStatus.SECURITY_TRADING_STATUS_NORMAL_TRADING,
+            limit_order_available_flag=True, market_order_available_flag=True, api_trade_available_flag=True)
+
+
+class _UsersService:
+    def __init__(self, simulator: ExchangeSimulator, sandbox: bool):
+        self.simulator = simulator
+        self.sandbox = sandbox
+
+    def get_accounts(self) -> GetAccountsResponse:
+        if self.simulator.sandbox_mode != self.sandbox:
+            return GetAccountsResponse(accounts=[])
+        return GetAccountsResponse(accounts=[Account(
+            id=self.simulator.account_id, type=AccountType.ACCOUNT_TYPE_TINKOFF, name='simulator',
+            status=AccountStatus.ACCOUNT_STATUS_OPEN, access_level=AccessLevel.ACCOUNT_ACCESS_LEVEL_FULL_ACCESS)])
+
+
+class _OrdersService:
+    def __init__(self, simulator: ExchangeSimulator):
+        self.simulator = simulator
+
+    def post_order(self, **kwargs) -> PostOrderResponse:
+        return self.simulator.post_order(**kwargs)
+
+    def get_order_state(self, account_id: str, order_id: str) -> OrderState:
+        return self.simulator.get_order_state(account_id, order_id)
+
+    def get_orders(self, account_id: str) -> list[OrderState]:
+        return self.simulator.get_orders(account_id)
+
+    def cancel_order(self, account_id: str, order_id: str) -> CancelOrderResponse:
+        return self.simulator.cancel_order(account_id, order_id)
+
+
+class _OperationsService:
+    def __init__(self, simulator: ExchangeSimulator):
+        self.simulator = simulator
+
+    def get_positions(self, account_id: str) -> PositionsResponse:
+        self.simulator.check_account(account_id)
+        return self.simulator.get_positions()
+
+
+class _OperationsStreamService:
+    def __init__(self, simulator: ExchangeSimulator):
+        self.simulator = simulator
+
+    def positions_stream(self, accounts: list[str]):
+        """
+        Sends the account positions after every fill until all candles are replayed
+        """
+        version = -1
+        while not self.simulator.finished.is_set():
+            new_version = self.simulator.wait_for_change(version, timeout=1.0)
+            if new_version == version:
+                continue
+            version = new_version
+            positions = self.simulator.get_positions()
+            yield PositionsStreamResponse(position=PositionData(
+                account_id=accounts[0],
+                money=[PositionsMoney(available_value=money, blocked_value=MoneyValue(money.currency, 0, 0))
+                       for money in positions.money],
+                securities=positions.securities,
+                date=self.simulator.now))
+
+
+class _SandboxService(_UsersService):
+    def __init__(self, simulator: ExchangeSimulator):
+        super().__init__(simulator, sandbox=True)
+
+    def get_sandbox_accounts(self) -> GetAccountsResponse:
+        return self.get_accounts()
+
+    def get_sandbox_positions(self, account_id: str) -> PositionsResponse:
+        self.simulator.check_account(account_id)
+        return self.simulator.get_positions()
+
+    def post_sandbox_order(self, **kwargs) -> PostOrderResponse:
+        return self.simulator.post_order(**kwargs)
+
+    def get_sandbox_order_state(self, account_id: str, order_id: str) -> OrderState:
+        return self.simulator.get_order_state(account_id, order_id)
+
+    def get_sandbox_orders(self, account_id: str) -> list[OrderState]:
+        return self.simulator.get_orders(account_id)
+
+    def cancel_sandbox_order(self, account_id: str, order_id: str) -> CancelOrderResponse:
+        return self.simulator.cancel_order(account_id, order_id)
@@ -2,18 +2,89 @@ from __future__ import annotations
 
 import datetime
 import logging
+import math
+import os
 import pickle
 import uuid
 
 from abc import ABC, abstractmethod
-from dataclasses import asdict
+from collections import deque
+from dataclasses import dataclass, fields
+from typing import TYPE_CHECKING
 
-import pandas as pd
+import numpy as np
 
 from tinkoff.invest import OrderState, Instrument, OrderDirection, Quotation, MoneyValue, OrderExecutionReportStatus, \
     OrderType
 
-from robotlib.money import Money
+from robotlib.journal import TradeJournal, order_from_record, order_to_record
+from robotlib.costs import CostModel, DEFAULT_COST_MODEL
+from robotlib.money import Money, MoneyArray
+from robotlib.store import TradeStore
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from robotlib.equity import EquityTracker
+
+
+@dataclass
+class TradeAggregates:
+    """
+    Running totals over all fills, updated in O(1) per fill. Realized P&L uses the average cost of the open position,
+    a fill that reduces the position counts as a win or a loss. Drawdown is measured on realized P&L net of commission.
+    """
+    fills: int = 0
+    turnover: float = 0.0
+    commission: float = 0.0
+    realized_pnl: float = 0.0
+    wins: int = 0
+    losses: int = 0
+    gross_profit: float = 0.0
+    gross_loss: float = 0.0
+    peak_pnl: float = 0.0
+    max_drawdown: float = 0.0
+    position: int = 0  # lots, negative for a short position
+    average_price: float = 0.0  # per lot
+
+    @property
+    def net_pnl(self) -> float:
+        return self.realized_pnl - self.commission
+
+    @property
+    def profit_factor(self) -> float:
+        if self.gross_loss:
+            return self.gross_profit / self.gross_loss
+        return math.inf if self.gross_profit else 0.0
+
+    def add_fill(self, sign: int, lots: int, amount: float, commission: float = 0.0) -> None:
+        self.fills += 1
+        self.turnover += abs(amount)
+        self.commission += commission
+        price = abs(amount) / abs(lots)
+        signed_lots = lots * sign
+        if self.position * signed_lots >= 0:
+            position = self.position + signed_lots
+            self.average_price = (self.average_price * abs(self.position) + price * abs(signed_lots)) / abs(position)
+            self.position = position
+        else:
+            closed = min(abs(signed_lots), abs(self.position))
+            pnl = (price - self.average_price) * closed * (1 if self.position > 0 else -1)
+            self.realized_pnl += pnl
+            if pnl > 0:
+                self.wins += 1
+                self.gross_profit += pnl
+            elif pnl < 0:
+                self.losses += 1
+                self.gross_loss -= pnl
+            self.position += signed_lots
+            if self.position == 0:
+                self.average_price = 0.0
+            elif abs(signed_lots) > closed:
+                # the position is reversed, the rest is opened at the fill price
+                self.average_price = price
+        self.peak_pnl = max(self.peak_pnl, self.net_pnl)
+        self.max_drawdown = max(self.max_drawdown, self.peak_pnl - self.net_pnl)
 
 
 class TradeStatisticsAnalyzer:
@@ -21,40 +92,182 @@ class TradeStatisticsAnalyzer:
             OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_NEW,
             OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_PARTIALLYFILL
         ]
+    REPORT_FIELDS = [field.name for field in fields(OrderState)]
+    MONEY_FIELDS = {'initial_order_price', 'executed_order_price', 'total_order_amount', 'average_position_price',
+                    'initial_commission', 'executed_commission', 'initial_security_price', 'service_commission'}
 
     trades: dict[str, OrderState]
+    pending: dict[str, OrderState]
+    evicted_orders: set[str]
+    aggregates: TradeAggregates
     positions: int
     money: float
     instrument_info: Instrument
     logger: logging.Logger
-
-    def __init__(self, positions: int, money: float, instrument_info: Instrument, logger: logging.Logger):
+    journal: TradeJournal | None
+    store: TradeStore | None
+    store_robot_id: str | None
+    equity: EquityTracker | None
+    max_finished_trades: int | None
+
+    def __init__(self, positions: int, money: float, instrument_info: Instrument, logger: logging.Logger,
+                 max_finished_trades: int = None):
         self.trades = {}
+        self.pending = {}
+        self.evicted_orders = set()
+        self.aggregates = TradeAggregates()
         self.positions = positions
         self.money = money
         self.instrument_info = instrument_info
         self.logger = logger
+        self.journal = None
+        self.store = None
+        self.store_robot_id = None
+        self.equity = None
+        # finished orders above this number are dropped from memory, oldest first; they stay in the journal
+        # snapshot aggregates and in the store. Their ids are kept in evicted_orders, so a late update of such
+        # an order is not counted as a new fill
+        self.max_finished_trades = max_finished_trades
+        self._finished = deque()
+
+    def load_state(self, positions: int, money: float, trades: dict[str, OrderState],
+                   aggregates: TradeAggregates = None, evicted_orders: set[str] = None) -> None:
+        """
+        Replaces the state, e.g. from a journal snapshot. Without aggregates they are recomputed from trades,
+        every trade counted as one fill.
+        """
+        self.positions = positions
+        self.money = money
+        self.trades = trades
+        self.evicted_orders = set(evicted_orders or ())
+        self.pending = {order_id: trade for order_id, trade in trades.items()
+                        if trade.execution_report_status in self.PENDING_ORDER_STATUSES}
+        self._finished = deque(order_id for order_id in trades if order_id not in self.pending)
+        if aggregates is None:
+            aggregates = TradeAggregates()
+            for trade in trades.values():
+                if trade.lots_executed:
+                    aggregates.add_fill(self._sign(trade), trade.lots_executed,
+                                        self.convert_from_quotation(trade.total_order_amount),
+                                        self.convert_from_quotation(getattr(trade, 'executed_commission', None)) or 0.0)
+        self.aggregates = aggregates
+
+    def attach_journal(self, journal: TradeJournal) -> None:
+        """
+        Every following add_trade and cancel_order is appended to the journal
+        """
+        self.journal = journal
+
+    def attach_store(self, store: TradeStore, robot_id: str) -> None:
+        """
+        Every following add_trade and cancel_order is written to the shared store under robot_id
+        """
+        self.store = store
+        self.store_robot_id = robot_id
+
+    def attach_equity(self, lot: int = None, periods_per_year: float = None) -> EquityTracker:
+        """
+        Starts an equity curve from the current money and positions, following fills are applied to it.
+        Call mark_to_market on every bar close. `lot` defaults to the instrument lot
+        """
+        from robotlib.equity import EquityTracker  # pylint:disable=import-outside-toplevel
+        self.equity = EquityTracker(cash=self.money, positions=self.positions,
+                                    lot=lot if lot is not None else self.instrument_info.lot,
+                                    periods_per_year=periods_per_year)
+        return self.equity
+
+    def mark_to_market(self, price: float) -> None:
+        if self.equity is not None:
+            self.equity.mark(price)
 
     def add_trade(self, trade: OrderState) -> None:
-        self.logger.debug(f'Updating balance. Current state: [positions={self.positions} money={self.money}]. '
-                          f'trade: {trade}')
-
-        if trade.order_id in self.trades:
-            trade.direction = self.trades[trade.order_id].direction
-            sign = 1 if trade.direction == OrderDirection.ORDER_DIRECTION_BUY else -1
-            self.positions += (trade.lots_executed - self.trades[trade.order_id].lots_executed) * sign
-            self.money -= (self.convert_from_quotation(trade.total_order_amount)
-                           - self.convert_from_quotation(self.trades[trade.order_id].total_order_amount)) * sign
+        if trade.order_id in self.evicted_orders:
+            self.logger.debug(f'Order {trade.order_id} is already finished and evicted, update ignored')
+            return
+        previous = self.trades.get(trade.order_id)
+        self.apply_trade(trade)
+        if self.journal is not None:
+            self.journal.add_trade(trade)
+            self.journal.maybe_compact(self)
+        if self.store is not None:
+            self.store.add_trade(self.store_robot_id, trade, previous, self.positions, self.money)
+
+    def apply_trade(self, trade: OrderState) -> None:
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            self.logger.debug(f'Updating balance. Current state: [positions={self.positions} money={self.money}]. '
+                              f'trade: {trade}')
+        if trade.order_id in self.evicted_orders:
+            return
+
+        previous = self.trades.get(trade.order_id)
+        amount = self.convert_from_quotation(trade.total_order_amount)
+        commission = self.convert_from_quotation(getattr(trade, 'executed_commission', None)) or 0.0
+        if previous is not None:
+            trade.direction = previous.direction
+            sign = self._sign(trade)
+            lots = trade.lots_executed - previous.lots_executed
+            amount -= self.convert_from_quotation(previous.total_order_amount)
+            commission -= self.convert_from_quotation(getattr(previous, 'executed_commission', None)) or 0.0
         else:
-            sign = 1 if trade.direction == OrderDirection.ORDER_DIRECTION_BUY else -1
-            self.positions += trade.lots_executed * sign
-            self.money -= self.convert_from_quotation(trade.total_order_amount) * sign
+            sign = self._sign(trade)
+            lots = trade.lots_executed
+        self.positions += lots * sign
+        self.money -= amount * sign
+        if lots:
+            self.aggregates.add_fill(sign, lots, amount, commission)
+            if self.equity is not None:
+                self.equity.add_fill(sign, lots, amount, commission)
 
         self.trades[trade.order_id] = trade
-        self.logger.debug(f'Updating balance. New state: [positions={self.positions} money={self.money}]')
+        if trade.execution_report_status in self.PENDING_ORDER_STATUSES:
+            self.pending[trade.order_id] = trade
+        elif self.pending.pop(trade.order_id, None) is not None or previous is None:
+            self._finish(trade.order_id)
+        if debug:
+            self.logger.debug(f'Updating balance. New state: [positions={self.positions} money={self.money}]')
+
+    def _finish(self, order_id: str) -> None:
+        self._finished.append(order_id)
+        if self.max_finished_trades is not None:
+            while len(self._finished) > self.max_finished_trades:
+                order_id = self._finished.popleft()
+                if self.trades.pop(order_id, None) is not None:
+                    self.evicted_orders.add(order_id)
+
+    @staticmethod
+    def _sign(trade: OrderState) -> int:
+        return 1 if trade.direction == OrderDirection.ORDER_DIRECTION_BUY else -1
+
+    def get_summary(self) -> dict[str, any]:
+        """
+        Short summary from running aggregates, without building the report
+        """
+        aggregates = self.aggregates
+        closed = aggregates.wins + aggregates.losses
+        return {
+            'positions': self.positions,
+            'money': self.money,
+            'fills': aggregates.fills,
+            'turnover': aggregates.turnover,
+            'realized_pnl': aggregates.realized_pnl,
+            'total_commission': aggregates.commission,
+            'net_pnl': aggregates.net_pnl,
+            'max_drawdown': aggregates.max_drawdown,
+            'wins': aggregates.wins,
+            'losses': aggregates.losses,
+            'win_rate': aggregates.wins / closed if closed else 0.0,
+            'profit_factor': aggregates.profit_factor,
+            'pending_orders': len(self.pending),
+        }
 
     def cancel_order(self, order_id: str):
         self.trades.pop(order_id)
+        self.pending.pop(order_id, None)
+        if self.journal is not None:
+            self.journal.cancel_order(order_id)
+        if self.store is not None:
+            self.store.cancel_order(order_id)
 
     def get_positions(self) -> int:
         return self.positions
@@ -63,20 +276,43 @@ class TradeStatisticsAnalyzer:
         return self.money
 
     def get_pending_orders(self) -> list[OrderState]:
-        return [trade for trade in self.trades.values() if trade.execution_report_status in self.PENDING_ORDER_STATUSES]
+        return list(self.pending.values())
 
     def save_to_file(self, filename: str) -> None:
-        import os
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
-        # Исправление: конвертируем все repeated message fields (например, stages) в list
-        for trade in self.trades.values():
-            if hasattr(trade, "stages") and not isinstance(trade.stages, list):
-                try:
-                    trade.stages = list(trade.stages)
-                except Exception:
-                    trade.stages = []
-        with open(filename, 'wb') as file:
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        # пишем во временный файл и подменяем, чтобы прерванная запись не оставляла пустой файл
+        tmp_filename = f'{filename}.tmp'
+        with open(tmp_filename, 'wb') as file:
             pickle.dump(obj=self, file=file, protocol=pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_filename, filename)
+
+    def __getstate__(self) -> dict:
+        # сделки хранятся компактными записями журнала, без protobuf-объектов
+        state = self.__dict__.copy()
+        state.pop('journal', None)
+        state.pop('store', None)
+        state.pop('store_robot_id', None)
+        state.pop('pending', None)
+        state.pop('_finished', None)
+        state['trades'] = [order_to_record(trade) for trade in self.trades.values()]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        trades = state['trades']
+        if isinstance(trades, list):
+            state['trades'] = {record[0]: order_from_record(record) for record in trades}
+        # старые файлы хранят dict[str, OrderState] и не содержат journal и агрегатов
+        state.setdefault('journal', None)
+        state.setdefault('store', None)
+        state.setdefault('store_robot_id', None)
+        state.setdefault('max_finished_trades', None)
+        state.setdefault('equity', None)
+        aggregates = state.pop('aggregates', None)
+        evicted_orders = state.pop('evicted_orders', None)
+        self.__dict__.update(state)
+        self.load_state(self.positions, self.money, self.trades, aggregates, evicted_orders)
 
     @staticmethod
     def load_from_file(filename: str) -> TradeStatisticsAnalyzer:
@@ -89,11 +325,16 @@ class TradeStatisticsAnalyzer:
             return None
         return amount.units + amount.nano / (10 ** 9)
 
-    def add_backtest_trade(self, quantity: int, price: Quotation, direction: OrderDirection):
+    def add_backtest_trade(self, quantity: int, price: Quotation, direction: OrderDirection, commission: float = 0.0,
+                           order_date: datetime.datetime = None, lot: int = 1):
+        """
+        Records a filled order of `quantity` lots, `price` is per instrument unit and the amount is price * quantity * lot
+        """
         if quantity == 0:
             return
         price_money = MoneyValue('RUB', price.units, price.nano)
         zero_money = MoneyValue('RUB', 0, 0)
+        commission_money = Money(commission).to_money_value('RUB')
         self.add_trade(OrderState(
             order_id=str(uuid.uuid4()),
             execution_report_status=OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_FILL,
@@ -101,10 +342,10 @@ class TradeStatisticsAnalyzer:
             lots_executed=quantity,
             initial_order_price=price_money,
             executed_order_price=price_money,
-            total_order_amount=(Money(price) * quantity).to_money_value('RUB'),
+            total_order_amount=(Money(price) * (quantity * lot)).to_money_value('RUB'),
             average_position_price=price_money,
-            initial_commission=zero_money,
-            executed_commission=zero_money,
+            initial_commission=commission_money,
+            executed_commission=commission_money,
             figi=self.instrument_info.figi,
             direction=direction,
             initial_security_price=price_money,
@@ -112,13 +353,13 @@ class TradeStatisticsAnalyzer:
             service_commission=zero_money,
             currency=price_money.currency,
             order_type=OrderType.ORDER_TYPE_MARKET,
-            order_date=datetime.datetime.now()
+            order_date=order_date or datetime.datetime.now()
         ))
 
     def get_report(self, processors: list[TradeStatisticsProcessorBase] = None,
                    calculators: list[TradeStatisticsCalculatorBase] = None)\
             -> tuple[dict[str, any], pd.DataFrame]:
-        df = pd.DataFrame(map(asdict, self.trades.values()))  # pylint:disable=invalid-name
+        df = self.build_frame()  # pylint:disable=invalid-name
 
         # Если нет ни одной сделки — возвращаем пустой отчет
         if df.empty:
@@ -129,21 +370,52 @@ class TradeStatisticsAnalyzer:
                 'income': 0.0,
                 'total_commission': 0.0
             }
-            return stats, df
-
-        # Далее — прежняя обработка
-        df['average_position_price'] = df['average_position_price'].apply(lambda x: x['units'] + x['nano'] / (10 ** 9))
-        df['total_order_amount'] = df['total_order_amount'].apply(lambda x: x['units'] + x['nano'] / (10 ** 9))
-        df['sign'] = 3 - df['direction'] * 2
-
-        for processor in processors or []:
-            df = processor.process(df)  # pylint:disable=invalid-name
+        else:
+            df['sign'] = 3 - df['direction'].to_numpy(dtype=np.int64) * 2
+
+            for processor in processors or []:
+                df = processor.process(df)  # pylint:disable=invalid-name
+
+            stats = {}
+            for calculator in calculators or []:
+                stats |= calculator.calculate(df)
+
+        if self.evicted_orders:
+            # the frame holds only the retained orders, totals over all fills come from the running aggregates:
+            # the position is valued at its average cost, the commission is the executed one
+            aggregates = self.aggregates
+            totals = {
+                'final_balance': aggregates.realized_pnl - aggregates.position * aggregates.average_price,
+                'final_instrument_balance': aggregates.position,
+                'income': aggregates.net_pnl,
+                'total_commission': aggregates.commission,
+            }
+            stats |= {key: value for key, value in totals.items() if key in stats}
+        return stats, df
 
-        stats = {}
-        for calculator in calculators or []:
-            stats |= calculator.calculate(df)
+    def build_frame(self) -> pd.DataFrame:
+        """
+        Builds the report frame column by column from OrderState fields, money fields are decoded to float.
+        A PostOrderResponse of a not yet updated order has no average position price, it gets NaN there.
+        """
+        # pandas takes longer to import than the rest of the robot, it is loaded only for reports
+        import pandas as pd  # pylint:disable=import-outside-toplevel
+
+        trades = list(self.trades.values())
+        if not trades:
+            return pd.DataFrame()
+        columns = {}
+        for name in self.REPORT_FIELDS:
+            values = [getattr(trade, name, None) for trade in trades]
+            columns[name] = self.decode_money(values) if name in self.MONEY_FIELDS else values
+        return pd.DataFrame(columns)
 
-        return stats, df
+    @staticmethod
+    def decode_money(values: list[Quotation | MoneyValue | None]) -> np.ndarray:
+        zero = Quotation(units=0, nano=0)
+        decoded = MoneyArray.from_quotations([value if value is not None else zero for value in values]).to_float()
+        decoded[np.fromiter((value is None for value in values), bool, len(values))] = np.nan
+        return decoded
 
 
 class TradeStatisticsProcessorBase(ABC):  # pylint:disable=too-few-public-methods
@@ -166,20 +438,24 @@ class BalanceProcessor(TradeStatisticsProcessorBase):  # pylint:disable=too-few-
 
 
 class BalanceCalculator(TradeStatisticsCalculatorBase):  # pylint:disable=too-few-public-methods
+    cost_model: CostModel
+
+    def __init__(self, cost_model: CostModel = None):
+        self.cost_model = cost_model or DEFAULT_COST_MODEL
+
     def calculate(self, df: pd.DataFrame) -> dict[str, any]:
-        final_balance = df['balance'][len(df) - 1]
-        final_instrument_balance = df['instrument_balance'][len(df) - 1]
-        final_price = df['average_position_price'][len(df) - 1]
-        # Учёт комиссии: комиссия Тинькофф 0.03% за сделку (0.0003), минимум 0.01 руб.
-        commission_rate = 0.0005
-        commission_min = 0.01
+        final_balance = df['balance'].iloc[-1]
+        final_instrument_balance = df['instrument_balance'].iloc[-1]
+        final_price = df['average_position_price'].iloc[-1]
         total_commission = 0.0
         # Считаем комиссию только по исполненным сделкам (EXECUTION_REPORT_STATUS_FILL)
         if 'execution_report_status' in df:
-            for idx, row in df.iterrows():
-                if str(row['execution_report_status']) == "1":  # EXECUTION_REPORT_STATUS_FILL
-                    commission = max(abs(row['total_order_amount']) * commission_rate, commission_min)
-                    total_commission += commission
+            filled = df['execution_report_status'].to_numpy(dtype=np.int64) \
+                == OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_FILL
+            commissions = self.cost_model.commissions(df['total_order_amount'].to_numpy()[filled])
+            if len(commissions):
+                # последовательная сумма, как в построчном цикле, чтобы итог совпадал до последнего знака
+                total_commission = float(np.cumsum(commissions)[-1])
         income = final_balance + final_instrument_balance * final_price - total_commission
         return {
             'final_balance': final_balance,
@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import datetime
+import logging
+import os
+import queue
+import sqlite3
+import threading
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from tinkoff.invest import MoneyValue, OrderDirection, OrderExecutionReportStatus, OrderState, PostOrderResponse
+
+if TYPE_CHECKING:
+    from robotlib.stats import TradeStatisticsAnalyzer
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS orders (
+    order_id TEXT PRIMARY KEY,
+    robot_id TEXT NOT NULL,
+    figi TEXT NOT NULL,
+    direction INTEGER NOT NULL,
+    status INTEGER NOT NULL,
+    lots_requested INTEGER NOT NULL,
+    lots_executed INTEGER NOT NULL,
+    total_order_amount REAL NOT NULL,
+    average_position_price REAL NOT NULL,
+    commission REAL NOT NULL,
+    order_date TEXT,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_figi ON orders (figi);
+CREATE INDEX IF NOT EXISTS orders_robot_id ON orders (robot_id);
+CREATE INDEX IF NOT EXISTS orders_status ON orders (status);
+CREATE INDEX IF NOT EXISTS orders_order_date ON orders (order_date);
+
+CREATE TABLE IF NOT EXISTS fills (
+    id INTEGER PRIMARY KEY,
+    order_id TEXT NOT NULL,
+    robot_id TEXT NOT NULL,
+    figi TEXT NOT NULL,
+    direction INTEGER NOT NULL,
+    lots INTEGER NOT NULL,
+    amount REAL NOT NULL,
+    commission REAL NOT NULL,
+    time TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fills_figi_time ON fills (figi, time);
+CREATE INDEX IF NOT EXISTS fills_time ON fills (time);
+
+CREATE TABLE IF NOT EXISTS balances (
+    robot_id TEXT PRIMARY KEY,
+    figi TEXT NOT NULL,
+    positions INTEGER NOT NULL,
+    money REAL NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS balances_figi ON balances (figi);
+'''
+
+UPSERT_ORDER = '''
+INSERT INTO orders (order_id, robot_id, figi, direction, status, lots_requested, lots_executed, total_order_amount,
+                    average_position_price, commission, order_date, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (order_id) DO UPDATE SET
+    status = excluded.status, lots_executed = excluded.lots_executed,
+    total_order_amount = excluded.total_order_amount, average_position_price = excluded.average_position_price,
+    commission = excluded.commission, updated_at = excluded.updated_at
+'''
+INSERT_FILL = '''
+INSERT INTO fills (order_id, robot_id, figi, direction, lots, amount, commission, time) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+UPSERT_BALANCE = '''
+INSERT INTO balances (robot_id, figi, positions, money, updated_at) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (robot_id) DO UPDATE SET
+    figi = excluded.figi, positions = excluded.positions, money = excluded.money, updated_at = excluded.updated_at
+'''
+CANCEL_ORDER = 'UPDATE orders SET status = ?, updated_at = ? WHERE order_id = ?'
+
+PENDING_STATUSES = (int(OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_NEW),
+                    int(OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_PARTIALLYFILL))
+
+
+def _to_float(amount: MoneyValue | None) -> float:
+    return 0.0 if amount is None else amount.units + amount.nano / (10 ** 9)
+
+
+def _execution_time(trade: OrderState | PostOrderResponse) -> datetime.datetime | None:
+    # execution time of the last stage, older API versions and PostOrderResponse have none
+    stages = getattr(trade, 'stages', None)
+    return getattr(stages[-1], 'execution_time', None) if stages else None
+
+
+@dataclass
+class OpenPosition:
+    robot_id: str
+    figi: str
+    positions: int
+    money: float
+    updated_at: str
+
+
+@dataclass
+class DailyPnl:
+    day: str
+    robot_id: str
+    realized_pnl: float  # closed lots at the average cost of the position, before commission
+    cash_flow: float  # sales minus purchases
+    commission: float
+    fills: int
+    turnover: float
+
+    @property
+    def net_pnl(self) -> float:
+        return self.realized_pnl - self.commission
+
+
+@dataclass
+class PendingOrder:
+    order_id: str
+    robot_id: str
+    figi: str
+    direction: OrderDirection
+    lots_requested: int
+    lots_executed: int
+    order_date: str
+
+
+class TradeStore:
+    """
+    One SQLite database (WAL mode) with orders, fills and balances of all robots, so reports need no unpickling.
+    add_trade() only queues the change: a background thread writes queued changes of all robots with prepared
+    batch inserts in one transaction, every `flush_interval` seconds or `batch_size` changes.
+    Several processes (e.g. shards) may write the same file, WAL lets readers work during writes.
+    """
+
+    path: str
+    flush_interval: float
+    batch_size: int
+    logger: logging.Logger
+
+    def __init__(self, path: str, flush_interval: float = 0.2, batch_size: int = 500, logger: logging.Logger = None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.logger = logger or logging.getLogger('robot.store')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        connection = self._connect()
+        connection.executescript(SCHEMA)
+        connection.close()
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30.0)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def add_trade(self, robot_id: str, trade: OrderState | PostOrderResponse, previous: OrderState | None,
+                  positions: int, money: float, fill_time: datetime.datetime = None) -> None:
+        """
+        Queues an order state change; `previous` is the last known state of the order, used to extract the fill.
+        The fill is timed by `fill_time`, the execution time of the last order stage or, without both, by the time
+        the change is queued
+        """
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        amount = _to_float(trade.total_order_amount)
+        commission = _to_float(trade.executed_commission)
+        # a PostOrderResponse has no order date and average position price
+        order_date = getattr(trade, 'order_date', None)
+        order_date = order_date.isoformat() if order_date else None
+        order = (trade.order_id, robot_id, trade.figi, int(trade.direction), int(trade.execution_report_status),
+                 trade.lots_requested, trade.lots_executed, amount,
+                 _to_float(getattr(trade, 'average_position_price', None)), commission, order_date, now)
+        fill = None
+        executed = trade.lots_executed - (previous.lots_executed if previous is not None else 0)
+        if executed:
+            fill_time = fill_time or _execution_time(trade)
+            fill = (trade.order_id, robot_id, trade.figi, int(trade.direction), executed,
+                    amount - _to_float(previous.total_order_amount if previous is not None else None),
+                    commission - _to_float(previous.executed_commission if previous is not None else None),
+                    fill_time.isoformat() if fill_time else now)
+        balance = (robot_id, trade.figi, positions, money, now)
+        self._put(('trade', (order, fill, balance)))
+
+    def cancel_order(self, order_id: str) -> None:
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self._put(('cancel', (int(OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_CANCELLED), now, order_id)))
+
+    def import_analyzer(self, robot_id: str, analyzer: TradeStatisticsAnalyzer) -> bool:
+        """
+        Imports the trades of a TradeStatisticsAnalyzer, e.g. loaded from an old stats pickle, if the store has
+        no orders of robot_id yet. The store is not touched otherwise: it already has every order with the real
+        fill times, while the analyzer may have dropped finished orders. Returns whether the trades were imported
+        """
+        self.flush()
+        connection = self._connect()
+        try:
+            exists = connection.execute('SELECT 1 FROM orders WHERE robot_id = ? LIMIT 1', (robot_id,)).fetchone()
+        finally:
+            connection.close()
+        if exists:
+            return False
+        for trade in analyzer.trades.values():
+            # the pickle keeps no fill times, the order date is the closest one known
+            self.add_trade(robot_id, trade, None, analyzer.positions, analyzer.money,
+                           getattr(trade, 'order_date', None))
+        self.flush()
+        return True
+
+    def flush(self) -> None:
+        """
+        Waits until everything queued before the call is written
+        """
+        done = threading.Event()
+        self._put(('flush', done))
+        done.wait()
+
+    def close(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._thread = None
+
+    def _put(self, item: tuple) -> None:
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._write_loop, daemon=True, name='trade-store')
+                    self._thread.start()
+        self._queue.put(item)
+
+    def _write_loop(self) -> None:
+        connection = self._connect()
+        try:
+            while True:
+                batch = [self._queue.get()]
+                while len(batch) < self.batch_size and batch[-1] is not None:
+                    try:
+                        batch.append(self._queue.get(timeout=self.flush_interval))
+                    except queue.Empty:
+                        break
+                self._write_batch(connection, batch)
+                if batch[-1] is None:
+                    return
+        finally:
+            connection.close()
+
+    def _write_batch(self, connection: sqlite3.Connection, batch: list) -> None:
+        orders, fills, balances, cancels, flushed = [], [], [], [], []
+        for item in batch:
+            if item is None:
+                continue
+            kind, payload = item
+            if kind == 'trade':
+                order, fill, balance = payload
+                orders.append(order)
+                if fill is not None:
+                    fills.append(fill)
+                balances.append(balance)
+            elif kind == 'cancel':
+                cancels.append(payload)
+            else:
+                flushed.append(payload)
+        try:
+            with connection:
+                connection.executemany(UPSERT_ORDER, orders)
+                connection.executemany(INSERT_FILL, fills)
+                connection.executemany(UPSERT_BALANCE, balances)
+                connection.executemany(CANCEL_ORDER, cancels)
+        except sqlite3.Error as error:
+            self.logger.error(f'Failed to write {len(orders)} orders to {self.path}: {error}')
+        for done in flushed:
+            done.set()
+
+    def _reader(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    def get_open_positions(self) -> list[OpenPosition]:
+        rows = self._reader().execute(
+            'SELECT robot_id, figi, positions, money, updated_at FROM balances WHERE positions != 0 ORDER BY robot_id')
+        return [OpenPosition(*row) for row in rows]
+
+    def get_daily_pnl(self, robot_id: str = None, since: datetime.date = None) -> list[DailyPnl]:
+        """
+        Realized P&L, cash flow, commission, fills and turnover by day of fill. Realized P&L is counted with
+        the average cost of the position, so the fills of every robot are replayed from the first one,
+        `since` only limits the returned days
+        """
+        from robotlib.stats import TradeAggregates  # pylint:disable=import-outside-toplevel
+        rows = self._reader().execute(
+            'SELECT robot_id, figi, direction, lots, amount, commission, time FROM fills '
+            'WHERE (? IS NULL OR robot_id = ?) ORDER BY robot_id, figi, time, id', (robot_id, robot_id))
+        since_text = since.isoformat() if since else None
+        positions: dict[tuple[str, str], TradeAggregates] = {}
+        days: dict[tuple[str, str], DailyPnl] = {}
+        for robot, figi, direction, lots, amount, commission, time in rows:
+            position = positions.setdefault((robot, figi), TradeAggregates())
+            realized = position.realized_pnl
+            sign = 1 if direction == OrderDirection.ORDER_DIRECTION_BUY else -1
+            position.add_fill(sign, lots, amount, commission)
+            day = time[:10]
+            if since_text is not None and day < since_text:
+                continue
+            pnl = days.setdefault((day, robot), DailyPnl(day=day, robot_id=robot, realized_pnl=0.0, cash_flow=0.0,
+                                                         commission=0.0, fills=0, turnover=0.0))
+            pnl.realized_pnl += position.realized_pnl - realized
+            pnl.cash_flow -= amount * sign
+            pnl.commission += commission
+            pnl.fills += 1
+            pnl.turnover += amount
+        return [days[key] for key in sorted(days)]
+
+    def get_pending_orders(self, robot_id: str = None) -> list[PendingOrder]:
+        rows = self._reader().execute(
+            f'SELECT order_id, robot_id, figi, direction, lots_requested, lots_executed, order_date FROM orders '
+            f'WHERE status IN ({",".join("?" * len(PENDING_STATUSES))}) AND (? IS NULL OR robot_id = ?) '
+            f'ORDER BY order_date', (*PENDING_STATUSES, robot_id, robot_id))
+        return [PendingOrder(order_id, robot, figi, OrderDirection(direction), requested, executed, order_date)
+                for order_id, robot, figi, direction, requested, executed, order_date in rows]
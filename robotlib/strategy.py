@@ -16,8 +16,9 @@ from tinkoff.invest import (
     Quotation,
     SubscriptionInterval,
 )
+from robotlib.costs import CostModel, DEFAULT_COST_MODEL
 from robotlib.money import Money
-from robotlib.vizualization import Visualizer
+from robotlib.vizualization import MSK, Visualizer
 
 
 @dataclass
@@ -137,13 +138,15 @@ class MAEStrategy(TradeStrategyBase):
     prices = dict[datetime.datetime, Money]
     prev_sign: bool
 
-    def __init__(self, short_len: int = 5, long_len: int = 20, trade_count: int = 1, visualizer: Visualizer = None):
+    def __init__(self, short_len: int = 5, long_len: int = 20, trade_count: int = 1, visualizer: Visualizer = None,
+                 cost_model: CostModel = None):
         assert long_len > short_len
         self.short_len = short_len
         self.long_len = long_len
         self.trade_count = trade_count
         self.prices = {}
         self.visualizer = visualizer
+        self.cost_model = cost_model or DEFAULT_COST_MODEL
 
     def load_candles(self, candles: list[HistoricCandle]) -> None:
         self.prices = {candle.time.replace(second=0, microsecond=0): Money(candle.close)
@@ -157,9 +160,7 @@ class MAEStrategy(TradeStrategyBase):
         return result
 
     def decide_by_candle(self, candle: Candle | HistoricCandle, params: TradeStrategyParams) -> StrategyDecision:
-        import pytz
-        msk = pytz.timezone('Europe/Moscow')
-        msk_time = candle.time.astimezone(msk)
+        msk_time = candle.time.astimezone(MSK)
         price = float(candle.close.units + candle.close.nano / 1e9)
         self.prices.append(price)
         if len(self.prices) > self.rsi_len + 1:
@@ -181,19 +182,18 @@ class MAEStrategy(TradeStrategyBase):
                     self.visualizer.update_plot()
                 return StrategyDecision(robot_trade_order=None)
             rsi = self._calc_rsi(self.prices)
-            # Комиссия Тинькофф 0.05% за сделку, минимум 0.01 руб. (двойная комиссия: покупка+продажа)
-            commission_rate = 0.0005
-            commission_min = 0.01
+            # Издержки покупки и продажи одного лота по модели издержек (комиссия и проскальзывание)
             lot_price = price * self.instrument_info.lot
             # Если есть позиция, считаем относительную комиссию от цены входа
             min_commission_rel = 0
             if self.entry_price:
-                min_commission = max(lot_price * commission_rate, commission_min) * 2
-                min_commission_rel = min_commission / (self.entry_price * self.instrument_info.lot)
+                min_commission_rel = self.cost_model.round_trip_cost(lot_price) \
+                    / (self.entry_price * self.instrument_info.lot)
             # Покупка по RSI < 25, если нет позиции
             if rsi < 25 and params.instrument_balance == 0:
-                lot_price = price * self.instrument_info.lot
-                lots_available = int(params.currency_balance / lot_price)
+                # покупаем столько лотов, сколько позволяет баланс с учетом проскальзывания и комиссии
+                lots_available = self.cost_model.affordable_lots(params.currency_balance, price,
+                                                                 self.instrument_info.lot, self.trade_count)
                 if lots_available > 0:
                     order = RobotTradeOrder(quantity=min(self.trade_count, lots_available),
                                             direction=OrderDirection.ORDER_DIRECTION_BUY)
@@ -262,11 +262,13 @@ class BreakoutStrategy(TradeStrategyBase):
     order_book_subscription_depth = None
     trades_subscription = None
 
-    def __init__(self, window: int = 60, trade_count: int = 1, min_range: float = 0.0005, visualizer: Visualizer = None):
+    def __init__(self, window: int = 60, trade_count: int = 1, min_range: float = 0.0005, visualizer: Visualizer = None,
+                 cost_model: CostModel = None):
         self.window = window
         self.trade_count = trade_count
         self.min_range = min_range  # минимальный диапазон для фильтрации "пилы"
         self.visualizer = visualizer
+        self.cost_model = cost_model or DEFAULT_COST_MODEL
         self.prices = []
 
     def load_candles(self, candles: list[HistoricCandle]) -> None:
@@ -279,9 +281,7 @@ class BreakoutStrategy(TradeStrategyBase):
         return result
 
     def decide_by_candle(self, candle: Candle | HistoricCandle, params: TradeStrategyParams) -> StrategyDecision:
-        import pytz
-        msk = pytz.timezone('Europe/Moscow')
-        msk_time = candle.time.astimezone(msk)
+        msk_time = candle.time.astimezone(MSK)
         price = float(candle.close.units + candle.close.nano / 1e9)
         self.prices.append(price)
         if len(self.prices) > self.rsi_len + 1:
@@ -305,8 +305,9 @@ class BreakoutStrategy(TradeStrategyBase):
             rsi = self._calc_rsi(self.prices)
             # Покупка по RSI < 25, если нет позиции
             if rsi < 25 and params.instrument_balance == 0:
-                lot_price = price * self.instrument_info.lot
-                lots_available = int(params.currency_balance / lot_price)
+                # покупаем столько лотов, сколько позволяет баланс с учетом проскальзывания и комиссии
+                lots_available = self.cost_model.affordable_lots(params.currency_balance, price,
+                                                                 self.instrument_info.lot, self.trade_count)
                 if lots_available > 0:
                     order = RobotTradeOrder(quantity=min(self.trade_count, lots_available),
                                             direction=OrderDirection.ORDER_DIRECTION_BUY)
@@ -372,7 +373,8 @@ class RSIStrategy(TradeStrategyBase):
         rsi_drop_period: int = 3,    # период для фильтра по падению RSI
         rsi_drop_threshold: float = 20.0,  # на сколько пунктов должен упасть RSI
         min_period: int = 10,        # период для поиска локального минимума
-        trailing_stop: float = 0.01  # trailing stop (например, 1%)
+        trailing_stop: float = 0.01,  # trailing stop (например, 1%)
+        cost_model: CostModel = None  # комиссия и проскальзывание, по умолчанию тариф «Трейдер»
     ):
         self.rsi_len = rsi_len
         self.trade_count = trade_count
@@ -387,6 +389,7 @@ class RSIStrategy(TradeStrategyBase):
         self.min_period = min_period
         self.trailing_stop = trailing_stop
         self.trailing_stop_price = None  # trailing-stop-цена (максимум после входа)
+        self.cost_model = cost_model or DEFAULT_COST_MODEL
 
     def load_candles(self, candles: list[HistoricCandle]) -> None:
         self.prices = [float(candle.close.units + candle.close.nano / 1e9) for candle in candles[-max(self.rsi_len+1, 50):]]
@@ -418,9 +421,7 @@ class RSIStrategy(TradeStrategyBase):
         return rsi
 
     def decide_by_candle(self, candle: Candle | HistoricCandle, params: TradeStrategyParams) -> StrategyDecision:
-        import pytz
-        msk = pytz.timezone('Europe/Moscow')
-        msk_time = candle.time.astimezone(msk)
+        msk_time = candle.time.astimezone(MSK)
         price = float(candle.close.units + candle.close.nano / 1e9)
         self.prices.append(price)
         if len(self.prices) > max(self.rsi_len + 1, 50):
@@ -443,17 +444,17 @@ class RSIStrategy(TradeStrategyBase):
                     self.visualizer.update_plot()
                 return StrategyDecision(robot_trade_order=None)
             rsi = self._calc_rsi(self.prices[-self.rsi_len-1:])
-            # Комиссия Тинькофф 0.05% за сделку, минимум 0.01 руб. (двойная комиссия: покупка+продажа)
-            commission_rate = 0.0005
-            commission_min = 0.01
+            # Издержки покупки и продажи одного лота по модели издержек (комиссия и проскальзывание)
             lot_price = price * self.instrument_info.lot
             min_commission_rel = 0
             if self.entry_price:
-                min_commission = max(lot_price * commission_rate, commission_min) * 2
-                min_commission_rel = min_commission / (self.entry_price * self.instrument_info.lot)
+                min_commission_rel = self.cost_model.round_trip_cost(lot_price) \
+                    / (self.entry_price * self.instrument_info.lot)
             # Покупка по RSI < 25, если нет позиции и не было продажи только что
             if rsi < 25 and params.instrument_balance == 0 and self.entry_price is None:
-                lots_available = int(params.currency_balance / lot_price)
+                # покупаем столько лотов, сколько позволяет баланс с учетом проскальзывания и комиссии
+                lots_available = self.cost_model.affordable_lots(params.currency_balance, price,
+                                                                 self.instrument_info.lot, self.trade_count)
                 if lots_available > 0:
                     order = RobotTradeOrder(quantity=min(self.trade_count, lots_available),
                                             direction=OrderDirection.ORDER_DIRECTION_BUY)
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+
+from dataclasses import dataclass
+from typing import Callable
+
+from tinkoff.invest import Candle, Client, HistoricCandle, MarketDataResponse
+from tinkoff.invest.exceptions import InvestError
+from tinkoff.invest.services import MarketDataStreamManager, Services
+
+from robotlib.recorder import MarketDataRecorder
+
+
+class BarCoalescer:
+    """
+    Filters candle updates: the stream resends the current bar on every trade and, after a reconnect,
+    history backfill overlaps with live data. Only newer bars and real changes of the current bar pass.
+    """
+    last_time: object
+    last_key: tuple | None
+
+    def __init__(self):
+        self.last_time = None
+        self.last_key = None
+
+    def push(self, candle: Candle | HistoricCandle) -> bool:
+        if self.last_time is not None and candle.time < self.last_time:
+            return False
+        key = (candle.open.units, candle.open.nano, candle.high.units, candle.high.nano, candle.low.units,
+               candle.low.nano, candle.close.units, candle.close.nano, candle.volume)
+        if candle.time == self.last_time and key == self.last_key:
+            return False
+        self.last_time = candle.time
+        self.last_key = key
+        return True
+
+
+@dataclass
+class StreamStats:
+    connects: int = 0
+    reconnects: int = 0
+    errors: int = 0
+    stalls: int = 0
+    backfilled_candles: int = 0
+    last_reconnect_latency: float = 0.0
+    max_reconnect_latency: float = 0.0
+    total_reconnect_latency: float = 0.0
+
+    def add_reconnect(self, latency: float) -> None:
+        self.reconnects += 1
+        self.last_reconnect_latency = latency
+        self.max_reconnect_latency = max(self.max_reconnect_latency, latency)
+        self.total_reconnect_latency += latency
+
+
+class SupervisedMarketDataStream:
+    """
+    Market data stream that survives errors: on InvestError or a silent stall (no messages for
+    heartbeat_timeout seconds) it reconnects with jittered exponential backoff and re-subscribes.
+    on_connect is called after every (re)subscription, so the caller can backfill missed data.
+    """
+    APP_NAME = 'karpp'
+
+    token: str
+    subscribe: Callable[[MarketDataStreamManager], None]
+    logger: logging.Logger
+    stop_event: threading.Event | None
+    heartbeat_timeout: float
+    backoff_base: float
+    backoff_max: float
+    max_attempts: int | None
+    stats: StreamStats
+    last_receive_ns: int  # time.perf_counter_ns() of the last received message
+    client_factory: Callable[..., Client]
+    recorder: MarketDataRecorder | None
+
+    def __init__(self, token: str, subscribe: Callable[[MarketDataStreamManager], None],  # pylint:disable=too-many-arguments
+                 logger: logging.Logger, stop_event: threading.Event = None, heartbeat_timeout: float = 300.0,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0, max_attempts: int = None,
+                 client_factory: Callable[..., Client] = Client, recorder: MarketDataRecorder = None):
+        self.token = token
+        self.subscribe = subscribe
+        self.logger = logger
+        self.stop_event = stop_event
+        self.heartbeat_timeout = heartbeat_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_attempts = max_attempts
+        self.stats = StreamStats()
+        self.last_receive_ns = 0
+        self.client_factory = client_factory
+        self.recorder = recorder
+        self._last_message = time.monotonic()
+        self._in_handler = False
+
+    def run(self, on_connect: Callable[[Services, bool], None],
+            on_message: Callable[[Services, MarketDataResponse], None]) -> None:
+        attempt = 0
+        disconnected_at = None
+        while not self._stopped():
+            try:
+                with self.client_factory(self.token, app_name=self.APP_NAME) as client:
+                    market_data_stream = client.create_market_data_stream()
+                    self.subscribe(market_data_stream)
+                    self.stats.connects += 1
+                    on_connect(client, disconnected_at is not None)
+                    if disconnected_at is not None:
+                        self.stats.add_reconnect(time.monotonic() - disconnected_at)
+                        self.logger.info(f'Reconnected to MarketDataStream in '
+                                         f'{self.stats.last_reconnect_latency:.2f}s')
+                    attempt = 0
+                    disconnected_at = None
+                    if self._consume(client, market_data_stream, on_message):
+                        break
+            except InvestError as error:
+                self.stats.errors += 1
+                self.logger.warning(f'MarketDataStream failed: {error}')
+
+            if self._stopped():
+                break
+            if disconnected_at is None:
+                disconnected_at = time.monotonic()
+            attempt += 1
+            if self.max_attempts is not None and attempt > self.max_attempts:
+                self.logger.error(f'Giving up on MarketDataStream after {self.max_attempts} attempts')
+                break
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            self.logger.info(f'Reconnecting to MarketDataStream in {delay:.1f}s (attempt {attempt})')
+            self._sleep(delay)
+        if self._stopped():
+            self.logger.info('Получен сигнал остановки, завершаем торговлю.')
+
+    def _consume(self, client: Services, market_data_stream: MarketDataStreamManager,
+                 on_message: Callable[[Services, MarketDataResponse], None]) -> bool:
+        """
+        Reads the stream until it ends. Returns True if stopped on request, False if the stream was lost
+        """
+        self._last_message = time.monotonic()
+        stalled = threading.Event()
+        finished = threading.Event()
+        watchdog = threading.Thread(target=self._watchdog, args=(market_data_stream, stalled, finished),
+                                    daemon=True, name='market-data-watchdog')
+        watchdog.start()
+        try:
+            for market_data in market_data_stream:
+                self.last_receive_ns = time.perf_counter_ns()
+                self._last_message = time.monotonic()
+                if self.recorder is not None:
+                    self.recorder.record(market_data)
+                if self._stopped():
+                    market_data_stream.stop()
+                    return True
+                self._in_handler = True
+                try:
+                    on_message(client, market_data)
+                finally:
+                    self._in_handler = False
+                    self._last_message = time.monotonic()
+        finally:
+            finished.set()
+            watchdog.join()
+        if stalled.is_set():
+            self.stats.stalls += 1
+            self.logger.warning(f'No market data for {self.heartbeat_timeout}s, reconnecting')
+        return self._stopped()
+
+    def _watchdog(self, market_data_stream: MarketDataStreamManager, stalled: threading.Event,
+                  finished: threading.Event) -> None:
+        while not finished.wait(1.0):
+            if self._stopped():
+                market_data_stream.stop()
+                return
+            # time spent inside the handler (e.g. a slow strategy or order check) is not a stall
+            if not self._in_handler and time.monotonic() - self._last_message > self.heartbeat_timeout:
+                stalled.set()
+                market_data_stream.stop()
+                return
+
+    def _stopped(self) -> bool:
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    def _sleep(self, seconds: float) -> None:
+        if self.stop_event is not None:
+            self.stop_event.wait(seconds)
+        else:
+            time.sleep(seconds)
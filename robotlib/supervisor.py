@@ -0,0 +1,703 @@
+from __future__ import annotations
+
+import atexit
+import logging
+import math
+import multiprocessing
+import secrets
+import signal
+import socket
+import struct
+import threading
+import time
+import traceback
+
+from dataclasses import dataclass
+from multiprocessing.connection import wait
+from typing import Callable, Iterator, NamedTuple
+
+from tinkoff.invest import Client
+
+from robotlib.events import CANDLE, LATENCY, LOG, PNL, STATE, TRADE, EventBus
+
+# --- Protocol ---
+# Every message is a frame: payload length and message type, then the ticker (uint8 length + utf-8),
+# the fixed fields of the type and, for some types, a text tail (uint16 length + utf-8).
+# Robots send the same frames to the supervisor, which forwards them to the GUI as they are.
+HEADER = struct.Struct('<IB')
+TICKER_LENGTH = struct.Struct('<B')
+TAIL_LENGTH = struct.Struct('<H')
+
+MSG_HELLO = 1  # supervisor -> GUI, tail: auth key
+MSG_START = 2  # GUI -> supervisor
+MSG_STOP = 3  # GUI -> supervisor -> robot, empty ticker stops all robots
+MSG_RESTART = 4
+MSG_SHUTDOWN = 5  # stop all robots and exit
+MSG_STATE = 10
+MSG_CANDLE = 11
+MSG_TRADE = 12
+MSG_PNL = 13
+MSG_LATENCY = 14
+MSG_LOG = 15
+MSG_SNAPSHOT = 16
+
+# type -> (fixed fields, has text tail)
+MESSAGES = {
+    MSG_HELLO: (struct.Struct('<'), True),
+    MSG_START: (struct.Struct('<idddiB'), True),  # rsi_len, min_range, take_profit, stop_loss, trade_count, sandbox;
+                                                  # tail: class_code
+    MSG_STOP: (struct.Struct('<'), False),
+    MSG_RESTART: (struct.Struct('<'), False),
+    MSG_SHUTDOWN: (struct.Struct('<'), False),
+    MSG_STATE: (struct.Struct('<BiH'), True),  # state, pid, restarts; tail: reason
+    MSG_CANDLE: (struct.Struct('<5d'), False),  # time, open, high, low, close
+    MSG_TRADE: (struct.Struct('<dBid'), False),  # time, is buy, lots, price
+    MSG_PNL: (struct.Struct('<idddI'), False),  # positions, money, equity (nan if unknown), net_pnl, fills
+    MSG_LATENCY: (struct.Struct('<Iddd'), False),  # count, p50, p99, max of the whole update, microseconds
+    MSG_LOG: (struct.Struct('<dB'), True),  # time, logging level; tail: message
+    MSG_SNAPSHOT: (struct.Struct('<iddI'), True),  # positions, money, net_pnl, fills; tail: statistics file
+}
+
+STARTING = 1
+RUNNING = 2
+STOPPING = 3
+STOPPED = 4
+FAILED = 5
+RESTARTING = 6
+STATE_NAMES = {STARTING: 'starting', RUNNING: 'running', STOPPING: 'stopping', STOPPED: 'stopped',
+               FAILED: 'failed', RESTARTING: 'restarting'}
+
+MAX_LOGS_PER_FLUSH = 200
+
+
+class Message(NamedTuple):
+    type: int
+    ticker: str
+    values: tuple
+    tail: str
+
+
+def encode_message(msg_type: int, ticker: str = '', values: tuple = (), tail: str = '') -> bytes:
+    fields, has_tail = MESSAGES[msg_type]
+    ticker_bytes = ticker.encode()
+    payload = TICKER_LENGTH.pack(len(ticker_bytes)) + ticker_bytes + fields.pack(*values)
+    if has_tail:
+        tail_bytes = tail.encode()[:0xFFFF]
+        payload += TAIL_LENGTH.pack(len(tail_bytes)) + tail_bytes
+    return HEADER.pack(len(payload), msg_type) + payload
+
+
+def decode_message(frame: bytes) -> Message:
+    _, msg_type = HEADER.unpack_from(frame)
+    fields, has_tail = MESSAGES[msg_type]
+    offset = HEADER.size
+    (length,) = TICKER_LENGTH.unpack_from(frame, offset)
+    offset += TICKER_LENGTH.size
+    ticker = bytes(frame[offset:offset + length]).decode()
+    offset += length
+    values = fields.unpack_from(frame, offset)
+    offset += fields.size
+    tail = ''
+    if has_tail:
+        (length,) = TAIL_LENGTH.unpack_from(frame, offset)
+        offset += TAIL_LENGTH.size
+        tail = bytes(frame[offset:offset + length]).decode(errors='replace')
+    return Message(msg_type, ticker, values, tail)
+
+
+def iter_frames(data: bytes) -> Iterator[bytes]:
+    """
+    Frames of a buffer that holds only whole frames, e.g. one batch of a robot
+    """
+    offset = 0
+    while offset < len(data):
+        (length,) = struct.unpack_from('<I', data, offset)
+        end = offset + HEADER.size + length
+        yield data[offset:end]
+        offset = end
+
+
+class FrameReader:
+    """
+    Splits a byte stream (socket) into frames
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> list[bytes]:
+        self._buffer += data
+        frames = []
+        offset = 0
+        while len(self._buffer) - offset >= HEADER.size:
+            (length,) = struct.unpack_from('<I', self._buffer, offset)
+            end = offset + HEADER.size + length
+            if end > len(self._buffer):
+                break
+            frames.append(bytes(self._buffer[offset:end]))
+            offset = end
+        del self._buffer[:offset]
+        return frames
+
+
+# --- Robot process ---
+
+@dataclass
+class RobotConfig:
+    ticker: str
+    class_code: str
+    token: str
+    account_id: str
+    sandbox_mode: bool
+    strategy_params: dict  # RSIStrategy arguments
+    stats_path: str | None = 'stats_{ticker}.pickle'  # statistics snapshot saved on stop
+    max_finished_trades: int | None = 10000  # finished orders kept in memory, None - all
+    logger_level: int | str = 'INFO'
+    forward_interval: float = 0.25  # seconds between batches of events sent to the supervisor
+    client_factory: Callable[..., Client] = Client
+
+
+class _EventForwarder(threading.Thread):
+    """
+    Sends events of the robot to the supervisor in batches: all trades, at most MAX_LOGS_PER_FLUSH log records,
+    the last update of every bar and the last P&L and latency
+    """
+
+    def __init__(self, bus: EventBus, conn, ticker: str, interval: float):
+        super().__init__(daemon=True, name=f'robot-{ticker}-forwarder')
+        self.bus = bus
+        self.conn = conn
+        self.ticker = ticker
+        self.interval = interval
+        self.seq = 0
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+
+    def run(self) -> None:
+        while not self._finished.wait(self.interval):
+            self.flush()
+
+    def stop(self) -> None:
+        self._finished.set()
+        self.join()
+        self.flush()
+
+    def send(self, data: bytes) -> None:
+        with self._lock:
+            self.conn.send_bytes(data)
+
+    def flush(self) -> None:
+        events, lost = self.bus.read(self.seq)
+        if not events:
+            return
+        self.seq = events[-1].seq
+        candles = {}
+        trades = []
+        logs = []
+        pnl = latency = None
+        for event in events:
+            data = event.data
+            if event.kind == CANDLE:
+                candles[data['time']] = data
+            elif event.kind == TRADE:
+                trades.append(data)
+            elif event.kind == PNL:
+                pnl = data
+            elif event.kind == LATENCY:
+                latency = data.get('total')
+            elif event.kind == LOG:
+                logs.append(data)
+
+        frames = []
+        if lost or len(logs) > MAX_LOGS_PER_FLUSH:
+            skipped = max(len(logs) - MAX_LOGS_PER_FLUSH, 0)
+            frames.append(encode_message(MSG_LOG, self.ticker, (time.time(), logging.WARNING),
+                                         f'{skipped} log records skipped' + (', events lost' if lost else '')))
+            logs = logs[-MAX_LOGS_PER_FLUSH:]
+        for data in logs:
+            # EventBusLogHandler publishes level names, the protocol carries level numbers
+            frames.append(encode_message(MSG_LOG, self.ticker, (data['time'], logging.getLevelName(data['level'])),
+                                         data['message']))
+        for data in candles.values():
+            frames.append(encode_message(MSG_CANDLE, self.ticker, (data['time'], data['open'], data['high'],
+                                                                   data['low'], data['close'])))
+        for data in trades:
+            frames.append(encode_message(MSG_TRADE, self.ticker, (data['time'], data['direction'] == 'buy',
+                                                                  data['lots'], data['price'])))
+        if pnl is not None:
+            equity = math.nan if pnl['equity'] is None else pnl['equity']
+            frames.append(encode_message(MSG_PNL, self.ticker, (pnl['positions'], pnl['money'], equity,
+                                                                pnl['net_pnl'], pnl['fills'])))
+        if latency:
+            frames.append(encode_message(MSG_LATENCY, self.ticker, (latency['count'], latency['p50'],
+                                                                    latency['p99'], latency['max'])))
+        if frames:
+            self.send(b''.join(frames))
+
+
+def _read_commands(conn, stop_event: threading.Event) -> None:
+    try:
+        while True:
+            if decode_message(conn.recv_bytes()).type == MSG_STOP:
+                stop_event.set()
+    except (EOFError, OSError):
+        # the supervisor is gone, nobody can stop the robot anymore
+        stop_event.set()
+
+
+class _Terminated(BaseException):
+    """
+    Raised in the robot process by SIGTERM of the supervisor. Not an Exception, so handlers of the robot that
+    catch everything do not swallow it
+    """
+
+
+def _raise_terminated(signum, frame) -> None:  # pylint:disable=unused-argument
+    raise _Terminated()
+
+
+def run_robot(config: RobotConfig, conn) -> None:
+    """
+    Robot process entry point: trades until the supervisor sends MSG_STOP, then saves the statistics snapshot
+    """
+    # Ctrl+C is delivered to the whole process group, the supervisor stops robots itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # a robot that did not stop in time is terminated, it still saves the statistics it has
+    signal.signal(signal.SIGTERM, _raise_terminated)
+    from robotlib.robot import TradingRobotFactory
+    from robotlib.strategy import RSIStrategy
+
+    stop_event = threading.Event()
+    bus = EventBus()
+    forwarder = _EventForwarder(bus, conn, config.ticker, config.forward_interval)
+    threading.Thread(target=_read_commands, args=(conn, stop_event), daemon=True,
+                     name=f'robot-{config.ticker}-commands').start()
+    robot = None
+    try:
+        factory = TradingRobotFactory(token=config.token, account_id=config.account_id, ticker=config.ticker,
+                                      class_code=config.class_code, logger_level=config.logger_level,
+                                      client_factory=config.client_factory, console_log=False)
+        robot = factory.create_robot(RSIStrategy(**config.strategy_params), sandbox_mode=config.sandbox_mode)
+        robot.trade_statistics.max_finished_trades = config.max_finished_trades
+        robot.enable_latency_tracking(log_interval=300)
+        # log records go only to the supervisor: the factory logger has no stderr handler and the records
+        # do not reach handlers of the root logger either
+        robot.enable_events(bus, logs=True)
+        robot.logger.propagate = False
+        forwarder.start()
+        forwarder.send(encode_message(MSG_STATE, config.ticker, (RUNNING, multiprocessing.current_process().pid, 0)))
+        stats = robot.trade(stop_event=stop_event)
+    except _Terminated:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        if robot is None:
+            raise SystemExit(1)  # pylint:disable=raise-missing-from
+        stats = robot.trade_statistics
+        forwarder.send(encode_message(MSG_LOG, config.ticker, (time.time(), logging.WARNING),
+                                      'Terminated by the supervisor, saving statistics'))
+    except Exception as error:  # pylint:disable=broad-except
+        if forwarder.is_alive():
+            forwarder.stop()
+        forwarder.send(encode_message(MSG_LOG, config.ticker, (time.time(), logging.ERROR),
+                                      f'Robot failed: {error}\n{traceback.format_exc()}'))
+        raise SystemExit(1) from error
+    # saving must not be interrupted, the supervisor kills the process if it hangs here
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    if forwarder.is_alive():
+        forwarder.stop()
+    path = config.stats_path.format(ticker=config.ticker) if config.stats_path else ''
+    if path:
+        stats.save_to_file(path)
+    forwarder.send(encode_message(MSG_SNAPSHOT, config.ticker, (
+        robot.get_positions(), robot.get_money(), stats.aggregates.net_pnl, stats.aggregates.fills), path))
+
+
+# --- Supervisor process ---
+
+@dataclass
+class SupervisorConfig:
+    token: str
+    account_id: str
+    stats_path: str | None = 'stats_{ticker}.pickle'
+    max_finished_trades: int | None = 10000
+    logger_level: int | str = 'INFO'
+    stop_timeout: float = 30.0  # a robot that did not stop in time is terminated, then killed after as long again
+    max_restarts: int = 5  # crashes after a start command before the robot is left failed
+    restart_delay: float = 2.0  # seconds before the first restart, doubled after every crash
+    client_factory: Callable[..., Client] = Client
+
+
+@dataclass
+class _RobotProcess:
+    config: RobotConfig
+    process: multiprocessing.Process | None = None
+    conn: object = None
+    state: int = STOPPED
+    restarts: int = 0
+    restart_at: float | None = None
+    stop_deadline: float | None = None
+    terminated: bool = False
+    restart_requested: bool = False
+    stop_requested: bool = False
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None
+
+
+class FleetSupervisor:
+    """
+    Runs every robot in its own process and serves commands of one GUI connection. Robot batches are forwarded
+    to the GUI byte for byte, the supervisor adds state changes. Crashed robots are restarted with a growing delay,
+    robots that did not stop in `stop_timeout` are terminated. Exits when the GUI asks for it or disconnects,
+    after all robots have stopped.
+    """
+
+    def __init__(self, config: SupervisorConfig, sock: socket.socket, logger: logging.Logger = None):
+        self.config = config
+        self.sock = sock
+        self.logger = logger or logging.getLogger('robot.supervisor')
+        self.robots: dict[str, _RobotProcess] = {}
+        self.shutting_down = False
+        self._gui_connected = True
+        self._reader = FrameReader()
+
+    def run(self) -> None:
+        while not (self.shutting_down and not any(robot.alive for robot in self.robots.values())):
+            alive = [robot for robot in self.robots.values() if robot.alive]
+            waitables = [robot.conn for robot in alive] + [robot.process.sentinel for robot in alive]
+            if self._gui_connected:
+                waitables.append(self.sock)
+            for ready in wait(waitables, timeout=self._next_timeout()):
+                if ready is self.sock:
+                    self._read_gui()
+                    continue
+                for robot in alive:
+                    if ready is robot.conn:
+                        self._forward(robot)
+                    elif robot.alive and ready == robot.process.sentinel:
+                        self._on_exit(robot)
+            self._check_timers()
+        if self._gui_connected:
+            self.sock.close()
+
+    def _next_timeout(self) -> float:
+        deadlines = [deadline for robot in self.robots.values()
+                     for deadline in (robot.restart_at, robot.stop_deadline) if deadline is not None]
+        return max(0.0, min(deadlines) - time.monotonic()) if deadlines else 1.0
+
+    def _read_gui(self) -> None:
+        try:
+            data = self.sock.recv(65536)
+        except OSError:
+            data = b''
+        if not data:
+            self.logger.info('GUI disconnected, stopping all robots')
+            self._gui_connected = False
+            self._shutdown()
+            return
+        for frame in self._reader.feed(data):
+            self._on_command(decode_message(frame))
+
+    def _on_command(self, message: Message) -> None:
+        if message.type == MSG_START:
+            rsi_len, min_range, take_profit, stop_loss, trade_count, sandbox = message.values
+            self.start(RobotConfig(
+                ticker=message.ticker, class_code=message.tail or 'TQBR', token=self.config.token,
+                account_id=self.config.account_id, sandbox_mode=bool(sandbox),
+                strategy_params=dict(rsi_len=rsi_len, min_range=min_range, take_profit=take_profit,
+                                     stop_loss=stop_loss, trade_count=trade_count),
+                stats_path=self.config.stats_path, max_finished_trades=self.config.max_finished_trades,
+                logger_level=self.config.logger_level,
+                client_factory=self.config.client_factory))
+        elif message.type == MSG_STOP:
+            for robot in self._select(message.ticker):
+                self.stop(robot)
+        elif message.type == MSG_RESTART:
+            for robot in self._select(message.ticker):
+                if robot.alive:
+                    robot.restart_requested = True
+                    self.stop(robot)
+                else:
+                    robot.restarts = 0
+                    self._spawn(robot)
+        elif message.type == MSG_SHUTDOWN:
+            self._shutdown()
+
+    def _select(self, ticker: str) -> list[_RobotProcess]:
+        if not ticker:
+            return list(self.robots.values())
+        return [self.robots[ticker]] if ticker in self.robots else []
+
+    def start(self, config: RobotConfig) -> None:
+        robot = self.robots.get(config.ticker)
+        if robot is not None and robot.alive:
+            self._log(config.ticker, logging.WARNING, 'Robot is already running')
+            return
+        self.robots[config.ticker] = robot = _RobotProcess(config)
+        self._spawn(robot)
+
+    def stop(self, robot: _RobotProcess) -> None:
+        robot.restart_at = None
+        if not robot.alive:
+            if robot.state == RESTARTING:
+                self._set_state(robot, STOPPED)
+            return
+        robot.stop_requested = True
+        if robot.stop_deadline is None:
+            robot.stop_deadline = time.monotonic() + self.config.stop_timeout
+            try:
+                robot.conn.send_bytes(encode_message(MSG_STOP, robot.config.ticker))
+            except OSError:
+                pass
+            self._set_state(robot, STOPPING)
+
+    def _shutdown(self) -> None:
+        self.shutting_down = True
+        for robot in self.robots.values():
+            robot.restart_requested = False
+            self.stop(robot)
+
+    def _spawn(self, robot: _RobotProcess) -> None:
+        parent_conn, child_conn = multiprocessing.Pipe()
+        robot.process = multiprocessing.Process(target=run_robot, args=(robot.config, child_conn),
+                                                name=f'robot-{robot.config.ticker}')
+        robot.process.start()
+        child_conn.close()
+        robot.conn = parent_conn
+        robot.restart_at = None
+        robot.stop_deadline = None
+        robot.terminated = False
+        robot.stop_requested = False
+        self._set_state(robot, STARTING)
+
+    def _forward(self, robot: _RobotProcess) -> bool:
+        try:
+            data = robot.conn.recv_bytes()
+        except (EOFError, OSError):
+            return False
+        frames = list(iter_frames(data))
+        states = [frame for frame in frames if HEADER.unpack_from(frame)[1] == MSG_STATE]
+        if states:
+            # the supervisor reports states itself, with its restart counter
+            for frame in states:
+                self._set_state(robot, decode_message(frame).values[0])
+            data = b''.join(frame for frame in frames if HEADER.unpack_from(frame)[1] != MSG_STATE)
+        if data:
+            self._send(data)
+        return True
+
+    def _on_exit(self, robot: _RobotProcess) -> None:
+        # the last batches of the robot, poll() is also true at the end of the pipe
+        while robot.conn.poll() and self._forward(robot):
+            pass
+        robot.process.join()
+        exitcode = robot.process.exitcode
+        robot.process = None
+        robot.conn.close()
+        robot.conn = None
+        robot.stop_deadline = None
+        if robot.restart_requested and not self.shutting_down:
+            robot.restart_requested = False
+            self._set_state(robot, STOPPED)
+            self._spawn(robot)
+        elif robot.stop_requested or exitcode == 0:
+            self._set_state(robot, STOPPED)
+        elif robot.restarts < self.config.max_restarts and not self.shutting_down:
+            delay = self.config.restart_delay * 2 ** robot.restarts
+            robot.restarts += 1
+            robot.restart_at = time.monotonic() + delay
+            self._set_state(robot, RESTARTING, f'exit code {exitcode}, restart in {delay:g} s')
+        else:
+            self._set_state(robot, FAILED, f'exit code {exitcode}')
+
+    def _check_timers(self) -> None:
+        now = time.monotonic()
+        for robot in self.robots.values():
+            if robot.restart_at is not None and robot.restart_at <= now and not self.shutting_down:
+                self._spawn(robot)
+            if robot.alive and robot.stop_deadline is not None and robot.stop_deadline <= now:
+                if not robot.terminated:
+                    self._log(robot.config.ticker, logging.WARNING,
+                              f'Robot did not stop in {self.config.stop_timeout:g} s, terminating')
+                    robot.process.terminate()
+                    robot.terminated = True
+                    robot.stop_deadline = now + self.config.stop_timeout
+                else:
+                    self._log(robot.config.ticker, logging.ERROR,
+                              'Robot did not save statistics after termination, killing without snapshot')
+                    robot.process.kill()
+                    robot.stop_deadline = None
+
+    def _set_state(self, robot: _RobotProcess, state: int, reason: str = '') -> None:
+        robot.state = state
+        pid = robot.process.pid if robot.process is not None else 0
+        self._send(encode_message(MSG_STATE, robot.config.ticker, (state, pid or 0, robot.restarts), reason))
+
+    def _log(self, ticker: str, level: int, message: str) -> None:
+        self.logger.log(level, f'{ticker}: {message}')
+        self._send(encode_message(MSG_LOG, ticker, (time.time(), level), message))
+
+    def _send(self, data: bytes) -> None:
+        if not self._gui_connected:
+            return
+        try:
+            self.sock.sendall(data)
+        except OSError:
+            self._gui_connected = False
+            self._shutdown()
+
+
+def run_supervisor(config: SupervisorConfig, host: str, port: int, authkey: str) -> None:
+    """
+    Supervisor process entry point: connects back to the GUI and serves it until shutdown
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    sock = socket.create_connection((host, port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.sendall(encode_message(MSG_HELLO, tail=authkey))
+    FleetSupervisor(config, sock).run()
+
+
+# --- GUI side ---
+
+class SupervisorClient:
+    """
+    Handle of the supervisor process for the GUI. Commands are written to the socket and return at once,
+    messages of robots are decoded in a background thread and published to `event_bus` as regular robot events
+    (candle, trade, pnl, latency, log and state), so the GUI reads them in batches like any other events.
+    """
+
+    config: SupervisorConfig
+    event_bus: EventBus
+    logger: logging.Logger
+
+    def __init__(self, config: SupervisorConfig, event_bus: EventBus, logger: logging.Logger = None):
+        self.config = config
+        self.event_bus = event_bus
+        self.logger = logger or logging.getLogger('robot.supervisor')
+        self.process = None
+        self._sock = None
+        self._send_lock = threading.Lock()
+        self._reader_thread = None
+
+    def start(self, timeout: float = 10.0) -> SupervisorClient:
+        authkey = secrets.token_hex(16)
+        with socket.create_server(('127.0.0.1', 0)) as listener:
+            listener.settimeout(timeout)
+            host, port = listener.getsockname()[:2]
+            # not a daemon: daemon processes cannot start robot processes
+            self.process = multiprocessing.Process(target=run_supervisor, args=(self.config, host, port, authkey),
+                                                   name='robot-supervisor')
+            self.process.start()
+            deadline = time.monotonic() + timeout
+            while True:
+                listener.settimeout(max(0.01, deadline - time.monotonic()))
+                sock, _ = listener.accept()
+                sock.settimeout(max(0.01, deadline - time.monotonic()))
+                reader = FrameReader()
+                frames = []
+                while not frames:
+                    data = sock.recv(4096)
+                    if not data:
+                        break
+                    frames = reader.feed(data)
+                hello = decode_message(frames[0]) if frames else None
+                if hello is not None and hello.type == MSG_HELLO and secrets.compare_digest(hello.tail, authkey):
+                    break
+                # чужое подключение к порту
+                sock.close()
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        self._reader_thread = threading.Thread(target=self._read_loop, args=(reader, frames[1:]), daemon=True,
+                                               name='supervisor-reader')
+        self._reader_thread.start()
+        # the interpreter joins the supervisor at exit, it has to be told to stop first
+        atexit.register(self.shutdown)
+        self.logger.info(f'Supervisor started, pid {self.process.pid}')
+        return self
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def start_robot(self, ticker: str, class_code: str, params: dict, sandbox_mode: bool = False) -> None:
+        self._send(encode_message(MSG_START, ticker, (
+            params['rsi_len'], params['min_range'], params['take_profit'], params['stop_loss'],
+            params['trade_count'], sandbox_mode), class_code))
+
+    def stop_robot(self, ticker: str = '') -> None:
+        """
+        Stops the robot of the ticker, all robots if the ticker is empty
+        """
+        self._send(encode_message(MSG_STOP, ticker))
+
+    def restart_robot(self, ticker: str) -> None:
+        self._send(encode_message(MSG_RESTART, ticker))
+
+    def shutdown(self, timeout: float = None) -> None:
+        """
+        Stops all robots (they save their snapshots) and waits for the supervisor to exit
+        """
+        if self.process is None:
+            return
+        atexit.unregister(self.shutdown)
+        try:
+            self._send(encode_message(MSG_SHUTDOWN))
+        except OSError:
+            pass
+        # robots get stop_timeout to stop and as long again to save statistics after termination
+        self.process.join(2 * self.config.stop_timeout + 5 if timeout is None else timeout)
+        if self.process.is_alive():
+            self.logger.warning('Supervisor did not stop in time, terminating')
+            self.process.terminate()
+            self.process.join()
+        self._sock.close()
+        self._reader_thread.join()
+        self.process = None
+
+    def _send(self, data: bytes) -> None:
+        with self._send_lock:
+            self._sock.sendall(data)
+
+    def _read_loop(self, reader: FrameReader, frames: list[bytes]) -> None:
+        while True:
+            for frame in frames:
+                self._publish(decode_message(frame))
+            try:
+                data = self._sock.recv(65536)
+            except OSError:
+                data = b''
+            if not data:
+                return
+            frames = reader.feed(data)
+
+    def _publish(self, message: Message) -> None:
+        ticker, values = message.ticker, message.values
+        if message.type == MSG_CANDLE:
+            self.event_bus.publish(CANDLE, ticker, dict(zip(('time', 'open', 'high', 'low', 'close'), values)))
+        elif message.type == MSG_TRADE:
+            trade_time, buy, lots, price = values
+            self.event_bus.publish(TRADE, ticker, {'time': trade_time, 'direction': 'buy' if buy else 'sell',
+                                                   'lots': lots, 'price': price})
+        elif message.type == MSG_PNL:
+            positions, money, equity, net_pnl, fills = values
+            self.event_bus.publish(PNL, ticker, {'positions': positions, 'money': money,
+                                                 'equity': None if math.isnan(equity) else equity,
+                                                 'net_pnl': net_pnl, 'fills': fills})
+        elif message.type == MSG_LATENCY:
+            self.event_bus.publish(LATENCY, ticker, {'total': dict(zip(('count', 'p50', 'p99', 'max'), values))})
+        elif message.type == MSG_LOG:
+            log_time, level = values
+            self.event_bus.publish(LOG, ticker, {'time': log_time, 'level': logging.getLevelName(level),
+                                                 'message': message.tail})
+        elif message.type == MSG_STATE:
+            state, pid, restarts = values
+            self.event_bus.publish(STATE, ticker, {'state': STATE_NAMES.get(state, str(state)), 'pid': pid,
+                                                   'restarts': restarts, 'reason': message.tail})
+        elif message.type == MSG_SNAPSHOT:
+            positions, money, net_pnl, fills = values
+            self.event_bus.publish(LOG, ticker, {
+                'time': time.time(), 'level': 'INFO',
+                'message': f'Stopped, statistics saved to {message.tail}: positions {positions}, '
+                           f'money {money:.2f}, net P&L {net_pnl:.2f}, fills {fills}'
+                if message.tail else f'Stopped: net P&L {net_pnl:.2f}, fills {fills}'})
@@ -1,81 +1,366 @@
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
+from __future__ import annotations
+
+import collections
+import datetime
+import multiprocessing
+import queue
+import time
+
+import numpy as np
+
+from robotlib.candles import CandleFrame, lttb
+
+CANDLE = 1
+BUY = 2
+SELL = 3
+UPDATE = 4
+
+MSK = datetime.timezone(datetime.timedelta(hours=3), 'MSK')
+
 
 class Visualizer:
-    def __init__(self, ticker, currency):
+    """
+    Chart of candles and robot trades in a separate process. Methods only put messages into a queue, so they cost
+    microseconds on the trading thread; the renderer process applies them to persistent matplotlib artists and
+    redraws at most `fps` times per second using blitting.
+    """
+
+    def __init__(self, ticker, currency, window: datetime.timedelta = datetime.timedelta(minutes=30),
+                 fps: float = 5.0, start: bool = True):
         self.ticker = ticker
         self.currency = currency
-        self.fig, self.ax = plt.subplots()
-        self.buys = []
-        self.sells = []
-        self.candles = []  # (time, open, high, low, close)
-    
-    def _init_fig(self):
-        plt.close('all')  # Закрыть все старые окна, если они есть
-        self.fig, self.ax = plt.subplots()
-        plt.show(block=False)
-        plt.pause(0.1)  # Дать matplotlib время на создание окна
+        self.window = window
+        self.fps = fps
+        self._queue = multiprocessing.Queue()
+        self._process = None
+        if start:
+            self.start()
+
+    def start(self):
+        if self._process is not None:
+            return
+        self._process = multiprocessing.Process(
+            target=render_loop, args=(self._queue, self.ticker, self.currency, self.window, self.fps),
+            daemon=True, name=f'visualizer-{self.ticker}'
+        )
+        self._process.start()
 
     def add_candle(self, time, open_, high, low, close):
-        self.candles.append((time, open_, high, low, close))
-        # Оставляем только свечи за последние 30 минут
-        import datetime
-        thirty_min_ago = time - datetime.timedelta(minutes=30)
-        self.candles = [c for c in self.candles if c[0] >= thirty_min_ago]
-    
+        self._queue.put((CANDLE, time, open_, high, low, close))
+
     def add_buy(self, time):
-        self.buys.append(time)
+        self._queue.put((BUY, time))
 
     def add_sell(self, time):
-        self.sells.append(time)
+        self._queue.put((SELL, time))
 
     def update_plot(self):
-        # Проверяем, не было ли окно закрыто пользователем
-        if not plt.fignum_exists(self.fig.number):
-            self._init_fig()
-        # Важно: всегда очищаем ось после пересоздания окна
-        self.ax.clear()
+        # Перерисовка выполняется в процессе визуализатора не чаще fps раз в секунду
+        self._queue.put((UPDATE,))
+
+    def close(self, timeout: float = 5.0):
+        if self._process is None:
+            return
+        self._queue.put(None)
+        self._process.join(timeout)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process = None
+
+
+class CandleChart:
+    """
+    Candles of the last `window` and buy/sell marks drawn on persistent artists. Only the artists are redrawn
+    on top of a cached background, the axes are fully redrawn when their limits move.
+    """
+    WIDTH = 0.0005  # ширина свечи (в днях, для matplotlib)
+
+    def __init__(self, ticker, currency, window: datetime.timedelta):
+        self.ticker = ticker
+        self.currency = currency
+        self.window = window
+        self.candles = collections.deque()  # (time, open, high, low, close)
+        self.buys = collections.deque()
+        self.sells = collections.deque()
+        self.fig = None
+        self.limits = None
+        self.background = None
+
+    def add_candle(self, time, open_, high, low, close):
+        # Обновления текущей свечи заменяют ее, а не добавляют новую
+        if self.candles and self.candles[-1][0] == time:
+            self.candles[-1] = (time, open_, high, low, close)
+        else:
+            self.candles.append((time, open_, high, low, close))
+        oldest = time - self.window
+        while self.candles[0][0] < oldest:
+            self.candles.popleft()
+        for marks in (self.buys, self.sells):
+            while marks and marks[0] < self.candles[0][0]:
+                marks.popleft()
+
+    def open_window(self):
+        import matplotlib.dates as mdates
+        import matplotlib.pyplot as plt
+        from matplotlib.collections import LineCollection, PolyCollection
+
+        plt.close('all')  # Закрыть все старые окна, если они есть
+        self.fig, self.ax = plt.subplots()
+        self.ax.set_title(self.ticker)
+        self.ax.set_xlabel('Время (МСК)')
+        self.ax.set_ylabel(f'Цена ({self.currency})')
+        self.ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+        self.wicks = LineCollection([], colors='black', linewidths=1, zorder=1, animated=True)
+        self.bodies = PolyCollection([], edgecolors='black', zorder=2, animated=True)
+        self.buy_lines = LineCollection([], colors='g', linestyles='dashed', animated=True)
+        self.sell_lines = LineCollection([], colors='r', linestyles='dashed', animated=True)
+        self.artists = [self.wicks, self.bodies, self.buy_lines, self.sell_lines]
+        for artist in self.artists:
+            self.ax.add_collection(artist)
+        self.limits = None
+        self.background = None
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        plt.show(block=False)
+        plt.pause(0.1)  # Дать matplotlib время на создание окна
+
+    def render(self):
+        import matplotlib.dates as mdates
+        import matplotlib.pyplot as plt
+
+        if self.fig is None or not plt.fignum_exists(self.fig.number):
+            self.open_window()
         if not self.candles:
-            plt.pause(0.2)
             return
+        if self.limits is None:
+            # подписи времени в часовом поясе свечей
+            self.ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M', tz=self.candles[-1][0].tzinfo))
+
+        times = mdates.date2num([candle[0] for candle in self.candles])
+        low = min(candle[3] for candle in self.candles)
+        high = max(candle[2] for candle in self.candles)
+        half = self.WIDTH / 2
+        self.wicks.set_segments([[(x, candle[3]), (x, candle[2])] for x, candle in zip(times, self.candles)])
+        self.bodies.set_verts([[(x - half, candle[1]), (x + half, candle[1]), (x + half, candle[4]),
+                                (x - half, candle[4])] for x, candle in zip(times, self.candles)])
+        self.bodies.set_facecolors(['green' if candle[4] >= candle[1] else 'red' for candle in self.candles])
+        self.buy_lines.set_segments([[(x, low), (x, high)] for x in mdates.date2num(list(self.buys))])
+        self.sell_lines.set_segments([[(x, low), (x, high)] for x in mdates.date2num(list(self.sells))])
+
+        if self._update_limits(times[0], times[-1], low, high):
+            # Пределы осей сдвинулись: полная перерисовка, фон и свечи обновятся в _on_draw
+            self.fig.canvas.draw()
+        elif self.background is not None:
+            self.fig.canvas.restore_region(self.background)
+            self._draw_artists()
+            self.fig.canvas.blit(self.fig.bbox)
+        self.fig.canvas.flush_events()
+
+    def process_events(self):
+        if self.fig is not None:
+            self.fig.canvas.flush_events()
+
+    def _update_limits(self, first: float, last: float, low: float, high: float) -> bool:
+        """
+        Keeps the axes limits while the data fits, with margins, so most frames are only blitted
+        """
+        if self.limits is not None:
+            left, right, bottom, top = self.limits
+            if left <= first and last + self.WIDTH <= right and bottom <= low and high <= top:
+                return False
+        span = self.window.total_seconds() / 86400
+        margin = max(high - low, high * 0.001) * 0.25
+        self.limits = (last - span, last + span * 0.2, low - margin, high + margin)
+        self.ax.set_xlim(self.limits[0], self.limits[1])
+        self.ax.set_ylim(self.limits[2], self.limits[3])
+        return True
+
+    def _on_draw(self, event):
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for artist in self.artists:
+            self.ax.draw_artist(artist)
+
+
+class BacktestChart:
+    """
+    Chart of a whole backtest. Candles are aggregated to the pixel width of the axes and re-aggregated from the full
+    CandleFrame whenever the visible range changes (zoom, pan, resize), so a year of minute candles is drawn as
+    a few hundred artists' vertices. Trades from the statistics ledger are drawn as markers.
+    """
+    PIXELS_PER_CANDLE = 3  # candle mode: narrower candles are not readable
+    PIXELS_PER_POINT = 1  # line mode
+
+    def __init__(self, frame: CandleFrame, ticker: str = '', currency: str = '', mode: str = 'candles',
+                 tz: datetime.tzinfo = MSK):
+        if mode not in ('candles', 'line'):
+            raise ValueError(f'Unknown mode {mode}, known are candles, line')
+        self.frame = frame
+        self.ticker = ticker
+        self.currency = currency
+        self.mode = mode
+        self.tz = tz
+        self.trade_x = np.empty(0)
+        self.trade_prices = np.empty(0)
+        self.trade_buys = np.empty(0, dtype=bool)
+        self.visible = None  # (start, stop, width) of the last drawn aggregation
+        self.fig = None
+
+    def set_trades(self, times: list[datetime.datetime], prices: list[float], buys: list[bool]) -> None:
+        import matplotlib.dates as mdates
+
+        x = mdates.date2num(list(times)) if len(times) else np.empty(0)
+        order = np.argsort(x, kind='stable')
+        self.trade_x = np.asarray(x, dtype=np.float64)[order]
+        self.trade_prices = np.asarray(prices, dtype=np.float64)[order]
+        self.trade_buys = np.asarray(buys, dtype=bool)[order]
+
+    def set_trades_from_statistics(self, trade_statistics) -> None:
+        """
+        Markers at the execution price of every filled order of a TradeStatisticsAnalyzer
+        """
+        from tinkoff.invest import OrderDirection
+
+        df = trade_statistics.build_frame()  # pylint:disable=invalid-name
+        if df.empty:
+            self.set_trades([], [], [])
+            return
+        filled = df[df['lots_executed'] > 0]
+        self.set_trades(list(filled['order_date']), filled['executed_order_price'].to_numpy(),
+                        (filled['direction'] == OrderDirection.ORDER_DIRECTION_BUY).to_numpy())
+
+    def open_window(self, figsize: tuple[float, float] = (14, 6)):
+        import matplotlib.dates as mdates
+        import matplotlib.pyplot as plt
+        from matplotlib.collections import LineCollection, PolyCollection
+
+        self.fig, self.ax = plt.subplots(figsize=figsize)
+        self.ax.set_title(self.ticker)
+        self.ax.set_xlabel(f'Время ({self.tz.tzname(None) if self.tz else "UTC"})')
+        self.ax.set_ylabel(f'Цена ({self.currency})' if self.currency else 'Цена')
+        locator = mdates.AutoDateLocator(tz=self.tz)
+        self.ax.xaxis.set_major_locator(locator)
+        self.ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator, tz=self.tz))
+        self.x = mdates.date2num(self.frame.time)
+        self.wicks = LineCollection([], colors='black', linewidths=0.7, zorder=1)
+        self.bodies = PolyCollection([], edgecolors='none', zorder=2)
+        self.line, = self.ax.plot([], [], color='tab:blue', linewidth=0.8, zorder=2)
+        self.buy_marks = self.ax.scatter([], [], marker='^', color='green', s=30, zorder=3, label='Покупки')
+        self.sell_marks = self.ax.scatter([], [], marker='v', color='red', s=30, zorder=3, label='Продажи')
+        self.ax.add_collection(self.wicks)
+        self.ax.add_collection(self.bodies)
+        if len(self.trade_x):
+            self.ax.legend(loc='upper left')
+        if len(self.x):
+            self.ax.set_xlim(self.x[0], self.x[-1])
+        self.ax.callbacks.connect('xlim_changed', self._on_xlim_changed)
+        self.fig.canvas.mpl_connect('resize_event', self._on_resize)
+        self.redraw()
+        return self.fig
+
+    def show(self, block: bool = True):
+        import matplotlib.pyplot as plt
+
+        if self.fig is None:
+            self.open_window()
+        plt.show(block=block)
+
+    def redraw(self) -> None:
+        """
+        Re-aggregates the candles of the visible range to the current pixel width of the axes
+        """
+        if self.fig is None or not len(self.x):
+            return
+        left, right = self.ax.get_xlim()
+        start = max(int(np.searchsorted(self.x, left, side='left')) - 1, 0)
+        stop = min(int(np.searchsorted(self.x, right, side='right')) + 1, len(self.x))
+        width = max(int(self.ax.bbox.width), 1)
+        if self.visible == (start, stop, width) or stop <= start:
+            return
+        self.visible = (start, stop, width)
+
+        if self.mode == 'candles':
+            low, high = self._draw_candles(start, stop, max(width // self.PIXELS_PER_CANDLE, 1))
+        else:
+            low, high = self._draw_line(start, stop, max(width // self.PIXELS_PER_POINT, 3))
+        self._draw_trades(left, right)
+        margin = max(high - low, high * 0.001) * 0.05
+        self.ax.set_ylim(low - margin, high + margin)
+
+    def _draw_candles(self, start: int, stop: int, buckets: int) -> tuple[float, float]:
+        candles = self.frame.aggregate(buckets, start, stop)
+        x = self.x[self.frame.bucket_starts(buckets, start, stop)]
+        half = (np.median(np.diff(x)) if len(x) > 1 else 1 / 1440) * 0.4
+        count = len(candles)
+        self.wicks.set_segments(np.stack([np.column_stack([x, candles.low]),
+                                          np.column_stack([x, candles.high])], axis=1))
+        verts = np.empty((count, 4, 2))
+        verts[:, 0, 0] = verts[:, 3, 0] = x - half
+        verts[:, 1, 0] = verts[:, 2, 0] = x + half
+        verts[:, 0, 1] = verts[:, 1, 1] = candles.open
+        verts[:, 2, 1] = verts[:, 3, 1] = candles.close
+        self.bodies.set_verts(verts)
+        self.bodies.set_facecolors(np.where((candles.close >= candles.open)[:, None],
+                                            (0.0, 0.5, 0.0, 1.0), (1.0, 0.0, 0.0, 1.0)))
+        return float(candles.low.min()), float(candles.high.max())
+
+    def _draw_line(self, start: int, stop: int, points: int) -> tuple[float, float]:
+        x = self.x[start:stop]
+        y = self.frame.close[start:stop]
+        indices = lttb(x, y, points)
+        self.line.set_data(x[indices], y[indices])
+        return float(self.frame.low[start:stop].min()), float(self.frame.high[start:stop].max())
+
+    def _draw_trades(self, left: float, right: float) -> None:
+        first, last = np.searchsorted(self.trade_x, [left, right])
+        x, prices, buys = self.trade_x[first:last], self.trade_prices[first:last], self.trade_buys[first:last]
+        self.buy_marks.set_offsets(np.column_stack([x[buys], prices[buys]]))
+        self.sell_marks.set_offsets(np.column_stack([x[~buys], prices[~buys]]))
+
+    def _on_xlim_changed(self, ax):
+        self.redraw()
+
+    def _on_resize(self, event):
+        self.redraw()
+        self.fig.canvas.draw_idle()
+
 
-        import matplotlib.patches as mpatches
-
-        times = [c[0] for c in self.candles]
-        opens = [c[1] for c in self.candles]
-        highs = [c[2] for c in self.candles]
-        lows = [c[3] for c in self.candles]
-        closes = [c[4] for c in self.candles]
-
-        width = 0.0005  # ширина свечи (в днях, для matplotlib)
-        for i, (t, o, h, l, c) in enumerate(self.candles):
-            color = 'green' if c >= o else 'red'
-            # Тень (high-low)
-            self.ax.plot([t, t], [l, h], color='black', linewidth=1, zorder=1)
-            # Тело свечи
-            rect = mpatches.Rectangle(
-                (mdates.date2num(t) - width/2, min(o, c)),
-                width,
-                abs(c - o),
-                facecolor=color,
-                edgecolor='black',
-                zorder=2
-            )
-            self.ax.add_patch(rect)
-
-        if times:
-            minx = min(times)
-            buys = [buy for buy in self.buys if buy >= minx]
-            sells = [sell for sell in self.sells if sell >= minx]
-
-            self.ax.set_title(self.ticker)
-            self.ax.set_xlabel('Время (МСК)')
-            self.ax.set_ylabel(f'Цена ({self.currency})')
-            self.ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
-
-            if lows and highs:
-                self.ax.vlines(buys, ymin=min(lows), ymax=max(highs), color='g', linestyle='dashed')
-                self.ax.vlines(sells, ymin=min(lows), ymax=max(highs), color='r', linestyle='dashed')
-            self.fig.autofmt_xdate()
-        plt.draw()
-        plt.pause(0.2)
+def render_loop(messages: multiprocessing.Queue, ticker, currency, window: datetime.timedelta, fps: float):
+    """
+    Renderer process: applies all queued messages, then draws a frame if an update was requested
+    and the previous frame is older than 1 / fps
+    """
+    chart = CandleChart(ticker, currency, window)
+    chart.open_window()
+    frame_interval = 1.0 / fps
+    last_frame = 0.0
+    dirty = False
+    while True:
+        timeout = max(0.0, last_frame + frame_interval - time.monotonic()) if dirty else frame_interval
+        batch = []
+        try:
+            batch.append(messages.get(timeout=timeout))
+            while True:
+                batch.append(messages.get_nowait())
+        except queue.Empty:
+            pass
+        for message in batch:
+            if message is None:
+                return
+            kind = message[0]
+            if kind == CANDLE:
+                chart.add_candle(*message[1:])
+            elif kind == BUY:
+                chart.buys.append(message[1])
+            elif kind == SELL:
+                chart.sells.append(message[1])
+            else:
+                dirty = True
+        if dirty and time.monotonic() - last_frame >= frame_interval:
+            chart.render()
+            last_frame = time.monotonic()
+            dirty = False
+        else:
+            # окно должно реагировать на действия пользователя и без новых данных
+            chart.process_events()
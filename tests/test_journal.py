@@ -0,0 +1,69 @@
+import logging
+import pickle
+
+from tinkoff.invest import Instrument, MoneyValue, OrderDirection, OrderExecutionReportStatus, OrderStage, OrderState
+
+from robotlib.journal import TradeJournal, order_from_record, order_to_record
+from robotlib.stats import TradeStatisticsAnalyzer
+
+FILL = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_FILL
+
+
+def buy(order_id: str) -> OrderState:
+    return OrderState(order_id=order_id, direction=OrderDirection.ORDER_DIRECTION_BUY, execution_report_status=FILL,
+                      lots_requested=1, lots_executed=1, figi='figi', currency='rub',
+                      total_order_amount=MoneyValue(currency='rub', units=100, nano=0),
+                      executed_commission=MoneyValue(currency='rub', units=0, nano=50000000), stages=[])
+
+
+def restored(path: str) -> tuple[TradeStatisticsAnalyzer, TradeJournal]:
+    analyzer = TradeStatisticsAnalyzer(positions=0, money=0.0, instrument_info=Instrument(lot=1),
+                                       logger=logging.getLogger('test'))
+    journal = TradeJournal(path, fsync_interval=0.0)
+    journal.restore(analyzer)
+    analyzer.attach_journal(journal)
+    return analyzer, journal
+
+
+def test_restart_after_torn_tail(tmp_path):
+    path = str(tmp_path / 'robot')
+    analyzer, journal = restored(path)
+    for number in range(3):
+        analyzer.add_trade(buy(str(number)))
+    journal.close()
+    with open(f'{path}.journal', 'ab') as file:
+        file.write(b'\x40\x00\x00\x00torn')
+
+    analyzer, journal = restored(path)
+    assert analyzer.positions == 3
+    for number in range(3, 6):
+        analyzer.add_trade(buy(str(number)))
+    journal.close()
+
+    analyzer, journal = restored(path)
+    journal.close()
+    assert analyzer.positions == 6
+    assert sorted(analyzer.trades) == [str(number) for number in range(6)]
+
+
+def test_record_keeps_prices_and_stages():
+    trade = buy('1')
+    trade.initial_order_price = MoneyValue(currency='rub', units=101, nano=0)
+    trade.executed_order_price = MoneyValue(currency='rub', units=100, nano=0)
+    trade.initial_commission = MoneyValue(currency='rub', units=0, nano=60000000)
+    trade.initial_security_price = MoneyValue(currency='rub', units=101, nano=0)
+    trade.service_commission = MoneyValue(currency='rub', units=0, nano=0)
+    trade.stages = [OrderStage(price=MoneyValue(currency='rub', units=100, nano=0), quantity=1, trade_id='t1')]
+    assert order_from_record(order_to_record(trade)) == trade
+
+    analyzer = TradeStatisticsAnalyzer(positions=0, money=0.0, instrument_info=Instrument(lot=1),
+                                       logger=logging.getLogger('test'))
+    analyzer.add_trade(trade)
+    assert pickle.loads(pickle.dumps(analyzer)).trades['1'] == trade
+
+
+def test_record_of_the_old_format():
+    trade = buy('1')
+    restored_trade = order_from_record(order_to_record(trade)[:12])
+    assert restored_trade.total_order_amount == trade.total_order_amount
+    assert restored_trade.initial_order_price is None and restored_trade.stages == []
@@ -0,0 +1,160 @@
+import logging
+import math
+import random
+from dataclasses import asdict
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from tinkoff.invest import Instrument, MoneyValue, OrderDirection, OrderExecutionReportStatus, OrderState
+
+from robotlib.stats import BalanceCalculator, BalanceProcessor, TradeStatisticsAnalyzer
+
+BUY = OrderDirection.ORDER_DIRECTION_BUY
+SELL = OrderDirection.ORDER_DIRECTION_SELL
+FILL = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_FILL
+REJECTED = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_REJECTED
+CANCELLED = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_CANCELLED
+NEW = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_NEW
+PARTIALLYFILL = OrderExecutionReportStatus.EXECUTION_REPORT_STATUS_PARTIALLYFILL
+
+COMPARED_COLUMNS = ['sign', 'balance', 'instrument_balance', 'lots_executed']
+
+
+def legacy_report(analyzer: TradeStatisticsAnalyzer) -> tuple[dict, pd.DataFrame]:
+    """
+    The report as it was built before build_frame: asdict rows, per-cell decoding and a row loop over commissions.
+    Money fields are decoded the same way for all of them, a missing value (the old code failed on it) is NaN.
+    """
+    df = pd.DataFrame(map(asdict, analyzer.trades.values()))  # pylint:disable=invalid-name
+    for name in TradeStatisticsAnalyzer.MONEY_FIELDS:
+        df[name] = df[name].apply(lambda x: math.nan if x is None else x['units'] + x['nano'] / (10 ** 9))
+    df['sign'] = 3 - df['direction'] * 2
+    df['balance'] = -(df['total_order_amount'] * df['sign']).cumsum()
+    df['instrument_balance'] = (df['lots_executed'] * df['sign']).cumsum()
+
+    last = len(df) - 1
+    total_commission = 0.0
+    for _, row in df.iterrows():
+        if int(row['execution_report_status']) == FILL:
+            total_commission += max(abs(row['total_order_amount']) * 0.0005, 0.01)
+    income = df['balance'][last] + df['instrument_balance'][last] * df['average_position_price'][last] \
+        - total_commission
+    return {
+        'final_balance': df['balance'][last],
+        'max_loss': -df['balance'].min(),
+        'final_instrument_balance': df['instrument_balance'][last],
+        'income': income,
+        'total_commission': total_commission,
+    }, df
+
+
+def money(value: float | None) -> MoneyValue | None:
+    if value is None:
+        return None
+    units = math.floor(value)
+    return MoneyValue(currency='rub', units=units, nano=round((value - units) * 10 ** 9))
+
+
+def order(order_id: str, direction: OrderDirection, status: OrderExecutionReportStatus, lots_requested: int,
+          lots_executed: int, price: float, average_price: float | None) -> OrderState:
+    return OrderState(order_id=order_id, direction=direction, execution_report_status=status,
+                      lots_requested=lots_requested, lots_executed=lots_executed,
+                      initial_order_price=money(price * lots_requested),
+                      executed_order_price=money(price if lots_executed else None),
+                      total_order_amount=money(price * lots_executed),
+                      average_position_price=money(average_price),
+                      executed_commission=money(price * lots_executed * 0.0005 if lots_executed else None))
+
+
+def analyzer_with(trades: list[OrderState]) -> TradeStatisticsAnalyzer:
+    analyzer = TradeStatisticsAnalyzer(positions=0, money=0.0, instrument_info=Instrument(lot=1),
+                                       logger=logging.getLogger('test'))
+    analyzer.load_state(0, 0.0, {trade.order_id: trade for trade in trades})
+    return analyzer
+
+
+def random_history(count: int, seed: int) -> list[OrderState]:
+    rnd = random.Random(seed)
+    trades = []
+    for number in range(count):
+        status = rnd.choice([FILL, FILL, FILL, PARTIALLYFILL, CANCELLED, REJECTED, NEW])
+        requested = rnd.randint(1, 10)
+        executed = {FILL: requested, NEW: 0, REJECTED: 0}.get(status, rnd.randint(0, requested))
+        price = rnd.randint(1, 500000) / 100
+        average = None if rnd.random() < 0.2 else rnd.randint(1, 500000) / 100
+        trades.append(order(str(number), rnd.choice([BUY, SELL]), status, requested, executed, price, average))
+    return trades
+
+
+HISTORIES = {
+    'fills': [
+        order('1', BUY, FILL, 3, 3, 101.25, 101.25),
+        order('2', BUY, FILL, 2, 2, 99.5, 100.55),
+        order('3', SELL, FILL, 5, 5, 103.01, 0.0),
+    ],
+    'partial and not filled': [
+        order('1', BUY, PARTIALLYFILL, 10, 4, 250.1, 250.1),
+        order('2', BUY, CANCELLED, 5, 2, 249.9, 250.04),
+        order('3', SELL, REJECTED, 3, 0, 251.0, None),
+        order('4', BUY, NEW, 1, 0, 248.0, None),
+        order('5', SELL, FILL, 6, 6, 252.37, 0.0),
+    ],
+    'no prices': [
+        order('1', BUY, NEW, 2, 0, 10.0, None),
+        order('2', BUY, FILL, 2, 2, 10.02, None),
+    ],
+    'random': random_history(500, seed=38),
+}
+
+
+@pytest.mark.parametrize('name', list(HISTORIES))
+def test_report_matches_legacy_implementation(name):
+    analyzer = analyzer_with(HISTORIES[name])
+    expected_summary, expected = legacy_report(analyzer)
+    summary, report = analyzer.get_report(processors=[BalanceProcessor()], calculators=[BalanceCalculator()])
+
+    assert summary.keys() == expected_summary.keys()
+    for key, value in expected_summary.items():
+        if isinstance(value, float) and math.isnan(value):
+            assert math.isnan(summary[key]), key
+        else:
+            assert summary[key] == value, key
+    assert list(report.columns) == list(expected.columns)
+    for column in COMPARED_COLUMNS + sorted(TradeStatisticsAnalyzer.MONEY_FIELDS):
+        np.testing.assert_array_equal(report[column].to_numpy(dtype=float), expected[column].to_numpy(dtype=float),
+                                      err_msg=column)
+
+
+def test_missing_money_is_nan():
+    analyzer = analyzer_with(HISTORIES['no prices'])
+    _, report = analyzer.get_report(processors=[BalanceProcessor()])
+    assert report['average_position_price'].isna().all()
+    assert report['total_order_amount'].tolist() == [0.0, 20.04]
+    assert report['executed_commission'].isna().tolist() == [True, False]
+
+
+def test_empty_report():
+    summary, report = analyzer_with([]).get_report(processors=[BalanceProcessor()], calculators=[BalanceCalculator()])
+    assert report.empty
+    assert summary['total_commission'] == 0.0
+
+
+def test_summary_after_eviction_covers_all_fills():
+    history = [order(str(number), BUY if number % 3 else SELL, FILL, 2, 2, 100.0 + number, None)
+               for number in range(1, 13)]
+    complete, evicting = [TradeStatisticsAnalyzer(positions=0, money=0.0, instrument_info=Instrument(lot=1),
+                                                  logger=logging.getLogger('test'), max_finished_trades=limit)
+                          for limit in (None, 3)]
+    for trade in history:
+        complete.add_trade(trade)
+        evicting.add_trade(trade)
+    assert len(evicting.trades) == 3
+
+    summary, report = evicting.get_report(processors=[BalanceProcessor()], calculators=[BalanceCalculator()])
+    assert len(report) == 3
+    assert summary['final_instrument_balance'] == complete.positions == 8
+    assert summary['final_balance'] == pytest.approx(complete.money)
+    assert summary['income'] == pytest.approx(complete.aggregates.net_pnl)
+    assert summary['total_commission'] == pytest.approx(complete.aggregates.commission)